@@ -0,0 +1,11 @@
+import os
+
+import django
+
+
+def pytest_configure():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'drone_buddy_api.settings')
+    django.setup()
+    # lets the test client through ALLOWED_HOSTS, like manage.py test does
+    from django.test.utils import setup_test_environment
+    setup_test_environment()
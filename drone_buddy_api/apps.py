@@ -0,0 +1,12 @@
+from django.apps import AppConfig
+
+
+class DroneBuddyApiConfig(AppConfig):
+    name = 'drone_buddy_api'
+    verbose_name = 'Drone Buddy API'
+
+    def ready(self):
+        from drone_buddy_api.utils.inference_workers import check_inference_workers_settings
+        from drone_buddy_api.utils.warmup import start_warmup
+        check_inference_workers_settings()
+        start_warmup()
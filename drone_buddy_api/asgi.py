@@ -9,8 +9,37 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
+from asgiref.sync import sync_to_async
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'drone_buddy_api.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# imported after Django is set up
+from drone_buddy_api.utils.atom_loading import LazyView, is_atom_enabled  # noqa: E402
+
+# WebSocket stream sessions, everything else is served by Django. The endpoints are imported with their atom
+# on the first session
+websocket_routes = {}
+if is_atom_enabled('OBJECT_DETECTION'):
+    websocket_routes['/atoms/stream/object-detection/detect-objects/'] = LazyView(
+        'drone_buddy_api.views.object_detection.detect_objects_stream')
+if is_atom_enabled('HAND_FEATURE_EXTRACTION'):
+    websocket_routes['/atoms/stream/feature-recognition/recognize-hand-gesture/'] = LazyView(
+        'drone_buddy_api.views.hand_feature_extraction.recognize_hand_gesture_stream')
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'websocket':
+        endpoint = websocket_routes.get(scope['path'])
+        if endpoint is None:
+            # rejecting the handshake answers it with 403
+            await receive()
+            await send({'type': 'websocket.close', 'code': 1000})
+            return
+        if not endpoint.is_loaded:
+            # importing the atom takes a while, keep the event loop serving other connections meanwhile
+            await sync_to_async(endpoint.load, thread_sensitive=False)()
+        return await endpoint(scope, receive, send)
+    return await django_application(scope, receive, send)
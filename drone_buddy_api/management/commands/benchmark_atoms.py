@@ -0,0 +1,348 @@
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.test.client import encode_multipart
+
+from drone_buddy_api.utils.benchmark import STUB_ALGORITHM, PeakMemorySampler, compare_to_baseline, \
+    get_benchmark_settings, read_baseline, summarize, synthetic_image, write_baseline
+from drone_buddy_api.utils.intent_recognition import MOCK_ALGORITHM
+from drone_buddy_api.utils.text_recognition import LOCAL_ALGORITHM
+
+BOUNDARY = 'DroneBuddyBenchmarkBoundary'
+MULTIPART_CONTENT_TYPE = 'multipart/form-data; boundary=' + BOUNDARY
+
+# scenario name: (route, async route or None, request fields of the n-th request)
+SCENARIOS = {
+    'detect_objects': ('atoms/object-detection/detect-objects/', 'atoms/async/object-detection/detect-objects/',
+                       lambda index, image: {'image': image, 'engine_configurations': '{}'}),
+    'recognize_face': ('atoms/face-recognition/recognize-face/', 'atoms/async/face-recognition/recognize-face/',
+                       lambda index, image: {'image': image, 'engine_configurations': '{}'}),
+    'recognize_hand_gesture': ('atoms/feature-recognition/recognize-hand-gesture/',
+                               'atoms/async/feature-recognition/recognize-hand-gesture/',
+                               lambda index, image: {'image': image, 'engine_configurations': '{}'}),
+    'recognize_intent': ('atoms/intent-recognition/recognize-intent/',
+                         'atoms/async/intent-recognition/recognize-intent/',
+                         lambda index, image: {'text': 'move forward ' + str(index) + ' meters',
+                                               'engine_configurations': '{}'}),
+    'recognize_text': ('atoms/text-recognition/recognize-text/', 'atoms/async/text-recognition/recognize-text/',
+                       lambda index, image: {'image': image, 'engine_configurations': '{}'}),
+    'generate_voice': ('atoms/voice-generation/generate-voice/', None,
+                       lambda index, image: {'text': 'Battery at ' + str(index) + ' percent'}),
+}
+
+# algorithm of every scenario when running on the offline stand-ins or on the real engines
+ALGORITHMS = {
+    'stub': {'detect_objects': STUB_ALGORITHM, 'recognize_face': STUB_ALGORITHM,
+             'recognize_intent': MOCK_ALGORITHM, 'recognize_text': LOCAL_ALGORITHM},
+    'real': {'detect_objects': 'YOLO', 'recognize_face': 'FACE_RECC', 'recognize_intent': 'CHAT_GPT',
+             'recognize_text': 'GOOGLE_VISION'},
+}
+
+
+def build_bodies(scenario: str, count: int, variants: int, width: int, height: int, engine_configurations) -> list:
+    """
+    Encodes the multipart bodies of ``count`` requests up front, so that building them is not measured.
+    Requests repeat after ``variants`` distinct bodies (0: every request is distinct, nothing is answered
+    from the caches).
+    """
+    build_fields = SCENARIOS[scenario][2]
+    distinct = [None] * (variants or count)
+    bodies = []
+    for index in range(count):
+        variant = index % len(distinct)
+        if distinct[variant] is None:
+            image = SimpleUploadedFile('frame.jpg', synthetic_image(width, height, variant), 'image/jpeg')
+            fields = build_fields(variant, image)
+            if engine_configurations is not None and 'engine_configurations' in fields:
+                fields['engine_configurations'] = json.dumps(engine_configurations)
+            distinct[variant] = encode_multipart(BOUNDARY, fields)
+        bodies.append(distinct[variant])
+    return bodies
+
+
+def run_in_process(path: str, bodies: list, concurrency: int) -> tuple:
+    """
+    Posts the bodies through the whole Django stack (middleware included) from ``concurrency`` threads, each
+    sending its next request once the previous one is answered. Returns the latencies of the successful
+    requests, the failed responses and the elapsed time.
+    """
+    requests = iter(range(len(bodies)))
+    requests_lock = threading.Lock()
+    latencies, failures = [], []
+
+    def send():
+        client = Client()
+        while True:
+            with requests_lock:
+                index = next(requests, None)
+            if index is None:
+                return
+            started = time.perf_counter()
+            response = client.post(path, data=bodies[index], content_type=MULTIPART_CONTENT_TYPE)
+            content = b''.join(response.streaming_content) if response.streaming else response.content
+            response.close()
+            latency = time.perf_counter() - started
+            if response.status_code < 400:
+                latencies.append(latency)
+            else:
+                failures.append((response.status_code, content[:200]))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='benchmark') as executor:
+        for future in [executor.submit(send) for _ in range(concurrency)]:
+            future.result()
+    return latencies, failures, time.perf_counter() - started
+
+
+class HttpConnection:
+    """
+    Minimal HTTP/1.1 keep-alive client on asyncio streams, enough to load a server from a single thread
+    without a client library.
+    """
+
+    def __init__(self, url: str):
+        parsed = urllib.parse.urlsplit(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+        self.ssl = parsed.scheme == 'https'
+        self.reader = None
+        self.writer = None
+
+    async def request(self, method: str, path: str, body: bytes = b'', content_type: str = None) -> tuple:
+        """
+        Returns the status and the body of the response.
+        """
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port, ssl=self.ssl or None)
+        head = [method + ' ' + path + ' HTTP/1.1', 'Host: ' + self.host + ':' + str(self.port),
+                'Content-Length: ' + str(len(body))]
+        if content_type is not None:
+            head.append('Content-Type: ' + content_type)
+        try:
+            self.writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+            await self.writer.drain()
+            status, keep_alive, content = await self._read_response()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            self.close()
+            raise
+        if not keep_alive:
+            self.close()
+        return status, content
+
+    async def _read_response(self) -> tuple:
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while True:
+            line = (await self.reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = headers.get('connection', '').lower() != 'close'
+        if 'content-length' in headers:
+            return status, keep_alive, await self.reader.readexactly(int(headers['content-length']))
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if not size:
+                    return status, keep_alive, b''.join(chunks)
+                chunks.append(chunk[:-2])
+        return status, False, await self.reader.read()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader, self.writer = None, None
+
+
+async def run_over_http(url: str, path: str, bodies: list, concurrency: int) -> tuple:
+    """
+    Posts the bodies to a running server from ``concurrency`` keep-alive connections, each sending its next
+    request once the previous one is answered. Returns the latencies of the successful requests, the failed
+    responses and the elapsed time.
+    """
+    requests = iter(range(len(bodies)))
+    latencies, failures = [], []
+
+    async def send():
+        connection = HttpConnection(url)
+        try:
+            for index in requests:
+                started = time.perf_counter()
+                try:
+                    status, content = await connection.request('POST', path, bodies[index], MULTIPART_CONTENT_TYPE)
+                except (OSError, asyncio.IncompleteReadError) as e:
+                    failures.append((None, str(e).encode('utf-8')))
+                    continue
+                latency = time.perf_counter() - started
+                if status < 400:
+                    latencies.append(latency)
+                else:
+                    failures.append((status, content[:200]))
+        finally:
+            connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*[send() for _ in range(concurrency)])
+    return latencies, failures, time.perf_counter() - started
+
+
+async def read_server_peak_memory(url: str, path: str) -> int:
+    """
+    Reads the peak RSS of the worker that answers the scrape from its /metrics, 0 if it is not exposed.
+    """
+    connection = HttpConnection(url)
+    try:
+        status, content = await connection.request('GET', path)
+    except OSError:
+        return 0
+    finally:
+        connection.close()
+    for line in content.decode('utf-8', 'replace').splitlines():
+        if line.startswith('drone_buddy_process_peak_resident_memory_bytes '):
+            return int(float(line.split()[1]))
+    return 0
+
+
+class Command(BaseCommand):
+    help = ('Load tests the atom endpoints with synthetic requests, in process or against a running server, '
+            'reports latency percentiles, throughput and peak RSS, and compares them to a stored baseline')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario')
+        parser.add_argument('--warmup', type=int, default=5, help='Unmeasured requests before each scenario')
+        parser.add_argument('--concurrency', type=int, default=4, help='Requests in flight at a time')
+        parser.add_argument('--variants', type=int, default=0,
+                            help='Distinct requests per scenario, repeated in turn (default: all distinct)')
+        parser.add_argument('--width', type=int, default=640)
+        parser.add_argument('--height', type=int, default=480)
+        parser.add_argument('--url', help='Base URL of a running server, e.g. http://127.0.0.1:8000; requests go '
+                                          'through the Django stack in this process when omitted')
+        parser.add_argument('--async-routes', action='store_true', help='Use the atoms/async/ routes')
+        parser.add_argument('--engines', choices=list(ALGORITHMS), default='stub',
+                            help='stub runs the cloud and model backed atoms on the offline stand-ins')
+        parser.add_argument('--algorithm', action='append', default=[], metavar='SCENARIO=NAME',
+                            help='Overrides the algorithm of a scenario')
+        parser.add_argument('--engine-configurations', help='JSON file mapping scenarios to engine configurations')
+        parser.add_argument('--save-baseline', nargs='?', const='', metavar='PATH',
+                            help='Stores the results as the baseline, defaults to BENCHMARK BASELINE_PATH')
+        parser.add_argument('--compare', nargs='?', const='', metavar='PATH',
+                            help='Fails on a regression against the baseline, defaults to BENCHMARK BASELINE_PATH')
+        parser.add_argument('--tolerance', type=float, default=None,
+                            help='Relative slack before a regression, defaults to BENCHMARK TOLERANCE')
+
+    def handle(self, *args, **options):
+        benchmark_settings = get_benchmark_settings()
+        algorithms = dict(ALGORITHMS[options['engines']])
+        for override in options['algorithm']:
+            scenario, _, algorithm_name = override.partition('=')
+            if scenario not in SCENARIOS or not algorithm_name:
+                raise CommandError('Expected SCENARIO=NAME with a scenario of ' + ', '.join(SCENARIOS))
+            algorithms[scenario] = algorithm_name
+        engine_configurations = {}
+        if options['engine_configurations']:
+            with open(options['engine_configurations'], 'r') as configurations_file:
+                engine_configurations = json.load(configurations_file)
+
+        report = {
+            'mode': 'http' if options['url'] else 'in-process',
+            'engines': options['engines'],
+            'async_routes': options['async_routes'],
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'image_size': [options['width'], options['height']],
+            'python': sys.version.split()[0],
+            'scenarios': {},
+        }
+
+        self.stdout.write('{:<24} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9} {:>9}'.format(
+            'scenario', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'peak MB'))
+        with self.benchmark_environment(options):
+            for scenario in options['scenarios']:
+                route, async_route, _ = SCENARIOS[scenario]
+                if options['async_routes'] and async_route is not None:
+                    route = async_route
+                path = '/' + route
+                if scenario in algorithms:
+                    path += '?' + urllib.parse.urlencode({'algorithm_name': algorithms[scenario]})
+                bodies = build_bodies(scenario, options['warmup'] + options['requests'], options['variants'],
+                                      options['width'], options['height'], engine_configurations.get(scenario))
+                result = self.run_scenario(options, path, bodies[:options['warmup']], bodies[options['warmup']:])
+                report['scenarios'][scenario] = result
+                self.stdout.write('{:<24} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9} {:>9}'.format(
+                    scenario, result['requests'], result['errors'], *[
+                        '-' if result[key] is None else format(result[key], '.1f')
+                        for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'peak_rss_mb')]))
+
+        baseline_path = benchmark_settings['BASELINE_PATH']
+        if options['save_baseline'] is not None:
+            path = options['save_baseline'] or baseline_path
+            if not path:
+                raise CommandError('No baseline path given and BENCHMARK BASELINE_PATH is not set.')
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            write_baseline(path, report)
+            self.stdout.write('Baseline written to ' + str(path))
+
+        if options['compare'] is not None:
+            path = options['compare'] or baseline_path
+            if not path or not os.path.exists(path):
+                raise CommandError('No baseline at ' + str(path) + ', store one with --save-baseline first.')
+            baseline = read_baseline(path)
+            for key in ('mode', 'engines', 'async_routes', 'concurrency', 'image_size'):
+                if baseline.get(key) != report[key]:
+                    self.stderr.write('The baseline was measured with ' + key + ' = ' + str(baseline.get(key)) +
+                                      ', this run with ' + str(report[key]))
+            tolerance = options['tolerance'] if options['tolerance'] is not None else benchmark_settings['TOLERANCE']
+            regressions = compare_to_baseline(report, baseline, tolerance)
+            if regressions:
+                raise CommandError('Regressions against ' + str(path) + ' :\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('No regressions against ' + str(path)))
+
+    @contextmanager
+    def benchmark_environment(self, options):
+        """
+        Settings for the in process runs: the test client's host is allowed and, on the stand-ins, speech is
+        rendered by the silent TTS engine into a throwaway audio cache.
+        """
+        if options['url']:
+            yield
+            return
+        with tempfile.TemporaryDirectory(prefix='benchmark-voice-') as voice_cache_dir:
+            overrides = {'ALLOWED_HOSTS': list(settings.ALLOWED_HOSTS) + ['testserver']}
+            if options['engines'] == 'stub':
+                overrides['VOICE_GENERATION'] = {**getattr(settings, 'VOICE_GENERATION', {}),
+                                                 'ENGINE': STUB_ALGORITHM, 'CACHE_DIR': voice_cache_dir}
+            with override_settings(**overrides):
+                yield
+
+    def run_scenario(self, options, path: str, warmup_bodies: list, bodies: list) -> dict:
+        if options['url']:
+            url = options['url'].rstrip('/')
+            prefix = urllib.parse.urlsplit(url).path
+            asyncio.run(run_over_http(url, prefix + path, warmup_bodies, options['concurrency']))
+            latencies, failures, elapsed = asyncio.run(run_over_http(url, prefix + path, bodies,
+                                                                     options['concurrency']))
+            peak_rss_bytes = asyncio.run(read_server_peak_memory(url, prefix + '/metrics'))
+        else:
+            run_in_process(path, warmup_bodies, options['concurrency'])
+            with PeakMemorySampler() as sampler:
+                latencies, failures, elapsed = run_in_process(path, bodies, options['concurrency'])
+            peak_rss_bytes = sampler.peak_bytes
+        for status, content in failures[:3]:
+            self.stderr.write(path + ' : ' + str(status) + ' : ' + content.decode('utf-8', 'replace'))
+        return summarize(latencies, len(failures), elapsed, peak_rss_bytes)
@@ -0,0 +1,114 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from drone_buddy_api.utils.renderers import ORJSONRenderer, MessagePackRenderer
+
+
+def build_object_detection_result(objects: int):
+    from dronebuddylib.atoms.objectdetection.detected_object import BoundingBox, DetectedObject, \
+        ObjectDetectionResult
+
+    detected_objects = []
+    for index in range(objects):
+        detected_object = DetectedObject([], BoundingBox(10.5 * index, 20.25 * index, 64.0, 48.0))
+        detected_object.add_category('person', 0.5 + index / (2.0 * objects))
+        detected_objects.append(detected_object)
+    return ObjectDetectionResult(['person'] * objects, detected_objects)
+
+
+def build_gesture_result(hands: int):
+    from mediapipe.tasks.python.components.containers import category, landmark
+    from mediapipe.tasks.python.vision import GestureRecognizerResult
+
+    def hand_landmarks(world: bool):
+        landmark_class = landmark.Landmark if world else landmark.NormalizedLandmark
+        return [landmark_class(x=index / 21.0, y=0.5, z=-0.01 * index, visibility=0.0, presence=0.0)
+                for index in range(21)]
+
+    return GestureRecognizerResult(
+        gestures=[[category.Category(index=-1, score=0.9, display_name='', category_name='Open_Palm')]] * hands,
+        handedness=[[category.Category(index=0, score=0.98, display_name='Right', category_name='Right')]] * hands,
+        hand_landmarks=[hand_landmarks(False) for _ in range(hands)],
+        hand_world_landmarks=[hand_landmarks(True) for _ in range(hands)])
+
+
+def build_text_recognition_result(words: int):
+    from dronebuddylib.atoms.textrecognition.text_recognition_result import BoundingPoly, \
+        TextRecognitionFullInformation, TextRecognitionResult, Vertices
+
+    full_information = [
+        TextRecognitionFullInformation('en', 'word' + str(index), BoundingPoly(
+            [Vertices(10 * index, 5), Vertices(10 * index + 8, 5), Vertices(10 * index + 8, 15),
+             Vertices(10 * index, 15)]))
+        for index in range(words)]
+    return TextRecognitionResult(' '.join(item.description for item in full_information), 'en', full_information)
+
+
+def build_intent_result():
+    from dronebuddylib.atoms.intentrecognition.recognized_intent_result import RecognizedEntities, \
+        RecognizedIntent
+
+    return RecognizedIntent('TAKE_OFF', [RecognizedEntities('distance', '2 meters')], 0.93, True)
+
+
+def get_atom_responses(objects: int, hands: int, words: int) -> list:
+    """
+    Returns (atom, function building the JSON response data, function building the packed response data or
+    None) for representative results of every atom, built with the same conversions the views use.
+    """
+    from drone_buddy_api.views.hand_feature_extraction import convert_to_serializable, convert_to_packed
+    from drone_buddy_api.views.object_detection import convert_object_detection_result_to_packed
+    from drone_buddy_api.views.text_recognition import convert_text_recognition_result_to_serializable, \
+        convert_text_recognition_result_to_packed
+
+    detected_objects = build_object_detection_result(objects)
+    gesture_result = build_gesture_result(hands)
+    text_result = build_text_recognition_result(words)
+    intent_result = build_intent_result()
+
+    def response(result):
+        return {'message': 'Detection started using YOLO', 'result': result}
+
+    return [
+        ('OBJECT_DETECTION', lambda: response(detected_objects.to_json()),
+         lambda: response(convert_object_detection_result_to_packed(detected_objects))),
+        ('FACE_RECOGNITION', lambda: response(['Alice', 'Unknown', 'Bob']), None),
+        ('HAND_FEATURE_EXTRACTION', lambda: response(convert_to_serializable(gesture_result)),
+         lambda: response(convert_to_packed(gesture_result))),
+        ('INTENT_RECOGNITION', lambda: response(intent_result.to_json()), None),
+        ('TEXT_RECOGNITION', lambda: response(convert_text_recognition_result_to_serializable(text_result)),
+         lambda: response(convert_text_recognition_result_to_packed(text_result))),
+    ]
+
+
+class Command(BaseCommand):
+    help = ('Measures the size and the time to build and render a response of every atom with the stock JSON '
+            'renderer, the orjson renderer and MessagePack with packed arrays')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000)
+        parser.add_argument('--objects', type=int, default=20, help='Detected objects per frame')
+        parser.add_argument('--hands', type=int, default=2, help='Hands per frame')
+        parser.add_argument('--words', type=int, default=50, help='Recognized words per image')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        renderers = [
+            ('json', JSONRenderer(), False),
+            ('orjson', ORJSONRenderer(), False),
+            ('msgpack', MessagePackRenderer(), True),
+        ]
+        self.stdout.write('{:<24} {:<8} {:>10} {:>12} {:>12}'.format('atom', 'renderer', 'bytes', 'build us',
+                                                                     'render us'))
+        for atom, build_json, build_packed in get_atom_responses(options['objects'], options['hands'],
+                                                                 options['words']):
+            for name, renderer, packed in renderers:
+                build = build_packed if packed and build_packed is not None else build_json
+                data = build()
+                size = len(renderer.render(data))
+                build_us = timeit.timeit(build, number=iterations) / iterations * 1e6
+                render_us = timeit.timeit(lambda: renderer.render(data), number=iterations) / iterations * 1e6
+                self.stdout.write('{:<24} {:<8} {:>10} {:>12.1f} {:>12.1f}'.format(atom, name, size, build_us,
+                                                                                   render_us))
@@ -0,0 +1,37 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from drone_buddy_api.utils.face_enrollment import enroll_faces, scan_directory, read_manifest
+from drone_buddy_api.utils.result_cache import invalidate_atom_results
+from drone_buddy_api.views.enum import AtomType
+
+
+class Command(BaseCommand):
+    help = ('Enrolls the faces of a directory or manifest of (person, image path) pairs into the known faces and '
+            'the face index')
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='Directory with one folder of images per person (or images named '
+                                           'after the person), or a json / csv manifest')
+        parser.add_argument('--processes', type=int, default=None,
+                            help='Number of encoding processes, defaults to FACE_INDEX ENROLLMENT_PROCESSES')
+
+    def handle(self, *args, **options):
+        source = Path(options['source'])
+        if source.is_dir():
+            entries = scan_directory(source)
+        elif source.is_file():
+            entries = read_manifest(source)
+        else:
+            raise CommandError('No such directory or manifest : ' + str(source))
+
+        report = enroll_faces(entries, processes=options['processes'])
+        if report['enrolled']:
+            invalidate_atom_results(AtomType.FACE_RECOGNITION)
+        for failure in report['failed']:
+            self.stderr.write(failure['reason'] + ' : ' + failure['person_name'] + ' : ' + failure['image_path'])
+        self.stdout.write(json.dumps({key: report[key] for key in ('enrolled', 'known_faces')}))
+        self.stdout.write(self.style.SUCCESS('Enrolled ' + str(report['enrolled']) + ' of ' + str(len(entries))
+                                             + ' images'))
@@ -0,0 +1,110 @@
+import os
+import re
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from drone_buddy_api.utils.atom_loading import ATOM_VIEW_MODULES, get_atoms_settings
+
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+# run in a fresh interpreter, prints the wall time of importing the startup modules and then the atom module
+MEASURE_SCRIPT = '''
+import sys, time
+started = time.perf_counter()
+import django
+django.setup()
+for module in sys.argv[1].split(','):
+    __import__(module)
+startup = time.perf_counter()
+if sys.argv[2]:
+    __import__(sys.argv[2])
+print(round((startup - started) * 1000.0, 1), round((time.perf_counter() - startup) * 1000.0, 1))
+'''
+
+
+def measure_imports(startup_modules: list, atom_module: str = '') -> tuple:
+    """
+    Imports the startup modules, then the atom module, in a fresh interpreter with -X importtime. Returns the
+    wall time of both in milliseconds and the (self us, cumulative us, depth, module) of every import.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', MEASURE_SCRIPT, ','.join(startup_modules), atom_module],
+        capture_output=True, text=True, cwd=str(settings.BASE_DIR),
+        env={**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE',
+                                                                    'drone_buddy_api.settings')})
+    if result.returncode != 0:
+        raise CommandError('Measuring the imports failed :\n' + result.stderr[-2000:])
+    startup_ms, atom_ms = (float(value) for value in result.stdout.split()[-2:])
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if match:
+            imports.append((int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2,
+                            match.group(4)))
+    return startup_ms, atom_ms, imports
+
+
+def self_time_per_package(imports: list) -> list:
+    """
+    Sums the self time of the imports per top level package, e.g. all of mediapipe, most expensive first.
+    """
+    packages = {}
+    for self_us, _, _, module in imports:
+        package = module.split('.')[0]
+        packages[package] = packages.get(package, 0) + self_us
+    return sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+
+class Command(BaseCommand):
+    help = ('Reports what importing the server costs at startup, per package and module, and what the first '
+            'request of every atom adds, and fails when startup is over ATOMS IMPORT_BUDGET_MS')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15, help='Packages and modules to list')
+        parser.add_argument('--budget-ms', type=float, default=None,
+                            help='Startup import budget, defaults to ATOMS IMPORT_BUDGET_MS')
+        parser.add_argument('--server', choices=['wsgi', 'asgi'], default='asgi',
+                            help='Entry point the worker imports at startup')
+        parser.add_argument('--atoms', action='store_true',
+                            help='Also measure the import of every atom on its first request')
+
+    def handle(self, *args, **options):
+        top = options['top']
+        application_module = 'drone_buddy_api.asgi' if options['server'] == 'asgi' \
+            else settings.WSGI_APPLICATION.rpartition('.')[0]
+        startup_modules = [application_module, settings.ROOT_URLCONF]
+        startup_ms, _, imports = measure_imports(startup_modules)
+
+        self.stdout.write('Startup imports of ' + ', '.join(startup_modules) + ' : ' + format(startup_ms, '.1f')
+                          + ' ms, ' + str(len(imports)) + ' modules')
+        self.stdout.write('\n{:<40} {:>12}'.format('package', 'self ms'))
+        for package, self_us in self_time_per_package(imports)[:top]:
+            self.stdout.write('{:<40} {:>12.1f}'.format(package, self_us / 1000.0))
+        self.stdout.write('\n{:<60} {:>12} {:>12}'.format('module', 'self ms', 'cumul. ms'))
+        for self_us, cumulative_us, _, module in sorted(imports, key=lambda item: item[0], reverse=True)[:top]:
+            self.stdout.write('{:<60} {:>12.1f} {:>12.1f}'.format(module, self_us / 1000.0,
+                                                                  cumulative_us / 1000.0))
+
+        if options['atoms']:
+            self.stdout.write('\n{:<28} {:>14}  {}'.format('atom', 'first use ms', 'heaviest packages'))
+            for atom, module in ATOM_VIEW_MODULES.items():
+                _, atom_ms, atom_imports = measure_imports(startup_modules, module)
+                # only what the atom adds on top of startup
+                loaded_at_startup = {name for _, _, _, name in imports}
+                added = [item for item in atom_imports if item[3] not in loaded_at_startup]
+                heaviest = ', '.join(package + ' ' + format(self_us / 1000.0, '.0f')
+                                     for package, self_us in self_time_per_package(added)[:4])
+                self.stdout.write('{:<28} {:>14.1f}  {}'.format(atom, atom_ms, heaviest))
+
+        budget_ms = options['budget_ms'] if options['budget_ms'] is not None \
+            else get_atoms_settings()['IMPORT_BUDGET_MS']
+        if budget_ms is None:
+            return
+        if startup_ms > budget_ms:
+            raise CommandError('Startup imports take ' + format(startup_ms, '.1f') + ' ms, over the budget of '
+                               + format(budget_ms, '.1f') + ' ms')
+        self.stdout.write(self.style.SUCCESS('Startup imports within the budget of ' + format(budget_ms, '.1f')
+                                             + ' ms'))
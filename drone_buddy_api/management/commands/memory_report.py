@@ -0,0 +1,76 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from drone_buddy_api.utils.process_memory import find_child_pids, read_command_line, read_memory_per_mapping, \
+    read_memory_usage
+
+MB = 1024.0 * 1024.0
+
+
+def is_gunicorn_process(command: str) -> bool:
+    # gunicorn itself, not a shell or wrapper that has it in its arguments
+    return any(os.path.basename(argument).startswith('gunicorn') for argument in command.split()[:2])
+
+
+def find_gunicorn_master() -> int:
+    """
+    Returns the pid of the only running gunicorn master, the gunicorn process that is not a child of another.
+    """
+    gunicorn_pids = [int(entry) for entry in os.listdir('/proc')
+                     if entry.isdigit() and is_gunicorn_process(read_command_line(entry))]
+    workers = {child for pid in gunicorn_pids for child in find_child_pids(pid)}
+    masters = [pid for pid in gunicorn_pids if pid not in workers]
+    if len(masters) != 1:
+        raise CommandError('Found ' + str(len(masters)) + ' gunicorn masters, pass the pid of the master')
+    return masters[0]
+
+
+class Command(BaseCommand):
+    help = ('Reports the shared and private memory of a gunicorn master and its workers, or of the given '
+            'processes, from /proc/<pid>/smaps')
+
+    def add_arguments(self, parser):
+        parser.add_argument('pids', nargs='*', type=int,
+                            help='Processes to report with their children, defaults to the gunicorn master')
+        parser.add_argument('--no-children', action='store_true', help='Only report the given processes')
+        parser.add_argument('--mappings', type=int, default=0,
+                            help='Also list the mapped files with the most private memory of every process')
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        pids = options['pids'] or [find_gunicorn_master()]
+        if not options['no_children']:
+            pids = pids + [child for pid in pids for child in find_child_pids(pid) if child not in pids]
+
+        processes = []
+        for pid in pids:
+            usage = read_memory_usage(pid)
+            if usage is None:
+                self.stderr.write('Cannot read the memory of process ' + str(pid))
+                continue
+            processes.append({'pid': pid, 'command': read_command_line(pid), **usage,
+                              'mappings': read_memory_per_mapping(pid)[:options['mappings']]})
+        if not processes:
+            raise CommandError('No process to report')
+        totals = {key: sum(process[key] for process in processes) for key in ('rss', 'pss', 'private')}
+
+        if options['json']:
+            self.stdout.write(json.dumps({'processes': processes, 'totals': totals}, indent=2))
+            return
+
+        self.stdout.write('{:>8} {:>10} {:>10} {:>10} {:>10} {:>8}  {}'.format(
+            'pid', 'rss MB', 'pss MB', 'shared MB', 'private MB', 'swap MB', 'command'))
+        for process in processes:
+            self.stdout.write('{:>8} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>8.1f}  {}'.format(
+                process['pid'], process['rss'] / MB, process['pss'] / MB, process['shared'] / MB,
+                process['private'] / MB, process['swap'] / MB, process['command'][:60]))
+            for path, usage in process['mappings']:
+                self.stdout.write('{:>8} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>8.1f}  {}'.format(
+                    '', usage['rss'] / MB, usage['pss'] / MB, usage['shared'] / MB, usage['private'] / MB,
+                    usage['swap'] / MB, path[-60:]))
+        # PSS adds up to what the processes use together, RSS counts every shared page once per process
+        self.stdout.write('\nTotal PSS ' + format(totals['pss'] / MB, '.1f') + ' MB (RSS summed over processes '
+                          + format(totals['rss'] / MB, '.1f') + ' MB, private ' + format(totals['private'] / MB, '.1f')
+                          + ' MB)')
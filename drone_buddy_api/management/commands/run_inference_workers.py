@@ -0,0 +1,63 @@
+import signal
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from drone_buddy_api.utils.inference_workers import InferenceServer, get_authkey, get_inference_workers_settings, \
+    get_socket_path
+from drone_buddy_api.views.enum import AtomType
+
+
+def parse_worker_counts(values: list) -> dict:
+    """
+    Parses ATOM=N arguments, e.g. OBJECT_DETECTION=2.
+    """
+    counts = {}
+    for value in values:
+        atom, _, count = value.partition('=')
+        try:
+            counts[AtomType(atom.strip().upper())] = int(count)
+        except ValueError:
+            raise CommandError('Expected ATOM=N with an atom of ' + ', '.join(atom.value for atom in AtomType)
+                               + ', got ' + value)
+    return counts
+
+
+class Command(BaseCommand):
+    help = ('Runs the inference worker processes that the atom views send their frames to when '
+            'INFERENCE_WORKERS ENABLED is set, listening on INFERENCE_WORKERS SOCKET_PATH')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', nargs='*', default=[], metavar='ATOM=N',
+                            help='Worker processes per atom, overrides INFERENCE_WORKERS WORKERS')
+        parser.add_argument('--socket', default=None, help='Unix socket path, defaults to INFERENCE_WORKERS '
+                                                           'SOCKET_PATH')
+
+    def handle(self, *args, **options):
+        inference_workers_settings = get_inference_workers_settings()
+        workers = {AtomType(atom): count for atom, count in inference_workers_settings['WORKERS'].items()}
+        workers.update(parse_worker_counts(options['workers']))
+        if not any(workers.values()):
+            raise CommandError('No atom has inference workers')
+        try:
+            authkey = get_authkey(inference_workers_settings)
+            address = options['socket'] or get_socket_path(inference_workers_settings)
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        server = InferenceServer(address, authkey, workers)
+        server.start()
+
+        def shutdown(signum, frame):
+            # unblocks serve_forever
+            server.stop()
+
+        signal.signal(signal.SIGTERM, shutdown)
+        signal.signal(signal.SIGINT, shutdown)
+        self.stdout.write('Serving inference workers on ' + address + ' : '
+                          + ', '.join(atom.value + '=' + str(count) for atom, count in server.workers.items()))
+        try:
+            server.serve_forever()
+        finally:
+            server.stop()
+        self.stdout.write(self.style.SUCCESS('Inference workers stopped'))
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,10 +42,13 @@ INSTALLED_APPS = [
     'drf_yasg',
     'corsheaders',
     'rest_framework',
+    'drone_buddy_api.apps.DroneBuddyApiConfig',
 
 ]
 
 MIDDLEWARE = [
+    'drone_buddy_api.utils.metrics.MetricsMiddleware',  # first, so that it times everything below it
+    'drone_buddy_api.utils.scheduler.SchedulingMiddleware',  # deadline and client id of the request
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -128,6 +132,289 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
-        'rest_framework.renderers.JSONRenderer',  # Only use JSONRenderer
+        'drone_buddy_api.utils.renderers.ORJSONRenderer',  # JSON stays the default
+        'drone_buddy_api.utils.renderers.MessagePackRenderer',  # Accept: application/x-msgpack
     )
-}
\ No newline at end of file
+}
+
+# Engine pool
+# Constructed engines are cached per (atom, algorithm, engine configurations) and shared between requests.
+# MAX_MEMORY_MB is compared to the resident memory each engine added while it was constructed, an estimate
+
+ENGINE_POOL = {
+    'MAX_ENGINES': 8,
+    'IDLE_TIMEOUT_SECONDS': 900,
+    'MAX_MEMORY_MB': 4096,
+    'MAX_CONCURRENCY_PER_ENGINE': 1,  # dronebuddylib engines are not thread safe
+    'ACQUIRE_TIMEOUT_SECONDS': 30,
+}
+
+# Warm-up
+# Engines listed here are created and run once on a blank input when the server process starts,
+# /health/ready only reports ready once all of them are warm
+
+WARMUP = {
+    'ENABLED': False,
+    'BACKGROUND': True,  # warm up on a separate thread so the server can answer liveness probes meanwhile
+    'IMAGE_SHAPE': (480, 640, 3),
+    'ENGINES': [
+        # {
+        #     'atom': 'OBJECT_DETECTION',
+        #     'algorithm_name': 'YOLO',
+        #     'engine_configurations': {'OBJECT_DETECTION_YOLO_VERSION': 'yolov8n.pt'},
+        # },
+        # {
+        #     'atom': 'INTENT_RECOGNITION',
+        #     'algorithm_name': 'SNIPS_NLU',
+        #     'engine_configurations': {},
+        #     'warmup_text': 'take off',  # intent / text atoms are only exercised when a sample input is given
+        # },
+    ],
+}
+
+# Object detection batching
+# When enabled, concurrent single frame requests for the same engine are coalesced into one batch,
+# a batch is run once it is full or MAX_WAIT_MS after its first frame arrived. One batcher is kept per engine, at
+# most MAX_BATCHERS, and its thread stops after IDLE_SECONDS without frames
+
+OBJECT_DETECTION_BATCHING = {
+    'ENABLED': False,
+    'MAX_BATCH_SIZE': 8,
+    'MAX_WAIT_MS': 10,
+    'MAX_BATCHERS': 16,
+    'IDLE_SECONDS': 60,
+    'RESULT_TIMEOUT_SECONDS': 30,
+}
+
+# Inference executors
+# The async atom views run on these bounded thread pools, vision and text / intent atoms use separate pools.
+# Requests beyond MAX_WORKERS + MAX_QUEUE_DEPTH are rejected with 503
+
+INFERENCE_EXECUTORS = {
+    'VISION': {'MAX_WORKERS': 4, 'MAX_QUEUE_DEPTH': 16},
+    'TEXT': {'MAX_WORKERS': 8, 'MAX_QUEUE_DEPTH': 32},
+}
+
+# Face index
+# Known face encodings are kept in a memory mapped float32 matrix shared by all workers, built from the
+# faces remembered by the face recognition engine on first use and appended to by remember-face
+
+FACE_INDEX = {
+    'ENABLED': True,
+    'PATH': BASE_DIR / 'face_index',
+    'TOLERANCE': 0.6,  # same default tolerance as face_recognition.compare_faces
+    'FRAME_SCALE': 0.25,  # frames are shrunk like the engine does, unless the request sets max_side
+    'ENROLLMENT_PROCESSES': None,  # worker processes for bulk enrollment, defaults to the number of CPUs
+}
+
+# Result cache
+# Identical atom calls (same endpoint, algorithm, engine configurations and image bytes or image path) are
+# answered from this cache, responses carry an X-Cache HIT / MISS header.
+# The LOCAL backend is an LRU cache of MAX_BYTES per process, so remembering a face only invalidates the
+# cache of the worker that handled it. Use the DJANGO backend with a cache shared by all workers instead, e.g.
+# CACHES = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+#                       'LOCATION': BASE_DIR / 'result_cache'}}
+
+RESULT_CACHE = {
+    'ENABLED': False,
+    'BACKEND': 'LOCAL',  # LOCAL or DJANGO
+    'CACHE_ALIAS': 'default',  # cache of settings.CACHES used by the DJANGO backend
+    'MAX_BYTES': 64 * 1024 * 1024,
+    'TTL_SECONDS': {
+        'OBJECT_DETECTION': 2,
+        'FACE_RECOGNITION': 30,
+        'HAND_FEATURE_EXTRACTION': 2,
+        'TEXT_RECOGNITION': 300,
+    },
+}
+
+# Object tracking
+# Tracking sessions (tracking_session field of detect-objects, or tracking in a stream session) run a full
+# detection every DETECT_INTERVAL frames or when the mean change of the frame exceeds SCENE_CHANGE_THRESHOLD,
+# and follow the boxes with optical flow in between. HTTP tracking sessions live in the memory of one worker
+
+OBJECT_TRACKING = {
+    'DETECT_INTERVAL': 5,
+    'SCENE_CHANGE_THRESHOLD': 0.12,  # mean absolute difference of grey thumbnails, 0 to 1
+    'IOU_THRESHOLD': 0.3,  # minimum overlap for a detection to continue a track
+    'MAX_MISSED_DETECTIONS': 2,  # detections a track may be missing from before its id is retired
+    'SESSION_IDLE_SECONDS': 60,
+    'MAX_SESSIONS': 1024,  # HTTP tracking sessions kept per worker, least recently used ones are dropped first
+}
+
+# Gesture tracking
+# Gesture stream sessions keep one VIDEO mode recognizer per session, average the landmarks of each hand
+# over SMOOTHING_WINDOW frames and report a new gesture once it was seen on STABLE_FRAMES frames in a row
+
+GESTURE_TRACKING = {
+    'SMOOTHING_WINDOW': 3,
+    'STABLE_FRAMES': 2,
+    'MAX_HANDS': 2,
+}
+
+# Pipeline
+# Threads running the atoms of atoms/pipeline/ requests concurrently on one decoded image
+
+PIPELINE = {
+    'MAX_WORKERS': 8,
+}
+
+# Text recognition
+# Uploaded images are sent to the backend in memory, in batches of up to MAX_BATCH_SIZE images per call
+# (16 is the Google Vision limit). algorithm_name=LOCAL selects an offline stand-in backend that waits
+# LOCAL_LATENCY_MS per call to model the round trip of the cloud service
+
+TEXT_RECOGNITION = {
+    'MAX_BATCH_SIZE': 16,
+    'LOCAL_LATENCY_MS': 0,
+}
+
+# Intent recognition
+# Utterances are normalized (case, whitespace, surrounding punctuation) and their intents cached per worker
+# for CACHE_TTL_SECONDS; identical utterances in flight at the same time share one backend call.
+# algorithm_name=MOCK selects an offline keyword based backend that waits MOCK_LATENCY_MS per call to model
+# the round trip of the LLM, batches of up to MAX_BATCH_SIZE utterances are sent to it in one call
+
+INTENT_RECOGNITION = {
+    'CACHE_ENABLED': True,
+    'CACHE_MAX_BYTES': 8 * 1024 * 1024,
+    'CACHE_TTL_SECONDS': 3600,
+    'MAX_BATCH_SIZE': 64,
+    'MOCK_LATENCY_MS': 0,
+}
+
+# Voice generation
+# Phrases are rendered to WAV by one long lived TTS engine on a dedicated thread, at most QUEUE_SIZE requests
+# wait for it. Rendered audio is kept in CACHE_DIR under the hash of the phrase, voice and rate (shared by all
+# workers, oldest files are removed beyond CACHE_MAX_BYTES), so repeated phrases are never synthesized again
+
+VOICE_GENERATION = {
+    'CACHE_DIR': BASE_DIR / 'voice_cache',  # None disables the audio cache
+    'CACHE_MAX_BYTES': 256 * 1024 * 1024,
+    'QUEUE_SIZE': 32,
+    'TIMEOUT_SECONDS': 30,
+    'VOICE': None,  # pyttsx3 voice id, None for the default voice
+    'RATE': None,  # words per minute, None for the default rate
+    'CHUNK_BYTES': 64 * 1024,  # cached audio is streamed in chunks of this size
+    'ENGINE': 'pyttsx3',  # pyttsx3, or STUB for a silent stand-in where no speech driver is installed
+}
+
+# Metrics
+# Requests are timed per endpoint and algorithm, split into parse, decode, acquire, construct, inference and
+# serialize phases, and exposed with engine pool and queue gauges at /metrics in the Prometheus text format.
+# Metrics are kept per worker process; the phases of a request are also sent in a Server-Timing header
+
+METRICS = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,
+}
+
+# Benchmarks
+# python manage.py benchmark_atoms measures latency percentiles, throughput and peak RSS of every atom endpoint.
+# algorithm_name=STUB selects offline stand-in engines for object detection and face recognition that wait
+# STUB_LATENCY_MS per frame; results are compared to the baseline at BASELINE_PATH with TOLERANCE of slack
+
+BENCHMARK = {
+    'STUB_LATENCY_MS': 20,
+    'STUB_OBJECTS': 5,
+    'BASELINE_PATH': BASE_DIR / 'benchmarks' / 'baseline.json',
+    'TOLERANCE': 0.2,
+}
+
+# Atoms
+# Atom routes import their view, and with it dronebuddylib and the model libraries of the atom, on the first
+# request. ENABLED lists the atoms served by this process (AtomType values, VOICE_GENERATION and PIPELINE),
+# None serves all of them. python manage.py import_report fails when startup imports exceed IMPORT_BUDGET_MS
+
+ATOMS = {
+    'ENABLED': None,
+    'IMPORT_BUDGET_MS': 2000,
+}
+
+# Inference workers
+# With ENABLED, object detection, face recognition and hand gestures run in the worker processes of
+# python manage.py run_inference_workers (WORKERS processes per atom) instead of the request process. Frames are
+# passed through a shared memory ring of RING_SLOTS slots of SLOT_BYTES per HTTP worker, the socket at
+# SOCKET_PATH only carries the slot and the result. Both sides unpickle what arrives on the socket, so AUTHKEY is
+# required and SOCKET_PATH (None: a directory of the temporary directory only this user can enter) must not be
+# reachable by other users
+
+INFERENCE_WORKERS = {
+    'ENABLED': False,
+    'SOCKET_PATH': None,
+    'AUTHKEY': os.environ.get('DRONE_BUDDY_INFERENCE_AUTHKEY'),
+    'WORKERS': {
+        'OBJECT_DETECTION': 1,
+        'FACE_RECOGNITION': 1,
+        'HAND_FEATURE_EXTRACTION': 1,
+    },
+    'RING_SLOTS': 8,
+    'SLOT_BYTES': 1920 * 1080 * 3,
+    'TIMEOUT_SECONDS': 30,
+}
+
+# Preloading
+# Under gunicorn -c gunicorn.conf.py the master imports the libraries of the enabled atoms and builds the WARMUP
+# engines before it forks the workers, which then share the pages of the weights (torch tensors are moved to
+# shared memory). Engines of IMPORT_ONLY atoms run threads that do not survive a fork, every worker builds its
+# own. python manage.py memory_report shows the shared and private memory per worker
+
+PRELOAD = {
+    'IMPORT_ONLY': ['HAND_FEATURE_EXTRACTION'],
+    'SHARE_TORCH_TENSORS': True,
+    'FREEZE_GC': True,
+}
+
+# Scheduler
+# Inference of all atoms goes through one scheduler with MAX_CONCURRENT slots (None: the number of CPUs).
+# Atoms are ranked by priority class (CRITICAL, INTERACTIVE, BACKGROUND), a class occupies at most MAX_SHARE of
+# the slots, and within a class clients (CLIENT_ID_HEADER, or their address) are served in turn. Clients send
+# their time budget in DEADLINE_HEADER (milliseconds); requests that can no longer finish in time are dropped
+# with 504 instead of being computed
+
+SCHEDULER = {
+    'ENABLED': True,
+    'MAX_CONCURRENT': None,
+    'ATOM_PRIORITIES': {
+        'OBJECT_DETECTION': 'CRITICAL',
+        'FACE_RECOGNITION': 'INTERACTIVE',
+        'HAND_FEATURE_EXTRACTION': 'INTERACTIVE',
+        'INTENT_RECOGNITION': 'BACKGROUND',
+        'TEXT_RECOGNITION': 'BACKGROUND',
+    },
+    'MAX_SHARE': {
+        'CRITICAL': 1.0,
+        'INTERACTIVE': 1.0,
+        'BACKGROUND': 0.5,
+    },
+    'DEADLINE_HEADER': 'X-Deadline-Ms',
+    'DEFAULT_DEADLINE_MS': None,
+    'CLIENT_ID_HEADER': 'X-Client-Id',
+    'MAX_WAIT_SECONDS': 30,
+}
+
+# Adaptive quality
+# When enabled, object detection, face recognition and hand feature extraction degrade gracefully under load: each
+# watches the p95 latency of its recent requests and its queue depth, and steps one LEVEL down (smaller max_side,
+# the LIGHTER_MODELS engine configurations, answering skipped frames with the last result) when over TARGET_P95_MS
+# or MAX_QUEUE_DEPTH, and back up once both are below RECOVERY_RATIO of them. Responses report the level under
+# 'quality' and in the X-Quality-Level header
+
+ADAPTIVE_QUALITY = {
+    'ENABLED': False,
+    'TARGET_P95_MS': 250,
+    'MAX_QUEUE_DEPTH': 4,
+    'RECOVERY_RATIO': 0.6,
+    'WINDOW_SECONDS': 10,
+    'MIN_SAMPLES': 20,
+    'COOLDOWN_SECONDS': 5,
+    'LEVELS': [
+        {},
+        {'max_side': 640},
+        {'max_side': 480, 'lighter_model': True},
+        {'max_side': 320, 'lighter_model': True, 'skip_frames': 1},
+    ],
+    'LIGHTER_MODELS': {
+        'OBJECT_DETECTION': {'YOLO': {'OBJECT_DETECTION_YOLO_VERSION': 'yolov8n.pt'}},
+    },
+}
@@ -0,0 +1,115 @@
+import cv2
+import numpy as np
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, override_settings
+from dronebuddylib.models.enums import FaceRecognitionAlgorithm
+
+from drone_buddy_api.utils import adaptive_quality
+from drone_buddy_api.utils.adaptive_quality import QualityController, SkippedFrames
+from drone_buddy_api.views import face_recognition
+from drone_buddy_api.views.enum import AtomType
+
+RECOGNIZE_FACE_URL = '/atoms/face-recognition/recognize-face/?algorithm_name=' + FaceRecognitionAlgorithm.FACE_RECC.name
+
+LEVELS = [{}, {'max_side': 640}, {'max_side': 320, 'skip_frames': 1}]
+
+
+def create_controller(queue_depth: list, cooldown_seconds: float = 0) -> QualityController:
+    return QualityController(AtomType.OBJECT_DETECTION, LEVELS, target_p95_seconds=0.1, max_queue_depth=4,
+                             recovery_ratio=0.5, window_seconds=60, min_samples=5,
+                             cooldown_seconds=cooldown_seconds, queue_depth=lambda atom: queue_depth[0])
+
+
+def record(controller: QualityController, latency_seconds: float, count: int = 5):
+    for _ in range(count):
+        controller.record(latency_seconds)
+
+
+def test_quality_steps_down_while_the_p95_is_over_the_target():
+    controller = create_controller([0])
+    assert controller.choose_level() == 0
+
+    record(controller, 0.2)
+    assert controller.choose_level() == 1
+    # the window restarted on the step, one more step needs new samples
+    assert controller.choose_level() == 1
+    record(controller, 0.2)
+    assert controller.choose_level() == 2
+    record(controller, 0.2)
+    assert controller.choose_level() == 2
+
+
+def test_quality_steps_down_on_a_deep_queue_and_back_up_once_relieved():
+    queue_depth = [5]
+    controller = create_controller(queue_depth)
+    assert controller.choose_level() == 1
+
+    # below the target, but not comfortably
+    queue_depth[0] = 0
+    record(controller, 0.08)
+    assert controller.choose_level() == 1
+    record(controller, 0.01, count=100)
+    assert controller.choose_level() == 0
+
+
+def test_quality_changes_at_most_once_per_cooldown():
+    controller = create_controller([10], cooldown_seconds=60)
+    assert controller.choose_level() == 0
+    controller._last_change -= 60
+    assert controller.choose_level() == 1
+    assert controller.choose_level() == 1
+    assert controller.changes == 1
+
+
+def test_skipped_frames_answer_all_but_every_n_th_frame_with_the_last_result():
+    skipped_frames = SkippedFrames(max_entries=1)
+    assert skipped_frames.should_skip('a', 1) is None
+    skipped_frames.remember('a', {'result': 1})
+
+    assert skipped_frames.should_skip('a', 1) == {'result': 1}
+    assert skipped_frames.should_skip('a', 1) is None
+    skipped_frames.remember('a', {'result': 2})
+    assert skipped_frames.should_skip('a', 1) == {'result': 2}
+
+    skipped_frames.remember('b', {'result': 3})
+    assert skipped_frames.should_skip('a', 1) is None
+
+
+@pytest.fixture
+def recognized_frames(monkeypatch, tmp_path):
+    """
+    Adaptive quality enabled with a single, downscaling level, and the face index replaced by one recording the
+    frame it was given and the frame_scale it was asked to apply.
+    """
+    recognized = []
+
+    def recognize_faces(face_index, bgr_image, top_k=1, threshold=None, frame_scale=None):
+        recognized.append((bgr_image.shape, frame_scale))
+        return [], []
+
+    monkeypatch.setattr(adaptive_quality, '_controllers', {})
+    monkeypatch.setattr(face_recognition, 'get_face_index', lambda: None)
+    monkeypatch.setattr(face_recognition, 'recognize_faces', recognize_faces)
+    with override_settings(ADAPTIVE_QUALITY={'ENABLED': True, 'LEVELS': [{'max_side': 64}]},
+                           FACE_INDEX={'ENABLED': True, 'PATH': str(tmp_path)}):
+        yield recognized
+
+
+def recognize_face(fields: dict = None):
+    image = cv2.imencode('.png', np.zeros((96, 128, 3), np.uint8))[1].tobytes()
+    return Client().post(RECOGNIZE_FACE_URL, {'image': SimpleUploadedFile('frame.png', image),
+                                              'engine_configurations': '{}', **(fields or {})})
+
+
+def test_frame_downscaled_by_the_level_is_not_scaled_down_again(recognized_frames):
+    response = recognize_face()
+
+    assert response.status_code == 200
+    assert response.json()['quality']['max_side'] == 64
+    assert recognized_frames == [((48, 64, 3), 1.0)]
+
+
+def test_smaller_max_side_of_the_request_wins_over_the_level(recognized_frames):
+    assert recognize_face({'max_side': 32}).status_code == 200
+    assert recognized_frames == [((24, 32, 3), 1.0)]
@@ -0,0 +1,175 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pytest
+
+from drone_buddy_api.utils import intent_recognition
+from drone_buddy_api.utils.batched_object_detection import get_detected_objects_batch
+from drone_buddy_api.utils.exceptions import IntentRecognitionBackendException
+from drone_buddy_api.utils.intent_recognition import MOCK_ALGORITHM, IntentRecognizer, MockIntentRecognitionEngine
+from drone_buddy_api.utils.micro_batcher import MicroBatcher
+
+
+def test_micro_batcher_answers_every_item_of_a_batch():
+    batcher = MicroBatcher(lambda items: [item * 2 for item in items], max_batch_size=8, max_wait_seconds=0.05)
+    futures = [batcher.submit(item) for item in [1, 2, 3]]
+    assert [future.result(timeout=5) for future in futures] == [2, 4, 6]
+
+
+def test_micro_batcher_fails_the_whole_batch_on_a_short_result():
+    # one result short: zip would leave the last future unresolved forever
+    batcher = MicroBatcher(lambda items: items[:-1], max_batch_size=8, max_wait_seconds=0.05)
+    futures = [batcher.submit(item) for item in [1, 2, 3]]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
+
+
+def test_micro_batcher_fails_the_whole_batch_on_a_long_result():
+    batcher = MicroBatcher(lambda items: items + items, max_batch_size=8, max_wait_seconds=0.05)
+    futures = [batcher.submit(item) for item in [1, 2]]
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result(timeout=5)
+
+
+def test_idle_micro_batcher_stops_its_thread_and_restarts_it():
+    batcher = MicroBatcher(lambda items: items, max_batch_size=8, max_wait_seconds=0.01, idle_seconds=0.05)
+    assert batcher.submit(1).result(timeout=5) == 1
+    give_up_at = time.monotonic() + 5
+    while not batcher.is_idle():
+        assert time.monotonic() < give_up_at
+        time.sleep(0.01)
+    assert batcher.submit(2).result(timeout=5) == 2
+
+
+class YoloBoxes:
+
+    def __init__(self, frame_index: int):
+        self.cls = np.array([0.0])
+        self.conf = np.array([0.5])
+        self.xyxy = np.array([[frame_index, 0.0, frame_index + 10.0, 10.0]])
+
+
+class YoloResult:
+
+    def __init__(self, frame_index: int):
+        self.boxes = YoloBoxes(frame_index)
+
+
+class YoloDetector:
+
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, source, verbose=False):
+        self.batches.append(len(source))
+        return [YoloResult(index) for index in range(len(source))]
+
+
+class YoloEngine:
+    """
+    Shaped like a dronebuddylib YOLO ObjectDetectionEngine: the ultralytics detector and the class names on its
+    vision engine.
+    """
+
+    def __init__(self):
+        self.vision_engine = type('VisionEngine', (), {})()
+        self.vision_engine.detector = YoloDetector()
+        self.vision_engine.object_names = ['person']
+        self.single_frames = 0
+
+    def get_detected_objects(self, frame):
+        self.single_frames += 1
+        return 'library result'
+
+
+def test_single_frame_uses_the_engine_and_batches_use_one_predict_call():
+    engine = YoloEngine()
+    assert get_detected_objects_batch(engine, [np.zeros((4, 4, 3), np.uint8)]) == ['library result']
+    assert engine.single_frames == 1 and engine.vision_engine.detector.batches == []
+
+    results = get_detected_objects_batch(engine, [np.zeros((4, 4, 3), np.uint8)] * 3)
+    assert engine.vision_engine.detector.batches == [3] and engine.single_frames == 1
+    assert [result.object_names for result in results] == [['person']] * 3
+    assert [result.detected_objects[0].bounding_box.origin_x for result in results] == [0.0, 1.0, 2.0]
+
+
+class ShortEngine(MockIntentRecognitionEngine):
+    """
+    Batching intent engine that drops the last intent of every batch.
+    """
+
+    def __init__(self, started: threading.Event = None, proceed: threading.Event = None):
+        super().__init__()
+        self.started = started
+        self.proceed = proceed
+
+    def recognize_intents(self, texts: list) -> list:
+        if self.started is not None:
+            self.started.set()
+            self.proceed.wait(5)
+        return super().recognize_intents(texts)[:-1]
+
+
+class FakeEnginePool:
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    @contextmanager
+    def acquire(self, atom, algorithm_name, engine_configurations, units: int = 1):
+        yield self.engine
+
+
+def test_single_flight_fails_every_key_of_a_short_batch(monkeypatch):
+    monkeypatch.setattr(intent_recognition, 'get_engine_pool', lambda: FakeEnginePool(ShortEngine()))
+    recognizer = IntentRecognizer()
+
+    with pytest.raises(IntentRecognitionBackendException):
+        recognizer.recognize_many(MOCK_ALGORITHM, {}, ['take off', 'land', 'go left'])
+    # no key is left in flight, a later call is not joined to a computation nobody finishes
+    assert len(recognizer.flight) == 0
+
+    monkeypatch.setattr(intent_recognition, 'get_engine_pool', lambda: FakeEnginePool(MockIntentRecognitionEngine()))
+    intents = recognizer.recognize_many(MOCK_ALGORITHM, {}, ['take off', 'land', 'go left'])
+    assert [intent['intent'] for intent, _ in intents] == ['TAKE_OFF', 'LAND', 'LEFT']
+
+
+def test_callers_joined_to_a_failed_flight_get_the_error(monkeypatch):
+    started, proceed = threading.Event(), threading.Event()
+    monkeypatch.setattr(intent_recognition, 'get_engine_pool',
+                        lambda: FakeEnginePool(ShortEngine(started, proceed)))
+    recognizer = IntentRecognizer()
+    errors = []
+    joined_flight = threading.Event()
+    begin = recognizer.flight.begin
+
+    def begin_and_tell(key):
+        future, leader = begin(key)
+        if not leader:
+            joined_flight.set()
+        return future, leader
+
+    monkeypatch.setattr(recognizer.flight, 'begin', begin_and_tell)
+
+    def recognize():
+        try:
+            recognizer.recognize(MOCK_ALGORITHM, {}, 'land')
+        except IntentRecognitionBackendException as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=recognize)
+    leader.start()
+    assert started.wait(5)
+    joined = threading.Thread(target=recognize)
+    joined.start()
+    assert joined_flight.wait(5)
+    proceed.set()
+    leader.join(5)
+    joined.join(5)
+
+    assert len(errors) == 2 and not leader.is_alive() and not joined.is_alive()
+    assert len(recognizer.flight) == 0
@@ -0,0 +1,52 @@
+import io
+import json
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.test import override_settings
+
+from drone_buddy_api.utils.benchmark import compare_to_baseline, percentile
+
+SCENARIO = {'requests': 10, 'errors': 0, 'throughput_rps': 100.0, 'p95_ms': 20.0, 'p99_ms': 25.0,
+            'peak_rss_mb': 200.0}
+
+
+def test_percentiles_interpolate_between_ranks():
+    assert percentile([], 0.5) is None
+    assert percentile([1.0, 2.0, 3.0, 4.0], 0.5) == 2.5
+    assert percentile([1.0, 2.0, 3.0, 4.0], 1.0) == 4.0
+
+
+def test_only_changes_beyond_the_tolerance_are_regressions():
+    baseline = {'scenarios': {'detect_objects': SCENARIO}}
+    within = {**SCENARIO, 'p95_ms': 23.0, 'throughput_rps': 85.0}
+    assert compare_to_baseline({'scenarios': {'detect_objects': within, 'new': SCENARIO}}, baseline, 0.2) == []
+
+    worse = {**SCENARIO, 'p99_ms': 40.0, 'throughput_rps': 50.0, 'errors': 1}
+    regressions = compare_to_baseline({'scenarios': {'detect_objects': worse}}, baseline, 0.2)
+    assert [regression.split()[1] for regression in regressions] == ['p99_ms', 'throughput_rps', 'errors']
+
+
+def benchmark(**options):
+    stdout = io.StringIO()
+    call_command('benchmark_atoms', scenarios=['detect_objects', 'recognize_face', 'recognize_intent'], requests=6,
+                 warmup=1, concurrency=2, width=64, height=48, stdout=stdout, stderr=io.StringIO(), **options)
+    return stdout.getvalue()
+
+
+@override_settings(BENCHMARK={'STUB_LATENCY_MS': 1})
+def test_benchmark_on_the_stubs_compares_to_its_baseline(tmp_path):
+    baseline_path = tmp_path / 'baseline.json'
+    benchmark(save_baseline=str(baseline_path))
+    baseline = json.loads(baseline_path.read_text())
+    assert set(baseline['scenarios']) == {'detect_objects', 'recognize_face', 'recognize_intent'}
+    assert all(scenario['requests'] == 6 and scenario['errors'] == 0 for scenario in baseline['scenarios'].values())
+
+    assert 'No regressions' in benchmark(compare=str(baseline_path), tolerance=100.0)
+
+    # a baseline no real run can keep up with
+    for scenario in baseline['scenarios'].values():
+        scenario['p95_ms'] = scenario['p99_ms'] = 0.001
+    baseline_path.write_text(json.dumps(baseline))
+    with pytest.raises(CommandError, match='detect_objects p95_ms'):
+        benchmark(compare=str(baseline_path), tolerance=0.2)
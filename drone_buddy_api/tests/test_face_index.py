@@ -0,0 +1,81 @@
+import threading
+
+import numpy as np
+
+from drone_buddy_api.utils.face_index import ENCODING_DIMENSIONS, FaceIndex
+
+
+def person_encoding(index: int) -> np.ndarray:
+    encoding = np.zeros(ENCODING_DIMENSIONS, np.float32)
+    encoding[index % ENCODING_DIMENSIONS] = 1.0 + index // ENCODING_DIMENSIONS
+    return encoding
+
+
+def people(start: int, count: int) -> tuple:
+    return (['person-' + str(index) for index in range(start, start + count)],
+            np.stack([person_encoding(index) for index in range(start, start + count)]))
+
+
+def test_search_finds_the_nearest_known_faces(tmp_path):
+    face_index = FaceIndex(tmp_path)
+    face_index.rebuild(*people(0, 10))
+
+    matches = face_index.search([person_encoding(3), person_encoding(7) + 0.1], top_k=2)
+    assert [name for name, _ in matches[0]][0] == 'person-3'
+    assert matches[0][0][1] == 0.0
+    assert [name for name, _ in matches[1]][0] == 'person-7'
+    assert face_index.search([person_encoding(3)], threshold=0.5) == [[('person-3', 0.0)]]
+
+
+def test_other_instances_see_appended_faces(tmp_path):
+    writer, reader = FaceIndex(tmp_path), FaceIndex(tmp_path)
+    writer.rebuild(*people(0, 2))
+    assert len(reader) == 2
+
+    assert writer.append(*people(2, 3)) == 5
+    assert reader.search([person_encoding(4)])[0][0] == ('person-4', 0.0)
+
+
+def test_search_during_refresh_sees_a_consistent_index(tmp_path):
+    """
+    Another process rebuilding and appending to the index while this one searches: every search must see names
+    and encodings of the same version of the index, so the face of person-0 is always found at distance 0.
+    """
+    writer, reader = FaceIndex(tmp_path), FaceIndex(tmp_path)
+    writer.rebuild(*people(0, 1))
+    stop = threading.Event()
+    errors = []
+
+    def write():
+        try:
+            for size in range(2, 60):
+                if size % 3 == 0:
+                    writer.rebuild(*people(0, size))
+                else:
+                    writer.append(*people(len(writer), 1))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            stop.set()
+
+    def search():
+        try:
+            while not stop.is_set():
+                matches = reader.search([person_encoding(0)], top_k=3)[0]
+                assert matches[0] == ('person-0', 0.0)
+                # every other match is a face of its own name
+                for name, distance in matches[1:]:
+                    assert distance == float(np.linalg.norm(person_encoding(int(name.split('-')[1]))
+                                                            - person_encoding(0)))
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+
+    threads = [threading.Thread(target=write)] + [threading.Thread(target=search) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+
+    assert errors == []
+    assert len(reader) == len(writer)
@@ -0,0 +1,63 @@
+import pytest
+
+from drone_buddy_api.utils.gesture_tracking import NO_GESTURE, GestureTracker
+
+
+def gesture_result(*hands) -> dict:
+    """
+    A serialized gesture result, see convert_to_serializable, of (handedness, gesture, x) hands with every
+    landmark at x.
+    """
+    return {
+        'handedness': [[{'category_name': handedness, 'score': 1.0}] for handedness, _, _ in hands],
+        'gestures': [[{'category_name': gesture, 'score': 0.8}] for _, gesture, _ in hands],
+        'hand_landmarks': [[{'x': x, 'y': 0.5, 'z': 0.0} for _ in range(21)] for _, _, x in hands],
+    }
+
+
+def create_tracker() -> GestureTracker:
+    return GestureTracker(recognizer=None, smoothing_window=3, stable_frames=2)
+
+
+def test_gesture_change_is_reported_once_it_is_stable():
+    tracker = create_tracker()
+
+    assert tracker.update(gesture_result(('Right', 'Open_Palm', 0.5))) == []
+    events = tracker.update(gesture_result(('Right', 'Open_Palm', 0.5)))
+    assert [(event['hand'], event['gesture'], event['previous_gesture']) for event in events] == \
+        [('Right', 'Open_Palm', NO_GESTURE)]
+    assert tracker.update(gesture_result(('Right', 'Open_Palm', 0.5))) == []
+
+
+def test_flickering_gesture_is_not_reported():
+    tracker = create_tracker()
+    for _ in range(2):
+        tracker.update(gesture_result(('Right', 'Open_Palm', 0.5)))
+
+    for gesture in ['Closed_Fist', 'Open_Palm', 'Closed_Fist', 'Open_Palm']:
+        assert tracker.update(gesture_result(('Right', gesture, 0.5))) == []
+    assert tracker.hands['Right'].gesture == 'Open_Palm'
+
+
+def test_landmarks_are_averaged_over_the_smoothing_window():
+    tracker = create_tracker()
+    for x in [0.1, 0.2, 0.3]:
+        result = gesture_result(('Right', NO_GESTURE, x))
+        tracker.update(result)
+    assert result['hand_landmarks'][0][0]['x'] == pytest.approx(0.2)
+
+    result = gesture_result(('Right', NO_GESTURE, 0.7))
+    tracker.update(result)
+    assert result['hand_landmarks'][0][0]['x'] == pytest.approx(0.4)
+
+
+def test_hands_are_told_apart_and_leaving_ends_their_gesture():
+    tracker = create_tracker()
+    for _ in range(2):
+        tracker.update(gesture_result(('Left', 'Victory', 0.2), ('Right', 'Open_Palm', 0.8)))
+    assert tracker.hands['Left'].gesture == 'Victory' and tracker.hands['Right'].gesture == 'Open_Palm'
+
+    events = tracker.update(gesture_result(('Right', 'Open_Palm', 0.8)))
+    assert [(event['hand'], event['gesture'], event['previous_gesture']) for event in events] == \
+        [('Left', NO_GESTURE, 'Victory')]
+    assert list(tracker.hands) == ['Right']
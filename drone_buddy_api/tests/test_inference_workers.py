@@ -0,0 +1,110 @@
+import pickle
+from collections import OrderedDict
+from concurrent.futures import Future
+from multiprocessing import Pipe, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import cv2
+import numpy as np
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, override_settings
+
+from drone_buddy_api.utils.benchmark import STUB_ALGORITHM
+from drone_buddy_api.utils.exceptions import FrameTooLargeException, InferenceWorkersUnavailableException
+from drone_buddy_api.utils.inference_workers import InferenceClient, attach_ring, dump_exception
+from drone_buddy_api.views import face_recognition
+from drone_buddy_api.views.enum import AtomType
+
+RECOGNIZE_FACE_URL = '/atoms/face-recognition/recognize-face/?algorithm_name=' + STUB_ALGORITHM
+
+
+@pytest.fixture
+def inference_client():
+    """
+    A client whose messages are pickled as the worker connection would, then answered right away instead of
+    being sent to a worker.
+    """
+    client = InferenceClient('unused', b'key', slots=2, slot_bytes=1024 * 1024, timeout_seconds=5)
+    client.sent = []
+    client.answer = (True, pickle.dumps((['someone'], None)))
+
+    def send(message):
+        client.sent.append(pickle.loads(pickle.dumps(message)))
+        client._pending[message[0]].set_result(client.answer)
+
+    client._send = send
+    yield client
+    client.close()
+
+
+def test_uploaded_file_is_not_sent_to_the_workers(inference_client, monkeypatch):
+    monkeypatch.setattr(face_recognition, 'get_inference_client', lambda: inference_client)
+    image = cv2.imencode('.png', np.zeros((32, 32, 3), np.uint8))[1].tobytes()
+
+    # every upload is written to a temporary file, which cannot be pickled
+    with override_settings(INFERENCE_WORKERS={'ENABLED': True}, FILE_UPLOAD_MAX_MEMORY_SIZE=0):
+        response = Client().post(RECOGNIZE_FACE_URL, {'image': SimpleUploadedFile('frame.png', image),
+                                                      'engine_configurations': '{}', 'top_k': 2})
+
+    assert response.status_code == 200
+    assert response.json()['result'] == ['someone']
+    assert [message[4] for message in inference_client.sent] == [{'top_k': 2}]
+
+
+def test_frame_is_read_by_the_worker_from_the_ring(inference_client):
+    frame = np.arange(48, dtype=np.uint8).reshape(4, 4, 3)
+    assert inference_client.run(AtomType.FACE_RECOGNITION, STUB_ALGORITHM, {}, frame) == (['someone'], None)
+
+    _, _, _, _, _, ring_name, offset, shape, dtype = inference_client.sent[0]
+    ring = SharedMemory(name=ring_name)
+    try:
+        np.testing.assert_array_equal(np.ndarray(shape, np.dtype(dtype), buffer=ring.buf, offset=offset), frame)
+    finally:
+        ring.close()
+    # the slot was handed back
+    assert inference_client._free_slots.qsize() == 2
+
+
+def test_frame_larger_than_a_slot_is_rejected(inference_client):
+    with pytest.raises(FrameTooLargeException):
+        inference_client.run(AtomType.OBJECT_DETECTION, STUB_ALGORITHM, {}, np.zeros((1024, 1024, 3), np.uint8))
+    assert inference_client.sent == []
+
+
+def test_exception_of_the_worker_is_raised_in_the_request(inference_client):
+    inference_client.answer = (False, dump_exception(ValueError('no such model')))
+    with pytest.raises(ValueError, match='no such model'):
+        inference_client.run(AtomType.OBJECT_DETECTION, STUB_ALGORITHM, {}, np.zeros((4, 4, 3), np.uint8))
+    assert inference_client._free_slots.qsize() == 2
+
+
+def test_lost_connection_fails_the_requests_in_flight(inference_client):
+    client_end, worker_end = Pipe()
+    future = Future()
+    inference_client._pending[0] = future
+    worker_end.close()
+    inference_client._receive(client_end)
+
+    succeeded, payload = future.result(timeout=5)
+    assert not succeeded
+    assert isinstance(pickle.loads(payload), InferenceWorkersUnavailableException)
+
+
+def test_workers_keep_at_most_max_attached_rings():
+    owned = [SharedMemory(create=True, size=16) for _ in range(3)]
+    rings = OrderedDict()
+    try:
+        for ring in owned:
+            attach_ring(rings, ring.name, max_attached=2)
+        assert list(rings) == [ring.name for ring in owned[1:]]
+        assert attach_ring(rings, owned[1].name, max_attached=2) is rings[owned[1].name]
+        assert list(rings) == [owned[2].name, owned[1].name]
+    finally:
+        for ring in list(rings.values()):
+            ring.close()
+        for ring in owned:
+            # attaching unregistered the ring from the resource tracker of this process, which also owns it
+            resource_tracker.register(ring._name, 'shared_memory')
+            ring.close()
+            ring.unlink()
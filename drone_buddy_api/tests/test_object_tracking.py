@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+from dronebuddylib.atoms.objectdetection.detected_object import BoundingBox, DetectedObject, ObjectDetectionResult
+
+from drone_buddy_api.utils.exceptions import TrackingSessionMismatchException
+from drone_buddy_api.utils.object_tracking import ObjectTracker, TrackingSessionStore, tracking_result_to_json
+
+PATCH_SIZE = 40
+PATCH = np.random.default_rng(0).integers(0, 256, (PATCH_SIZE, PATCH_SIZE, 3), dtype=np.uint8)
+
+
+def frame_with_patch(x: int, y: int, background: int = 128) -> np.ndarray:
+    frame = np.full((240, 320, 3), background, np.uint8)
+    frame[y:y + PATCH_SIZE, x:x + PATCH_SIZE] = PATCH
+    return frame
+
+
+class PatchDetector:
+    """
+    Detects the textured patch of the frames where it was last put, and counts its calls.
+    """
+
+    def __init__(self):
+        self.position = (0, 0)
+        self.calls = 0
+
+    def __call__(self, bgr_image) -> ObjectDetectionResult:
+        self.calls += 1
+        detected_object = DetectedObject([], BoundingBox(self.position[0], self.position[1], PATCH_SIZE, PATCH_SIZE))
+        detected_object.add_category('box', 0.9)
+        return ObjectDetectionResult(['box'], [detected_object])
+
+
+def create_tracker(detect_interval: int = 5) -> ObjectTracker:
+    return ObjectTracker(detect_interval, scene_change_threshold=0.12, iou_threshold=0.3, max_missed_detections=2)
+
+
+def track(tracker: ObjectTracker, detector: PatchDetector, x: int, y: int, background: int = 128) -> tuple:
+    detector.position = (x, y)
+    return tracker.update(frame_with_patch(x, y, background), detector)
+
+
+def test_boxes_follow_the_object_between_detections():
+    tracker, detector = create_tracker(), PatchDetector()
+    _, track_ids, tracking = track(tracker, detector, 100, 80)
+    assert track_ids == [1] and tracking['detected']
+
+    for step in range(1, 4):
+        result, track_ids, tracking = track(tracker, detector, 100 + 3 * step, 80 + 2 * step)
+        assert not tracking['detected'] and track_ids == [1]
+        box = result.detected_objects[0].bounding_box
+        assert box.origin_x == pytest.approx(100 + 3 * step, abs=1.0)
+        assert box.origin_y == pytest.approx(80 + 2 * step, abs=1.0)
+    assert detector.calls == 1
+
+
+def test_objects_keep_their_track_id_across_detections():
+    tracker, detector = create_tracker(detect_interval=2), PatchDetector()
+    track_ids = [track(tracker, detector, 100 + 2 * step, 80)[1] for step in range(6)]
+
+    assert detector.calls == 3
+    assert track_ids == [[1]] * 6
+
+
+def test_scene_change_runs_a_detection():
+    tracker, detector = create_tracker(), PatchDetector()
+    track(tracker, detector, 100, 80)
+    _, _, tracking = track(tracker, detector, 100, 80, background=250)
+
+    assert tracking['detected'] and tracking['scene_change']
+    assert detector.calls == 2
+
+
+def test_lost_objects_are_dropped_after_missed_detections():
+    tracker, detector = create_tracker(detect_interval=1), PatchDetector()
+    track(tracker, detector, 100, 80)
+    # the object jumped too far to overlap its track: a new track, the old one waits for its missed detections
+    _, track_ids, _ = track(tracker, detector, 250, 180)
+    assert track_ids == [2]
+    assert len(tracker.tracks) == 2
+    for _ in range(2):
+        track(tracker, detector, 250, 180)
+    assert [tracked.track_id for tracked in tracker.tracks] == [2]
+
+
+def test_tracking_json_carries_the_track_ids():
+    tracker, detector = create_tracker(), PatchDetector()
+    result, track_ids, tracking = track(tracker, detector, 100, 80)
+    result_json = tracking_result_to_json(result, track_ids, tracking)
+
+    assert [detected_object['track_id'] for detected_object in result_json['detected_objects']] == [1]
+    assert result_json['tracking'] == tracking
+
+
+def test_session_store_forgets_idle_sessions(monkeypatch):
+    store = TrackingSessionStore(idle_seconds=60, max_sessions=10)
+    tracker = store.get('drone-1')
+    assert store.get('drone-1') is tracker
+
+    now = [1000.0]
+    monkeypatch.setattr('drone_buddy_api.utils.object_tracking.time.monotonic', lambda: now[0])
+    store.get('drone-1')
+    now[0] += 61
+    store.get('drone-2')
+    assert len(store) == 1
+    assert store.get('drone-1') is not tracker
+
+
+def test_session_store_forgets_the_least_recently_used_session_beyond_max_sessions():
+    store = TrackingSessionStore(idle_seconds=60, max_sessions=2)
+    first, second = store.get('drone-1'), store.get('drone-2')
+    store.get('drone-1')
+    store.get('drone-3')
+
+    assert len(store) == 2
+    assert store.get('drone-1') is first
+    assert store.get('drone-2') is not second
+
+
+def test_session_settings_are_fixed_by_the_first_frame():
+    store = TrackingSessionStore(idle_seconds=60, max_sessions=10)
+    tracker = store.get('drone-1', detect_interval=3)
+    assert tracker.detect_interval == 3
+    assert store.get('drone-1', detect_interval=3) is tracker
+    assert store.get('drone-1', detect_interval=None) is tracker
+
+    with pytest.raises(TrackingSessionMismatchException):
+        store.get('drone-1', detect_interval=10)
+    assert tracker.detect_interval == 3
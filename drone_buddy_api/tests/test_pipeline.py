@@ -0,0 +1,55 @@
+import json
+
+import cv2
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client
+
+from drone_buddy_api.utils.benchmark import STUB_ALGORITHM
+
+PIPELINE_URL = '/atoms/pipeline/'
+
+
+def run_pipeline(atoms, **fields):
+    image = cv2.imencode('.png', np.zeros((48, 64, 3), np.uint8))[1].tobytes()
+    return Client().post(PIPELINE_URL, {'image': SimpleUploadedFile('frame.png', image),
+                                        'atoms': json.dumps(atoms), **fields})
+
+
+def test_every_atom_runs_on_the_image():
+    response = run_pipeline([{'atom': 'OBJECT_DETECTION', 'algorithm_name': STUB_ALGORITHM},
+                             {'atom': 'FACE_RECOGNITION', 'algorithm_name': STUB_ALGORITHM}])
+
+    assert response.status_code == 200
+    detection, recognition = response.json()['result']
+    assert detection['atom'] == 'OBJECT_DETECTION' and 'error' not in detection
+    assert len(detection['result']['detected_objects']) == 5
+    assert recognition['atom'] == 'FACE_RECOGNITION' and recognition['result'] == ['Unknown']
+    assert set(response.json()['timings']) == {'decode_ms', 'total_ms'}
+
+
+def test_results_are_in_the_coordinates_of_the_original_image():
+    full = run_pipeline([{'atom': 'OBJECT_DETECTION', 'algorithm_name': STUB_ALGORITHM}])
+    downscaled = run_pipeline([{'atom': 'OBJECT_DETECTION', 'algorithm_name': STUB_ALGORITHM}], max_side=32)
+
+    boxes = [[detected_object['bounding_box'] for detected_object in response.json()['result'][0]['result']
+              ['detected_objects']] for response in (full, downscaled)]
+    for box, downscaled_box in zip(*boxes):
+        for key in ('origin_x', 'origin_y', 'width', 'height'):
+            assert abs(box[key] - downscaled_box[key]) <= 1.0
+
+
+def test_failed_atom_does_not_fail_the_others():
+    response = run_pipeline([{'atom': 'OBJECT_DETECTION', 'algorithm_name': 'NO_SUCH_ALGORITHM'},
+                             {'atom': 'FACE_RECOGNITION', 'algorithm_name': STUB_ALGORITHM}])
+
+    assert response.status_code == 200
+    failed, recognition = response.json()['result']
+    assert failed['error'] and 'result' not in failed
+    assert recognition['result'] == ['Unknown']
+
+
+def test_atoms_are_validated():
+    assert run_pipeline([]).status_code == 400
+    assert run_pipeline([{'atom': 'OBJECT_DETECTION'}]).status_code == 400
+    assert run_pipeline([{'atom': 'VOICE_GENERATION', 'algorithm_name': STUB_ALGORITHM}]).status_code == 400
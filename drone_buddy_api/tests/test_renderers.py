@@ -0,0 +1,70 @@
+import json
+
+import cv2
+import msgpack
+import numpy as np
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client
+
+from drone_buddy_api.utils.benchmark import STUB_ALGORITHM
+from drone_buddy_api.utils.renderers import MSGPACK_MEDIA_TYPE, MessagePackRenderer, ORJSONRenderer
+
+
+def unpack_arrays(value):
+    """
+    Rebuilds the NumPy arrays of a MessagePack response the way clients do.
+    """
+    if isinstance(value, dict):
+        if set(value) == {'dtype', 'shape', 'data'}:
+            return np.frombuffer(value['data'], dtype=np.dtype(value['dtype']).newbyteorder('<')) \
+                .reshape(value['shape'])
+        return dict((key, unpack_arrays(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [unpack_arrays(item) for item in value]
+    return value
+
+
+@pytest.mark.parametrize('array', [
+    np.arange(12, dtype=np.float32).reshape(3, 4),
+    np.arange(12, dtype=np.int32).reshape(4, 3),
+    np.arange(6, dtype='>f4').reshape(2, 3),
+    np.arange(24, dtype=np.float32).reshape(4, 6)[:, ::2],
+    np.empty((0, 4), np.float32),
+    np.array([np.nan, 1.5], np.float32),
+], ids=['float32', 'int32', 'big endian', 'strided', 'empty', 'nan'])
+def test_packed_arrays_round_trip(array):
+    rendered = MessagePackRenderer().render({'boxes': array, 'names': ['a'], 'count': np.int64(2)})
+    data = unpack_arrays(msgpack.unpackb(rendered, raw=False))
+
+    assert data['names'] == ['a'] and data['count'] == 2
+    assert data['boxes'].shape == array.shape
+    np.testing.assert_array_equal(data['boxes'], array)
+
+
+def test_json_renders_arrays_as_nested_lists():
+    array = np.arange(6, dtype=np.float32).reshape(2, 3)[:, ::2]
+    assert json.loads(ORJSONRenderer().render({'boxes': array, 'score': np.float32(0.5)})) == \
+        {'boxes': [[0.0, 2.0], [3.0, 5.0]], 'score': 0.5}
+
+
+def test_packed_detections_match_the_json_response():
+    client = Client()
+    image = cv2.imencode('.png', np.zeros((48, 64, 3), np.uint8))[1].tobytes()
+
+    def detect(**headers):
+        return client.post('/atoms/object-detection/detect-objects/?algorithm_name=' + STUB_ALGORITHM,
+                           {'image': SimpleUploadedFile('frame.png', image), 'engine_configurations': '{}'},
+                           **headers)
+
+    json_response = detect()
+    packed_response = detect(HTTP_ACCEPT=MSGPACK_MEDIA_TYPE)
+    assert json_response.status_code == packed_response.status_code == 200
+    assert packed_response['Content-Type'] == MSGPACK_MEDIA_TYPE
+
+    json_result = json_response.json()['result']
+    packed_result = unpack_arrays(msgpack.unpackb(packed_response.content, raw=False))['result']
+    assert packed_result['object_names'] == json_result['object_names']
+    boxes = [[detected_object['bounding_box'][key] for key in ('origin_x', 'origin_y', 'width', 'height')]
+             for detected_object in json_result['detected_objects']]
+    np.testing.assert_allclose(packed_result['boxes'], np.array(boxes, np.float32).reshape(-1, 4))
@@ -0,0 +1,75 @@
+import cv2
+import numpy as np
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, override_settings
+
+from drone_buddy_api.utils import result_cache
+from drone_buddy_api.utils.benchmark import STUB_ALGORITHM
+from drone_buddy_api.utils.face_index import ENCODING_DIMENSIONS, FaceIndex
+from drone_buddy_api.utils.result_cache import CACHE_HEADER, LocalResultCacheBackend, ResultCache
+from drone_buddy_api.views.enum import AtomType
+
+RECOGNIZE_FACE_URL = '/atoms/face-recognition/recognize-face/?algorithm_name=' + STUB_ALGORITHM
+
+
+def test_invalidating_an_atom_hides_its_entries():
+    cache = ResultCache(LocalResultCacheBackend(1024 * 1024), {})
+    cache.set(AtomType.OBJECT_DETECTION, 'key', {'result': 1})
+    cache.set(AtomType.FACE_RECOGNITION, 'key', {'result': 2})
+
+    cache.invalidate(AtomType.OBJECT_DETECTION)
+    assert cache.get(AtomType.OBJECT_DETECTION, 'key') is None
+    assert cache.get(AtomType.FACE_RECOGNITION, 'key') == {'result': 2}
+
+
+def test_local_backend_evicts_least_recently_used_entries_over_its_budget():
+    backend = LocalResultCacheBackend(max_bytes=10)
+    backend.set('a', b'aaaa', None)
+    backend.set('b', b'bbbb', None)
+    backend.get('a')
+    backend.set('c', b'cccc', None)
+
+    assert backend.get('b') is None
+    assert backend.get('a') == b'aaaa' and backend.get('c') == b'cccc'
+    assert backend.size_bytes == 8
+
+
+@pytest.fixture
+def face_cache(tmp_path, monkeypatch):
+    """
+    An enabled, empty result cache and a face index of its own.
+    """
+    monkeypatch.setattr(result_cache, '_result_cache', None)
+    with override_settings(RESULT_CACHE={'ENABLED': True, 'BACKEND': 'LOCAL'},
+                           FACE_INDEX={'ENABLED': True, 'PATH': str(tmp_path)}):
+        yield FaceIndex(tmp_path)
+
+
+def recognize_face(client: Client, image: bytes):
+    return client.post(RECOGNIZE_FACE_URL, {'image': SimpleUploadedFile('frame.png', image),
+                                            'engine_configurations': '{}'})
+
+
+def test_face_recognitions_miss_after_the_known_faces_change_on_disk(face_cache):
+    client = Client()
+    image = cv2.imencode('.png', np.zeros((32, 32, 3), np.uint8))[1].tobytes()
+
+    responses = [recognize_face(client, image) for _ in range(2)]
+    assert [response.status_code for response in responses] == [200, 200]
+    assert [response[CACHE_HEADER] for response in responses] == ['MISS', 'HIT']
+
+    # appended by another worker: nothing invalidated the cache of this process, the key changed instead
+    FaceIndex(face_cache.path).append(['someone'], np.zeros((1, ENCODING_DIMENSIONS), np.float32))
+    responses = [recognize_face(client, image) for _ in range(2)]
+    assert [response[CACHE_HEADER] for response in responses] == ['MISS', 'HIT']
+
+
+def test_cache_control_no_cache_skips_the_cache(face_cache):
+    client = Client()
+    image = cv2.imencode('.png', np.zeros((32, 32, 3), np.uint8))[1].tobytes()
+
+    assert recognize_face(client, image)[CACHE_HEADER] == 'MISS'
+    response = client.post(RECOGNIZE_FACE_URL, {'image': SimpleUploadedFile('frame.png', image),
+                                                'engine_configurations': '{}'}, HTTP_CACHE_CONTROL='no-cache')
+    assert response.status_code == 200 and CACHE_HEADER not in response
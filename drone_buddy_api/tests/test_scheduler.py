@@ -0,0 +1,189 @@
+import threading
+import time
+
+import pytest
+from django.test import RequestFactory
+
+from drone_buddy_api.utils.exceptions import DeadlineExceededException
+from drone_buddy_api.utils.scheduler import InferenceScheduler, RequestSchedule, SchedulingMiddleware, \
+    current_request_schedule, parse_deadline_ms
+from drone_buddy_api.views.enum import AtomType, PriorityClass
+
+ATOM_PRIORITIES = {
+    AtomType.OBJECT_DETECTION: PriorityClass.CRITICAL,
+    AtomType.FACE_RECOGNITION: PriorityClass.INTERACTIVE,
+    AtomType.INTENT_RECOGNITION: PriorityClass.BACKGROUND,
+}
+
+
+def create_scheduler(max_concurrent: int = 1) -> InferenceScheduler:
+    return InferenceScheduler(max_concurrent, ATOM_PRIORITIES, {}, max_wait_seconds=5)
+
+
+def wait_until(condition, timeout_seconds: float = 5):
+    give_up_at = time.monotonic() + timeout_seconds
+    while not condition():
+        assert time.monotonic() < give_up_at, 'timed out waiting for the scheduler'
+        time.sleep(0.001)
+
+
+class Request(threading.Thread):
+    """
+    Runs inference for one request on its own thread: takes a slot, records that it got it and holds it until
+    released.
+    """
+
+    def __init__(self, scheduler, atom, client_id, name, granted: list, deadline_seconds: float = None):
+        super().__init__(daemon=True)
+        self.scheduler = scheduler
+        self.atom = atom
+        self.client_id = client_id
+        self.request_name = name
+        self.granted = granted
+        self.deadline_seconds = deadline_seconds
+        self.release = threading.Event()
+        self.error = None
+
+    def run(self):
+        deadline = time.monotonic() + self.deadline_seconds if self.deadline_seconds is not None else None
+        current_request_schedule.set(RequestSchedule(self.client_id, deadline))
+        try:
+            with self.scheduler.slot(self.atom):
+                self.granted.append(self.request_name)
+                self.release.wait(5)
+        except Exception as e:
+            self.error = e
+
+
+def start_queued(scheduler, requests):
+    for request in requests:
+        waiting = sum(scheduler.stats()['waiting'].values())
+        request.start()
+        wait_until(lambda: sum(scheduler.stats()['waiting'].values()) == waiting + 1)
+
+
+def release_in_turn(holder, requests, granted: list) -> list:
+    """
+    Releases the holder of the slot, then every request as soon as it got the slot, and returns the order the
+    slot was granted in.
+    """
+    by_name = dict((request.request_name, request) for request in requests)
+    holder.release.set()
+    for count in range(2, len(requests) + 2):
+        wait_until(lambda: len(granted) == count)
+        by_name[granted[-1]].release.set()
+    for request in [holder] + requests:
+        request.join(5)
+    return granted
+
+
+def test_priority_classes_run_most_urgent_first():
+    scheduler = create_scheduler()
+    granted = []
+    holder = Request(scheduler, AtomType.FACE_RECOGNITION, 'holder', 'holder', granted)
+    holder.start()
+    wait_until(lambda: granted == ['holder'])
+
+    queued = [Request(scheduler, AtomType.INTENT_RECOGNITION, 'a', 'background', granted),
+              Request(scheduler, AtomType.FACE_RECOGNITION, 'b', 'interactive', granted),
+              Request(scheduler, AtomType.OBJECT_DETECTION, 'c', 'critical', granted)]
+    start_queued(scheduler, queued)
+
+    assert release_in_turn(holder, queued, granted) == ['holder', 'critical', 'interactive', 'background']
+
+
+def test_clients_of_a_class_are_served_in_turn():
+    scheduler = create_scheduler()
+    granted = []
+    holder = Request(scheduler, AtomType.OBJECT_DETECTION, 'holder', 'holder', granted)
+    holder.start()
+    wait_until(lambda: granted == ['holder'])
+
+    # a burst of one client does not make a later client wait for all of it
+    queued = [Request(scheduler, AtomType.OBJECT_DETECTION, 'a', 'a' + str(index), granted) for index in range(3)]
+    queued.append(Request(scheduler, AtomType.OBJECT_DETECTION, 'b', 'b0', granted))
+    start_queued(scheduler, queued)
+
+    assert release_in_turn(holder, queued, granted) == ['holder', 'a0', 'b0', 'a1', 'a2']
+
+
+def test_request_past_its_deadline_is_dropped_on_arrival():
+    scheduler = create_scheduler()
+    token = current_request_schedule.set(RequestSchedule('a', time.monotonic() - 0.001))
+    try:
+        with pytest.raises(DeadlineExceededException):
+            with scheduler.slot(AtomType.OBJECT_DETECTION):
+                pass
+    finally:
+        current_request_schedule.reset(token)
+    assert scheduler.rejected['deadline'] == 1
+
+
+def test_queued_request_is_dropped_when_its_deadline_passes():
+    scheduler = create_scheduler()
+    granted = []
+    holder = Request(scheduler, AtomType.OBJECT_DETECTION, 'holder', 'holder', granted)
+    holder.start()
+    wait_until(lambda: granted == ['holder'])
+
+    late = Request(scheduler, AtomType.OBJECT_DETECTION, 'a', 'late', granted, deadline_seconds=0.05)
+    late.start()
+    late.join(5)
+    holder.release.set()
+    holder.join(5)
+
+    assert isinstance(late.error, DeadlineExceededException)
+    assert granted == ['holder']
+    assert scheduler.stats()['waiting'][PriorityClass.CRITICAL.value] == 0
+    assert scheduler.stats()['running'][PriorityClass.CRITICAL.value] == 0
+
+
+def test_service_time_estimate_only_drops_contended_requests():
+    scheduler = create_scheduler()
+    token = current_request_schedule.set(RequestSchedule('a', None))
+    try:
+        with scheduler.slot(AtomType.OBJECT_DETECTION):
+            time.sleep(0.05)
+    finally:
+        current_request_schedule.reset(token)
+    assert scheduler.service_seconds(AtomType.OBJECT_DETECTION) >= 0.05
+
+    # alone, a request runs even though the estimate says it cannot make its deadline
+    granted = []
+    alone = Request(scheduler, AtomType.OBJECT_DETECTION, 'a', 'alone', granted, deadline_seconds=0.01)
+    alone.start()
+    wait_until(lambda: granted == ['alone'])
+
+    # behind it, the same request is dropped right away
+    contended = Request(scheduler, AtomType.OBJECT_DETECTION, 'b', 'contended', granted, deadline_seconds=0.01)
+    contended.start()
+    contended.join(5)
+    alone.release.set()
+    alone.join(5)
+
+    assert isinstance(contended.error, DeadlineExceededException)
+    assert granted == ['alone']
+
+
+@pytest.mark.parametrize('value', ['inf', '-inf', 'nan', '0', '-5', 'soon', ''])
+def test_unusable_deadline_headers_fall_back_to_the_default(value):
+    assert parse_deadline_ms(value, None) is None
+    assert parse_deadline_ms(value, 500) == 500
+
+
+def test_deadline_header_sets_the_deadline():
+    assert parse_deadline_ms('250', None) == 250
+    assert parse_deadline_ms(None, 500) == 500
+
+
+def test_middleware_reads_deadline_and_client_id():
+    middleware = SchedulingMiddleware(lambda request: None)
+    factory = RequestFactory()
+
+    schedule = middleware.read_schedule(factory.get('/', HTTP_X_DEADLINE_MS='inf', HTTP_X_CLIENT_ID='drone-1'))
+    assert schedule.deadline is None
+    assert schedule.client_id == 'drone-1' and schedule.explicit_client_id
+
+    schedule = middleware.read_schedule(factory.get('/', HTTP_X_DEADLINE_MS='200', REMOTE_ADDR='10.0.0.2'))
+    assert 0 < schedule.remaining_seconds() <= 0.2
+    assert schedule.client_id == '10.0.0.2' and not schedule.explicit_client_id
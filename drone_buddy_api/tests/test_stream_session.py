@@ -0,0 +1,97 @@
+import asyncio
+import json
+
+import cv2
+import numpy as np
+
+from drone_buddy_api.utils.benchmark import STUB_ALGORITHM
+from drone_buddy_api.utils.stream_session import CLOSE_POLICY_VIOLATION, LatestFrameSlot
+from drone_buddy_api.views.object_detection import detect_objects_stream
+
+FRAME = cv2.imencode('.png', np.zeros((48, 64, 3), np.uint8))[1].tobytes()
+SCOPE = {'type': 'websocket', 'path': '/atoms/stream/object-detection/detect-objects/', 'headers': [],
+         'client': ('127.0.0.1', 5000)}
+
+
+class WebSocket:
+    """
+    The client side of an ASGI WebSocket connection to an endpoint.
+    """
+
+    def __init__(self, endpoint):
+        self.received = asyncio.Queue()
+        self.sent = asyncio.Queue()
+        self.task = asyncio.ensure_future(endpoint(SCOPE, self.received.get, self.sent.put))
+        self.received.put_nowait({'type': 'websocket.connect'})
+
+    def send_text(self, text: str):
+        self.received.put_nowait({'type': 'websocket.receive', 'text': text})
+
+    def send_bytes(self, data: bytes):
+        self.received.put_nowait({'type': 'websocket.receive', 'bytes': data})
+
+    async def receive(self) -> dict:
+        return await asyncio.wait_for(self.sent.get(), 5)
+
+    async def receive_json(self) -> dict:
+        message = await self.receive()
+        assert message['type'] == 'websocket.send'
+        return json.loads(message['text'])
+
+    async def disconnect(self):
+        self.received.put_nowait({'type': 'websocket.disconnect'})
+        await asyncio.wait_for(self.task, 5)
+
+
+def test_latest_frame_slot_keeps_only_the_newest_frame():
+    async def run():
+        slot = LatestFrameSlot()
+        for frame in [b'a', b'b', b'c']:
+            slot.put(frame)
+        assert await slot.get() == (3, b'c')
+        assert slot.dropped == 2
+
+        waiting = asyncio.ensure_future(slot.get())
+        await asyncio.sleep(0)
+        slot.close()
+        assert await asyncio.wait_for(waiting, 5) is None
+
+    asyncio.run(run())
+
+
+def test_every_frame_of_a_session_is_answered():
+    async def run():
+        websocket = WebSocket(detect_objects_stream)
+        assert (await websocket.receive())['type'] == 'websocket.accept'
+        websocket.send_text(json.dumps({'algorithm_name': STUB_ALGORITHM, 'tracking': True}))
+        session = await websocket.receive_json()
+        assert session['type'] == 'session' and session['session_id']
+
+        results = []
+        for _ in range(3):
+            websocket.send_bytes(FRAME)
+            results.append(await websocket.receive_json())
+        await websocket.disconnect()
+        return results
+
+    results = asyncio.run(run())
+    assert [result['type'] for result in results] == ['result'] * 3
+    assert [result['frame'] for result in results] == [1, 2, 3]
+    assert [result['result']['tracking']['frame_index'] for result in results] == [1, 2, 3]
+    assert [detected_object['track_id'] for detected_object in results[2]['result']['detected_objects']] == \
+        [1, 2, 3, 4, 5]
+
+
+def test_invalid_opening_message_closes_the_session():
+    async def run():
+        websocket = WebSocket(detect_objects_stream)
+        await websocket.receive()
+        websocket.send_text('{"tracking": "maybe"}')
+        error = await websocket.receive_json()
+        close = await websocket.receive()
+        await asyncio.wait_for(websocket.task, 5)
+        return error, close
+
+    error, close = asyncio.run(run())
+    assert error['type'] == 'error' and 'tracking' in error['errors']
+    assert close == {'type': 'websocket.close', 'code': CLOSE_POLICY_VIOLATION}
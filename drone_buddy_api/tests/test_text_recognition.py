@@ -0,0 +1,80 @@
+from contextlib import contextmanager
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, override_settings
+from dronebuddylib.atoms.textrecognition.text_recognition_result import TextRecognitionResult
+
+from drone_buddy_api.utils import text_recognition
+from drone_buddy_api.utils.benchmark import synthetic_image
+from drone_buddy_api.utils.text_recognition import LOCAL_ALGORITHM, recognize_texts, recognize_texts_with_engine
+
+RECOGNIZE_TEXT_URL = '/atoms/text-recognition/recognize-text/?algorithm_name=' + LOCAL_ALGORITHM
+
+
+class BatchingEngine:
+    """
+    Text recognition engine taking whole batches, answering every image with its own bytes.
+    """
+
+    def __init__(self):
+        self.batches = []
+
+    def recognize_texts(self, images: list) -> list:
+        self.batches.append(len(images))
+        return [TextRecognitionResult(image.decode(), 'en', []) for image in images]
+
+
+class PathEngine:
+    """
+    Text recognition engine reading one image from a path per call, like the dronebuddylib engines.
+    """
+
+    def recognize_text(self, image_path) -> TextRecognitionResult:
+        with open(image_path, 'rb') as image_file:
+            return TextRecognitionResult(image_file.read().decode(), 'en', [])
+
+
+class FakeEnginePool:
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.acquired = []
+
+    @contextmanager
+    def acquire(self, atom, algorithm_name, engine_configurations, units: int = 1):
+        self.acquired.append(units)
+        yield self.engine
+
+
+def test_images_are_sent_in_batches_of_at_most_max_batch_size(monkeypatch):
+    engine_pool = FakeEnginePool(BatchingEngine())
+    monkeypatch.setattr(text_recognition, 'get_engine_pool', lambda: engine_pool)
+    images = [str(index).encode() for index in range(7)]
+
+    with override_settings(TEXT_RECOGNITION={'MAX_BATCH_SIZE': 3}):
+        results = recognize_texts(LOCAL_ALGORITHM, {}, images)
+
+    assert [result.text for result in results] == [str(index) for index in range(7)]
+    assert engine_pool.engine.batches == [3, 3, 1]
+    # one acquire, scheduled like the seven images it runs
+    assert engine_pool.acquired == [7]
+
+
+def test_engines_without_batches_get_one_image_at_a_time():
+    results = recognize_texts_with_engine(PathEngine(), [b'first', b'second'])
+    assert [result.text for result in results] == ['first', 'second']
+
+
+def test_several_uploads_are_answered_in_order():
+    images = [synthetic_image(seed=seed) for seed in range(3)]
+    response = Client().post(RECOGNIZE_TEXT_URL, {
+        'images': [SimpleUploadedFile('frame' + str(index) + '.jpg', image) for index, image in enumerate(images)],
+        'engine_configurations': '{}'})
+    single = Client().post(RECOGNIZE_TEXT_URL, {'image': SimpleUploadedFile('frame1.jpg', images[1]),
+                                                'engine_configurations': '{}'})
+
+    assert response.status_code == single.status_code == 200
+    results = response.json()['result']
+    assert len(results) == 3
+    assert results[1] == single.json()['result']
+    assert all(result['text'] for result in results)
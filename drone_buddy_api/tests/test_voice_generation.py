@@ -0,0 +1,79 @@
+import io
+import os
+import wave
+
+import pytest
+from django.test import Client, override_settings
+
+from drone_buddy_api.utils import voice_generation
+from drone_buddy_api.utils.benchmark import STUB_ALGORITHM, StubTtsEngine
+from drone_buddy_api.utils.result_cache import CACHE_HEADER
+from drone_buddy_api.utils.voice_generation import AudioCache, SpeechSynthesizer
+
+GENERATE_VOICE_URL = '/atoms/voice-generation/generate-voice/'
+
+
+def test_audio_cache_removes_the_oldest_files_over_its_budget(tmp_path):
+    cache = AudioCache(tmp_path, max_bytes=10)
+    for index, key in enumerate(['a' * 64, 'b' * 64, 'c' * 64]):
+        path = cache.put(key, b'1234')
+        os.utime(path, (index, index))
+    cache.prune()
+
+    assert cache.open('a' * 64) is None
+    for key in ['b' * 64, 'c' * 64]:
+        with cache.open(key) as audio_file:
+            assert audio_file.read() == b'1234'
+
+
+def test_phrases_differ_by_voice_and_rate():
+    keys = {AudioCache.make_key('hello', voice, rate) for voice, rate in [(None, None), ('en', None), (None, 150)]}
+    assert len(keys) == 3
+
+
+def test_synthesizer_renders_each_phrase_once(tmp_path):
+    engines = []
+
+    def create_engine(voice=None, rate=None):
+        engines.append(StubTtsEngine(latency_ms=0))
+        return engines[-1]
+
+    synthesizer = SpeechSynthesizer(queue_size=4, timeout_seconds=5, cache=AudioCache(tmp_path, 1024 * 1024),
+                                    engine_factory=create_engine)
+    audio = synthesizer.synthesize('take off')
+    # a phrase queued again before its audio was looked up is answered from the cache on the synthesis thread
+    assert synthesizer.synthesize('take off') == audio
+    with synthesizer.get_cached('take off') as audio_file:
+        assert audio_file.read() == audio
+
+    assert synthesizer.synthesized == 1 and len(engines) == 1
+    with wave.open(io.BytesIO(audio), 'rb') as wav:
+        assert wav.getframerate() == StubTtsEngine.SAMPLE_RATE and wav.getnframes() > 0
+
+
+@pytest.fixture
+def stub_voice_generation(tmp_path, monkeypatch):
+    monkeypatch.setattr(voice_generation, '_synthesizer', None)
+    with override_settings(VOICE_GENERATION={'ENGINE': STUB_ALGORITHM, 'CACHE_DIR': str(tmp_path),
+                                             'CHUNK_BYTES': 1024}):
+        yield
+
+
+def test_repeated_phrases_are_streamed_from_the_cache(stub_voice_generation):
+    client = Client()
+    first = client.post(GENERATE_VOICE_URL, {'text': 'Battery   low'})
+    second = client.post(GENERATE_VOICE_URL, {'text': 'Battery low'})
+
+    assert first.status_code == second.status_code == 200
+    assert first['Content-Type'] == second['Content-Type'] == 'audio/wav'
+    assert [first[CACHE_HEADER], second[CACHE_HEADER]] == ['MISS', 'HIT']
+    assert second.streaming and b''.join(second.streaming_content) == first.content
+
+
+def test_pcm_format_answers_the_samples_with_their_format(stub_voice_generation):
+    response = Client().post(GENERATE_VOICE_URL, {'text': 'Landing', 'audio_format': 'pcm'})
+
+    assert response.status_code == 200
+    assert response['X-Sample-Rate'] == str(StubTtsEngine.SAMPLE_RATE)
+    assert response['X-Channels'] == '1' and response['X-Sample-Width'] == '2'
+    assert len(response.content) == 2 * int(StubTtsEngine.SAMPLE_RATE * 0.06 * len('Landing'))
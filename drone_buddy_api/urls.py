@@ -21,12 +21,12 @@ from drf_yasg import openapi
 from rest_framework import permissions
 from rest_framework.routers import DefaultRouter
 
-from drone_buddy_api.views.face_recognition import FaceRecognitionView, FaceRecognitionRememberView
-from drone_buddy_api.views.hand_feature_extraction import HandFeatureExtractionView
-from drone_buddy_api.views.intent_recognition import IntentRecognitionView
-from drone_buddy_api.views.object_detection import DetectObjectsView
-from drone_buddy_api.views.text_recognition import TextRecognitionView
-from drone_buddy_api.views.voice_generation import VoiceGenerationView
+from drone_buddy_api.utils.atom_loading import LazyView, is_atom_enabled
+from drone_buddy_api.views.async_atoms import detect_objects_async, detect_objects_batch_async, \
+    recognize_face_async, recognize_hand_gesture_async, recognize_intent_async, recognize_intents_async, \
+    recognize_text_async, run_pipeline_async
+from drone_buddy_api.views.health import LivenessView, ReadinessView
+from drone_buddy_api.views.metrics import MetricsView
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -45,20 +45,70 @@ urlpatterns = [
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
     path('admin/', admin.site.urls),
 
-    path('atoms/object-detection/detect-objects/', DetectObjectsView.as_view(), name='detect_objects'),
-
-    path('atoms/face-recognition/recognize-face/', FaceRecognitionView.as_view(),
-         name='recognize_face'),
-    path('atoms/face-recognition/remember-face/', FaceRecognitionRememberView.as_view(),
-         name='remember_face'),
-    path('atoms/intent-recognition/recognize-intent/', IntentRecognitionView.as_view(),
-         name='recognize_intent'),
-    path('atoms/text-recognition/recognize-text/', TextRecognitionView.as_view(),
-         name='recognize_text'),
-    path('atoms/feature-recognition/recognize-hand-gesture/', HandFeatureExtractionView.as_view(),
-         name='recognize_hand_gesture'),
-    path('atoms/voice-generation/generate-voice/', VoiceGenerationView.as_view(),
-         name='generate_voice'),
+    path('health/live', LivenessView.as_view(), name='health_live'),
+    path('health/ready', ReadinessView.as_view(), name='health_ready'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 
     # path('atoms/object-detection/detect-objects', detect_objects, name='detect_objects'),
 ]
+
+
+def atom_routes(atom: str, routes: list) -> list:
+    """
+    The routes of an atom if this process serves it (ATOMS ENABLED). Atom views are LazyViews, imported with
+    their libraries on the first request; the async variants run on a bounded executor per atom type, use them
+    with an ASGI server.
+    """
+    return routes if is_atom_enabled(atom) else []
+
+
+urlpatterns += atom_routes('OBJECT_DETECTION', [
+    path('atoms/object-detection/detect-objects/',
+         LazyView('drone_buddy_api.views.object_detection.DetectObjectsView'), name='detect_objects'),
+    path('atoms/object-detection/detect-objects-batch/',
+         LazyView('drone_buddy_api.views.object_detection.DetectObjectsBatchView'), name='detect_objects_batch'),
+    path('atoms/async/object-detection/detect-objects/', detect_objects_async, name='detect_objects_async'),
+    path('atoms/async/object-detection/detect-objects-batch/', detect_objects_batch_async,
+         name='detect_objects_batch_async'),
+])
+urlpatterns += atom_routes('FACE_RECOGNITION', [
+    path('atoms/face-recognition/recognize-face/',
+         LazyView('drone_buddy_api.views.face_recognition.FaceRecognitionView'), name='recognize_face'),
+    path('atoms/face-recognition/remember-face/',
+         LazyView('drone_buddy_api.views.face_recognition.FaceRecognitionRememberView'), name='remember_face'),
+    path('atoms/face-recognition/remember-faces/',
+         LazyView('drone_buddy_api.views.face_recognition.FaceRecognitionBulkRememberView'),
+         name='remember_faces'),
+    path('atoms/async/face-recognition/recognize-face/', recognize_face_async, name='recognize_face_async'),
+])
+urlpatterns += atom_routes('INTENT_RECOGNITION', [
+    path('atoms/intent-recognition/recognize-intent/',
+         LazyView('drone_buddy_api.views.intent_recognition.IntentRecognitionView'), name='recognize_intent'),
+    path('atoms/intent-recognition/recognize-intents/',
+         LazyView('drone_buddy_api.views.intent_recognition.IntentRecognitionBatchView'),
+         name='recognize_intents'),
+    path('atoms/async/intent-recognition/recognize-intent/', recognize_intent_async,
+         name='recognize_intent_async'),
+    path('atoms/async/intent-recognition/recognize-intents/', recognize_intents_async,
+         name='recognize_intents_async'),
+])
+urlpatterns += atom_routes('TEXT_RECOGNITION', [
+    path('atoms/text-recognition/recognize-text/',
+         LazyView('drone_buddy_api.views.text_recognition.TextRecognitionView'), name='recognize_text'),
+    path('atoms/async/text-recognition/recognize-text/', recognize_text_async, name='recognize_text_async'),
+])
+urlpatterns += atom_routes('HAND_FEATURE_EXTRACTION', [
+    path('atoms/feature-recognition/recognize-hand-gesture/',
+         LazyView('drone_buddy_api.views.hand_feature_extraction.HandFeatureExtractionView'),
+         name='recognize_hand_gesture'),
+    path('atoms/async/feature-recognition/recognize-hand-gesture/', recognize_hand_gesture_async,
+         name='recognize_hand_gesture_async'),
+])
+urlpatterns += atom_routes('VOICE_GENERATION', [
+    path('atoms/voice-generation/generate-voice/',
+         LazyView('drone_buddy_api.views.voice_generation.VoiceGenerationView'), name='generate_voice'),
+])
+urlpatterns += atom_routes('PIPELINE', [
+    path('atoms/pipeline/', LazyView('drone_buddy_api.views.pipeline.PipelineView'), name='pipeline'),
+    path('atoms/async/pipeline/', run_pipeline_async, name='pipeline_async'),
+])
@@ -0,0 +1,291 @@
+import contextvars
+import functools
+import threading
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from rest_framework.response import Response
+
+from drone_buddy_api.views.enum import AtomType
+
+DEFAULT_ADAPTIVE_QUALITY_SETTINGS = {
+    'ENABLED': False,
+    # p95 latency of the vision atoms the levels are chosen for
+    'TARGET_P95_MS': 250,
+    # requests waiting for inference above which quality steps down regardless of latency
+    'MAX_QUEUE_DEPTH': 4,
+    # quality steps back up once p95 and queue depth are both below this share of their limit
+    'RECOVERY_RATIO': 0.6,
+    'WINDOW_SECONDS': 10,
+    'MIN_SAMPLES': 20,
+    'COOLDOWN_SECONDS': 5,
+    # level 0 is full quality, every further level is cheaper
+    'LEVELS': [
+        {},
+        {'max_side': 640},
+        {'max_side': 480, 'lighter_model': True},
+        {'max_side': 320, 'lighter_model': True, 'skip_frames': 1},
+    ],
+    # engine configurations merged into the request's on levels with lighter_model, per atom and algorithm
+    # name ('*' for any algorithm)
+    'LIGHTER_MODELS': {
+        AtomType.OBJECT_DETECTION.value: {'YOLO': {'OBJECT_DETECTION_YOLO_VERSION': 'yolov8n.pt'}},
+    },
+}
+
+QUALITY_HEADER = 'X-Quality-Level'
+
+# last results kept per client for skipped frames
+MAX_SKIP_STATES = 1024
+
+
+def get_adaptive_quality_settings() -> dict:
+    return {**DEFAULT_ADAPTIVE_QUALITY_SETTINGS, **getattr(settings, 'ADAPTIVE_QUALITY', {})}
+
+
+# the quality level chosen for the request being handled, None when adaptive quality is off
+current_quality_level = contextvars.ContextVar('current_quality_level', default=None)
+
+
+def read_queue_depth(atom: AtomType) -> int:
+    """
+    Requests of the atom's priority class waiting for the inference scheduler plus requests waiting for a
+    thread of the atom's executor.
+    """
+    from drone_buddy_api.utils.executors import ATOM_INFERENCE_POOLS, get_created_executors
+    from drone_buddy_api.utils.scheduler import get_scheduler_if_created
+
+    depth = 0
+    inference_scheduler = get_scheduler_if_created()
+    if inference_scheduler is not None:
+        depth += inference_scheduler.waiting(atom)
+    executor = get_created_executors().get(ATOM_INFERENCE_POOLS[atom])
+    if executor is not None:
+        depth += executor.queue_depth()
+    return depth
+
+
+class QualityController:
+    """
+    Chooses the quality level of one atom from the p95 latency of its recent requests and the depth of its
+    queues. Quality steps down one level when the p95 is over the target or the queue is too deep, and back up
+    once both are comfortably below (or requests became too rare to measure), at most one step per cooldown.
+    The window restarts on every step so each decision is made on requests served at the current level.
+    """
+
+    def __init__(self, atom: AtomType, levels: list, target_p95_seconds: float, max_queue_depth: int,
+                 recovery_ratio: float, window_seconds: float, min_samples: int, cooldown_seconds: float,
+                 queue_depth=read_queue_depth):
+        self.atom = atom
+        self.levels = levels
+        self.target_p95_seconds = target_p95_seconds
+        self.max_queue_depth = max_queue_depth
+        self.recovery_ratio = recovery_ratio
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.cooldown_seconds = cooldown_seconds
+        self.queue_depth = queue_depth
+        self.level = 0
+        self.changes = 0
+        self._latencies = deque()
+        self._last_change = time.monotonic()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, atom: AtomType):
+        quality_settings = get_adaptive_quality_settings()
+        return cls(atom, quality_settings['LEVELS'], quality_settings['TARGET_P95_MS'] / 1000.0,
+                   quality_settings['MAX_QUEUE_DEPTH'], quality_settings['RECOVERY_RATIO'],
+                   quality_settings['WINDOW_SECONDS'], quality_settings['MIN_SAMPLES'],
+                   quality_settings['COOLDOWN_SECONDS'])
+
+    def record(self, latency_seconds: float):
+        now = time.monotonic()
+        with self._lock:
+            self._latencies.append((now, latency_seconds))
+
+    def p95_seconds(self, now: float):
+        # called with the lock held
+        while self._latencies and self._latencies[0][0] < now - self.window_seconds:
+            self._latencies.popleft()
+        if len(self._latencies) < self.min_samples:
+            return None
+        latencies = sorted(latency for _, latency in self._latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    def choose_level(self) -> int:
+        """
+        Returns the level for the next request, stepping down or up first when it is time to.
+        """
+        now = time.monotonic()
+        queue_depth = self.queue_depth(self.atom)
+        with self._lock:
+            if now - self._last_change < self.cooldown_seconds:
+                return self.level
+            p95_seconds = self.p95_seconds(now)
+            overloaded = queue_depth > self.max_queue_depth or \
+                (p95_seconds is not None and p95_seconds > self.target_p95_seconds)
+            if p95_seconds is None:
+                # fewer than MIN_SAMPLES requests in a whole window since the last step is no load at all
+                relieved = now - self._last_change >= self.window_seconds
+            else:
+                relieved = p95_seconds < self.target_p95_seconds * self.recovery_ratio
+            relieved = relieved and queue_depth <= self.max_queue_depth * self.recovery_ratio
+            if overloaded and self.level < len(self.levels) - 1:
+                self._change_level(self.level + 1, now)
+            elif relieved and self.level > 0:
+                self._change_level(self.level - 1, now)
+            return self.level
+
+    def _change_level(self, level: int, now: float):
+        self.level = level
+        self.changes += 1
+        self._last_change = now
+        self._latencies.clear()
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get_quality_controller(atom: AtomType) -> QualityController:
+    with _controllers_lock:
+        controller = _controllers.get(atom)
+        if controller is None:
+            controller = QualityController.from_settings(atom)
+            _controllers[atom] = controller
+    return controller
+
+
+def get_level_settings() -> dict:
+    level = current_quality_level.get()
+    if level is None:
+        return {}
+    return get_adaptive_quality_settings()['LEVELS'][level]
+
+
+def adapt_preprocessing(validated_data: dict) -> dict:
+    """
+    Returns the preprocessing fields with the max_side of the current quality level, the smaller one of the
+    request and the level. Results are still reported in original image coordinates.
+    """
+    level_max_side = get_level_settings().get('max_side')
+    if not level_max_side:
+        return validated_data
+    max_side = validated_data.get('max_side')
+    return {**validated_data, 'max_side': min(max_side, level_max_side) if max_side else level_max_side}
+
+
+def adapt_engine_configurations(atom: AtomType, algorithm_name, engine_configurations):
+    """
+    Returns the engine configurations with the lighter model variant of the algorithm merged in on levels
+    that ask for it, unchanged when no variant is configured.
+    """
+    if not get_level_settings().get('lighter_model') or not isinstance(engine_configurations, dict):
+        return engine_configurations
+    lighter_models = get_adaptive_quality_settings()['LIGHTER_MODELS'].get(atom.value, {})
+    lighter_model = lighter_models.get(algorithm_name) or lighter_models.get('*')
+    return {**engine_configurations, **lighter_model} if lighter_model else engine_configurations
+
+
+class SkippedFrames:
+    """
+    Frames counted per client and endpoint (with the algorithm), with the last result, returned for skipped frames.
+    """
+
+    def __init__(self, max_entries: int = MAX_SKIP_STATES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def should_skip(self, key: tuple, skip_frames: int):
+        """
+        Returns the last result of the key when this frame is to be skipped, else None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            entry[0] += 1
+            if entry[0] % (skip_frames + 1) == 0:
+                return None
+            return entry[1]
+
+    def remember(self, key: tuple, data):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = [0, data]
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                entry[1] = data
+
+
+_skipped_frames = SkippedFrames()
+
+
+def get_client_id(request):
+    """
+    Returns the client id the client sent, or None. Addresses are not used, clients behind the same NAT or proxy
+    would be answered with each other's results.
+    """
+    from drone_buddy_api.utils.scheduler import current_request_schedule, get_scheduler_settings
+
+    schedule = current_request_schedule.get()
+    if schedule is not None:
+        return schedule.client_id if schedule.explicit_client_id else None
+    return request.headers.get(get_scheduler_settings()['CLIENT_ID_HEADER']) or None
+
+
+def adaptive_quality(atom: AtomType, unadapted_fields: tuple = ()):
+    """
+    Runs the view at the quality level chosen for the atom when ADAPTIVE_QUALITY is enabled: the view reads
+    the level through adapt_preprocessing and adapt_engine_configurations, levels with skip_frames answer
+    all but every (skip_frames + 1)-th frame of a client that sent a client id with its last result.
+    Successful responses report the level under ``quality`` and in an X-Quality-Level header. Requests with any of the
+    ``unadapted_fields``, e.g. ones that depend on state kept between frames, always run at full quality.
+    """
+
+    def decorator(post):
+        @functools.wraps(post)
+        def wrapper(self, request, *args, **kwargs):
+            if (not get_adaptive_quality_settings()['ENABLED']
+                    or any(field in request.data for field in unadapted_fields)):
+                return post(self, request, *args, **kwargs)
+
+            controller = get_quality_controller(atom)
+            level = controller.choose_level()
+            level_settings = controller.levels[level]
+            quality = {'level': level, 'max_side': level_settings.get('max_side'),
+                       'lighter_model': bool(level_settings.get('lighter_model')), 'skipped': False}
+            client_id = get_client_id(request)
+            skip_key = (client_id, request.get_full_path())
+            # frames are only skipped for clients that identify themselves
+            skip_frames = level_settings.get('skip_frames') if client_id is not None else None
+            last_data = _skipped_frames.should_skip(skip_key, skip_frames) if skip_frames else None
+            if last_data is not None:
+                response = Response({**last_data, 'quality': {**quality, 'skipped': True}})
+                response[QUALITY_HEADER] = str(level)
+                return response
+
+            token = current_quality_level.set(level)
+            started = time.perf_counter()
+            try:
+                response = post(self, request, *args, **kwargs)
+            finally:
+                current_quality_level.reset(token)
+            if response.status_code != 200 or not isinstance(response.data, dict):
+                return response
+            controller.record(time.perf_counter() - started)
+            if client_id is not None:
+                _skipped_frames.remember(skip_key, response.data)
+            response.data['quality'] = quality
+            response[QUALITY_HEADER] = str(level)
+            return response
+
+        return wrapper
+
+    return decorator
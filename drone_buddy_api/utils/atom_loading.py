@@ -0,0 +1,95 @@
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+DEFAULT_ATOMS_SETTINGS = {
+    'ENABLED': None,
+    'IMPORT_BUDGET_MS': 2000,
+}
+
+# the view modules of every atom, importing one loads dronebuddylib and the model libraries of the atom
+ATOM_VIEW_MODULES = {
+    'OBJECT_DETECTION': 'drone_buddy_api.views.object_detection',
+    'FACE_RECOGNITION': 'drone_buddy_api.views.face_recognition',
+    'HAND_FEATURE_EXTRACTION': 'drone_buddy_api.views.hand_feature_extraction',
+    'INTENT_RECOGNITION': 'drone_buddy_api.views.intent_recognition',
+    'TEXT_RECOGNITION': 'drone_buddy_api.views.text_recognition',
+    'VOICE_GENERATION': 'drone_buddy_api.views.voice_generation',
+    'PIPELINE': 'drone_buddy_api.views.pipeline',
+}
+
+
+def get_atoms_settings() -> dict:
+    return {**DEFAULT_ATOMS_SETTINGS, **getattr(settings, 'ATOMS', {})}
+
+
+def is_atom_enabled(atom: str) -> bool:
+    """
+    Whether this process serves the atom (an AtomType value, or VOICE_GENERATION), all atoms by default.
+    """
+    enabled = get_atoms_settings()['ENABLED']
+    return enabled is None or atom in enabled
+
+
+class LazyView:
+    """
+    Stands in for a view, or any other callable such as an ASGI endpoint, given by its dotted path, and
+    imports it on the first call. Routes of atoms that are never requested thus never import the view module,
+    dronebuddylib and the model libraries behind it. APIView classes are turned into views with as_view().
+    Other attributes (``csrf_exempt``, ``cls`` for the schema generator, ...) are read from the real view,
+    which imports it as well.
+    """
+
+    def __init__(self, dotted_path: str):
+        self.dotted_path = dotted_path
+        # what Django reports as the view without importing it, e.g. URLPattern.lookup_str
+        self.__module__, _, self.__qualname__ = dotted_path.rpartition('.')
+        self.__name__ = self.__qualname__
+        self._view = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._view is None:
+            with self._lock:
+                if self._view is None:
+                    view = import_string(self.dotted_path)
+                    if isinstance(view, type) and hasattr(view, 'as_view'):
+                        view = view.as_view()
+                    self._view = view
+        return self._view
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._view is not None
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+    def __getattr__(self, name):
+        # only reached for attributes the proxy does not have itself. view_class is looked up by reverse() for
+        # every route, the dotted path set above stands in for it
+        if name.startswith('__') or name in ('_view', '_lock', 'dotted_path', 'view_class'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __repr__(self):
+        return '<LazyView ' + self.dotted_path + ('' if self.is_loaded else ' (not loaded)') + '>'
+
+
+class LazyLogger:
+    """
+    The dronebuddylib Logger, created on first use. Importing anything from dronebuddylib imports all of its
+    atoms, which the modules loaded at startup must not do.
+    """
+
+    def __init__(self):
+        self._logger = None
+
+    def __getattr__(self, name):
+        if name == '_logger':
+            raise AttributeError(name)
+        if self._logger is None:
+            from dronebuddylib.utils.logger import Logger
+            self._logger = Logger()
+        return getattr(self._logger, name)
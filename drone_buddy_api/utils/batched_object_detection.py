@@ -0,0 +1,121 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.conf import settings
+from dronebuddylib.atoms.objectdetection.detected_object import BoundingBox, DetectedObject, ObjectDetectionResult
+
+from drone_buddy_api.utils.engine_pool import get_engine_pool, make_engine_key
+from drone_buddy_api.utils.exceptions import EngineBusyException
+from drone_buddy_api.utils.inference_workers import get_inference_client, uses_inference_workers
+from drone_buddy_api.utils.metrics import PHASE_INFERENCE, timed_phase
+from drone_buddy_api.utils.micro_batcher import MicroBatcher
+from drone_buddy_api.utils.scheduler import get_scheduler
+from drone_buddy_api.views.enum import AtomType
+
+DEFAULT_OBJECT_DETECTION_BATCHING_SETTINGS = {
+    'ENABLED': False,
+    'MAX_BATCH_SIZE': 8,
+    'MAX_WAIT_MS': 10,
+    # batchers kept, one per engine key; idle ones stop their thread after IDLE_SECONDS
+    'MAX_BATCHERS': 16,
+    'IDLE_SECONDS': 60,
+    # longest wait of a request for the result of its batch
+    'RESULT_TIMEOUT_SECONDS': 30,
+}
+
+
+def get_batching_settings() -> dict:
+    return {**DEFAULT_OBJECT_DETECTION_BATCHING_SETTINGS, **getattr(settings, 'OBJECT_DETECTION_BATCHING', {})}
+
+
+def yolo_results_to_object_detection_result(result, object_names) -> ObjectDetectionResult:
+    detected_objects = []
+    detected_names = []
+    boxes = result.boxes
+    for cls, confidence, (x1, y1, x2, y2) in zip(boxes.cls.tolist(), boxes.conf.tolist(), boxes.xyxy.tolist()):
+        name = object_names[int(cls)]
+        detected = DetectedObject([], BoundingBox(x1, y1, x2 - x1, y2 - y1))
+        detected.add_category(name, confidence)
+        detected_objects.append(detected)
+        detected_names.append(name)
+    return ObjectDetectionResult(detected_names, detected_objects)
+
+
+def get_detected_objects_batch(engine, frames: list) -> list:
+    """
+    Runs object detection on several frames. YOLO engines get all frames of a real batch in a single predict
+    call on the detector of the dronebuddylib engine, a single frame and other algorithms go through
+    get_detected_objects of the engine, one call per frame, so that their results are the library's own.
+    """
+    vision_engine = getattr(engine, 'vision_engine', None)
+    detector = getattr(vision_engine, 'detector', None)
+    if len(frames) > 1 and detector is not None and hasattr(detector, 'predict'):
+        results = detector.predict(source=list(frames), verbose=False)
+        return [yolo_results_to_object_detection_result(result, vision_engine.object_names) for result in results]
+    return [engine.get_detected_objects(frame) for frame in frames]
+
+
+def detect_objects_batch(algorithm_name, engine_configurations, frames: list) -> list:
+    max_batch_size = get_batching_settings()['MAX_BATCH_SIZE']
+    results = []
+    with get_engine_pool().acquire(AtomType.OBJECT_DETECTION, algorithm_name, engine_configurations,
+                                   units=len(frames)) as engine:
+        for start in range(0, len(frames), max_batch_size):
+            results.extend(get_detected_objects_batch(engine, frames[start:start + max_batch_size]))
+    return results
+
+
+_batchers = OrderedDict()
+_batchers_lock = threading.Lock()
+
+
+def get_object_detection_batcher(algorithm_name, engine_configurations) -> MicroBatcher:
+    """
+    Returns the micro batcher that coalesces single frame requests for one algorithm and configuration. At most
+    MAX_BATCHERS are kept, the least recently used idle ones are forgotten first, so configurations sent by
+    clients cannot pile up batchers and threads.
+    """
+    key = make_engine_key(AtomType.OBJECT_DETECTION, algorithm_name, engine_configurations)
+    batching_settings = get_batching_settings()
+    with _batchers_lock:
+        batcher = _batchers.get(key)
+        if batcher is not None:
+            _batchers.move_to_end(key)
+            return batcher
+        batcher = MicroBatcher(
+            lambda frames: detect_objects_batch(algorithm_name, engine_configurations, frames),
+            max_batch_size=batching_settings['MAX_BATCH_SIZE'],
+            max_wait_seconds=batching_settings['MAX_WAIT_MS'] / 1000.0,
+            name='object-detection-batcher', idle_seconds=batching_settings['IDLE_SECONDS'])
+        _batchers[key] = batcher
+        while len(_batchers) > batching_settings['MAX_BATCHERS']:
+            idle_key = next((other for other, other_batcher in _batchers.items()
+                             if other != key and other_batcher.is_idle()), None)
+            if idle_key is None:
+                # a busy one finishes its queued frames, its thread exits once idle
+                _batchers.popitem(last=False)
+            else:
+                del _batchers[idle_key]
+    return batcher
+
+
+def detect_objects(algorithm_name, engine_configurations, frame) -> ObjectDetectionResult:
+    """
+    Runs object detection on a single frame, in an inference worker when they are enabled for the atom,
+    otherwise coalesced with concurrent frames for the same engine into one batch when batching is enabled.
+    """
+    if uses_inference_workers(AtomType.OBJECT_DETECTION):
+        return get_inference_client().run(AtomType.OBJECT_DETECTION, algorithm_name, engine_configurations, frame)
+    if get_batching_settings()['ENABLED']:
+        # the batch runs on the batcher thread, the wait for it is the inference time of this request
+        key = make_engine_key(AtomType.OBJECT_DETECTION, algorithm_name, engine_configurations)
+        with get_scheduler().slot(AtomType.OBJECT_DETECTION, key), timed_phase(PHASE_INFERENCE):
+            future = get_object_detection_batcher(algorithm_name, engine_configurations).submit(frame)
+            try:
+                return future.result(timeout=get_batching_settings()['RESULT_TIMEOUT_SECONDS'])
+            except FutureTimeoutError:
+                raise EngineBusyException('The batch of the frame did not finish in time, try again later.')
+    with get_engine_pool().acquire(AtomType.OBJECT_DETECTION, algorithm_name, engine_configurations) as engine:
+        # same path as a batch of one, so YOLO results carry their boxes whether batching is enabled or not
+        return get_detected_objects_batch(engine, [frame])[0]
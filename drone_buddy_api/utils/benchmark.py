@@ -0,0 +1,228 @@
+import json
+import math
+import threading
+import time
+import wave
+
+import cv2
+import numpy as np
+from django.conf import settings
+from dronebuddylib.atoms.objectdetection.detected_object import BoundingBox, DetectedObject, ObjectDetectionResult
+
+from drone_buddy_api.utils.engine_pool import get_resident_memory_bytes
+
+DEFAULT_BENCHMARK_SETTINGS = {
+    'STUB_LATENCY_MS': 20,
+    'STUB_OBJECTS': 5,
+    'BASELINE_PATH': None,
+    # relative slack before a scenario counts as a regression against the baseline
+    'TOLERANCE': 0.2,
+}
+
+# algorithm name of the offline stand-in engines of object detection and face recognition
+STUB_ALGORITHM = 'STUB'
+
+
+def get_benchmark_settings() -> dict:
+    return {**DEFAULT_BENCHMARK_SETTINGS, **getattr(settings, 'BENCHMARK', {})}
+
+
+def synthetic_image(width: int = 640, height: int = 480, seed: int = 0) -> bytes:
+    """
+    Returns a JPEG with noise, shapes and a line of text, different for every seed, so that requests are not
+    answered from the result cache and the text recognition stand-in finds words.
+    """
+    random = np.random.default_rng(seed)
+    image = random.integers(96, 160, (height, width, 3), dtype=np.uint8)
+    for _ in range(6):
+        x, y = int(random.integers(0, width - 40)), int(random.integers(0, height - 40))
+        color = tuple(int(value) for value in random.integers(0, 256, 3))
+        cv2.rectangle(image, (x, y), (x + int(random.integers(20, 120)), y + int(random.integers(20, 120))),
+                      color, -1)
+    cv2.putText(image, 'DRONE ' + str(seed), (20, height - 30), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (0, 0, 0), 3)
+    return cv2.imencode('.jpg', image)[1].tobytes()
+
+
+class StubObjectDetectionEngine:
+    """
+    Stand-in for the object detection engines: waits ``latency_ms`` to model inference and reports
+    ``objects`` boxes spread over the frame, so the whole request path can be measured without model weights.
+    """
+
+    def __init__(self, latency_ms: float = 20, objects: int = 5):
+        self.latency_ms = latency_ms
+        self.objects = objects
+
+    @classmethod
+    def from_settings(cls):
+        benchmark_settings = get_benchmark_settings()
+        return cls(benchmark_settings['STUB_LATENCY_MS'], benchmark_settings['STUB_OBJECTS'])
+
+    def get_detected_objects(self, frame) -> ObjectDetectionResult:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        height, width = frame.shape[:2]
+        detected_objects = []
+        for index in range(self.objects):
+            detected_object = DetectedObject([], BoundingBox(width * index / (self.objects + 1.0), height / 4.0,
+                                                             width / (self.objects + 1.0), height / 2.0))
+            detected_object.add_category('person', 0.9 - index * 0.05)
+            detected_objects.append(detected_object)
+        return ObjectDetectionResult(['person'] * self.objects, detected_objects)
+
+
+class StubFaceRecognitionEngine:
+    """
+    Stand-in for the face recognition engines: waits ``latency_ms`` and recognizes nobody.
+    """
+
+    def __init__(self, latency_ms: float = 20):
+        self.latency_ms = latency_ms
+
+    @classmethod
+    def from_settings(cls):
+        return cls(get_benchmark_settings()['STUB_LATENCY_MS'])
+
+    def recognize_face(self, frame) -> list:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        return ['Unknown']
+
+    def remember_face(self, image_path, person_name) -> bool:
+        return True
+
+
+class StubTtsEngine:
+    """
+    Stand-in for a pyttsx3 engine that renders a short silent WAV per phrase after ``latency_ms``, used where
+    no speech driver is installed.
+    """
+    SAMPLE_RATE = 16000
+
+    def __init__(self, latency_ms: float = 20):
+        self.latency_ms = latency_ms
+        self._pending = []
+
+    def setProperty(self, name, value):
+        pass
+
+    def save_to_file(self, text: str, path: str):
+        self._pending.append((text, path))
+
+    def runAndWait(self):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        for text, path in self._pending:
+            with wave.open(path, 'wb') as audio_file:
+                audio_file.setnchannels(1)
+                audio_file.setsampwidth(2)
+                audio_file.setframerate(self.SAMPLE_RATE)
+                # about as long as the phrase would take to say
+                audio_file.writeframes(b'\0\0' * int(self.SAMPLE_RATE * 0.06 * len(text)))
+        self._pending = []
+
+
+def create_stub_tts_engine(voice=None, rate=None) -> StubTtsEngine:
+    return StubTtsEngine(get_benchmark_settings()['STUB_LATENCY_MS'])
+
+
+class PeakMemorySampler:
+    """
+    Samples the resident set size of the process on a background thread while in use and keeps the peak.
+    """
+
+    def __init__(self, interval_seconds: float = 0.01):
+        self.interval_seconds = interval_seconds
+        self.peak_bytes = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.peak_bytes = max(self.peak_bytes, get_resident_memory_bytes())
+            self._stopped.wait(self.interval_seconds)
+
+    def __enter__(self):
+        self.peak_bytes = get_resident_memory_bytes()
+        self._thread = threading.Thread(target=self._run, name='benchmark-memory-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+        self.peak_bytes = max(self.peak_bytes, get_resident_memory_bytes())
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    """
+    Linear interpolation between the closest ranks, like numpy.percentile.
+    """
+    if not sorted_values:
+        return None
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(math.floor(position))
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def summarize(latencies: list, errors: int, elapsed_seconds: float, peak_rss_bytes: int) -> dict:
+    """
+    Summarizes the latencies (seconds) of the successful requests of one scenario. Latencies are None when
+    every request failed, the peak RSS when it is unknown.
+    """
+    latencies_ms = sorted(latency * 1000.0 for latency in latencies)
+    summary = {
+        'requests': len(latencies) + errors,
+        'errors': errors,
+        'throughput_rps': round(len(latencies) / elapsed_seconds, 2) if elapsed_seconds > 0 else 0.0,
+        'p50_ms': None,
+        'p95_ms': None,
+        'p99_ms': None,
+        'mean_ms': None,
+        'max_ms': None,
+        'peak_rss_mb': round(peak_rss_bytes / (1024.0 * 1024.0), 1) if peak_rss_bytes else None,
+    }
+    if latencies_ms:
+        summary.update({
+            'p50_ms': round(percentile(latencies_ms, 0.50), 3),
+            'p95_ms': round(percentile(latencies_ms, 0.95), 3),
+            'p99_ms': round(percentile(latencies_ms, 0.99), 3),
+            'mean_ms': round(sum(latencies_ms) / len(latencies_ms), 3),
+            'max_ms': round(latencies_ms[-1], 3),
+        })
+    return summary
+
+
+def read_baseline(path) -> dict:
+    with open(path, 'r') as baseline_file:
+        return json.load(baseline_file)
+
+
+def write_baseline(path, report: dict):
+    with open(path, 'w') as baseline_file:
+        json.dump(report, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write('\n')
+
+
+def compare_to_baseline(report: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Returns a description of every regression of the report against the baseline: a p95 or p99 latency or
+    a peak RSS more than ``tolerance`` above the baseline, a throughput more than ``tolerance`` below it, or
+    errors where there were none. Scenarios missing from either side are skipped.
+    """
+    regressions = []
+    for name, result in sorted(report['scenarios'].items()):
+        reference = baseline.get('scenarios', {}).get(name)
+        if reference is None:
+            continue
+        for metric in ('p95_ms', 'p99_ms', 'peak_rss_mb'):
+            if result.get(metric) is not None and reference.get(metric) and \
+                    result[metric] > reference[metric] * (1.0 + tolerance):
+                regressions.append('{} {} {} > {} (baseline)'.format(name, metric, result[metric], reference[metric]))
+        if result['throughput_rps'] < reference['throughput_rps'] * (1.0 - tolerance):
+            regressions.append('{} throughput_rps {} < {} (baseline)'.format(name, result['throughput_rps'],
+                                                                             reference['throughput_rps']))
+        if result['errors'] and not reference['errors']:
+            regressions.append('{} errors {} (baseline 0)'.format(name, result['errors']))
+    return regressions
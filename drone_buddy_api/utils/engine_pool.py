@@ -0,0 +1,272 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from drone_buddy_api.utils.atom_loading import LazyLogger
+from drone_buddy_api.utils.exceptions import EngineBusyException
+from drone_buddy_api.utils.metrics import PHASE_ACQUIRE, PHASE_CONSTRUCT, PHASE_INFERENCE, timed_phase
+from drone_buddy_api.utils.scheduler import get_scheduler
+from drone_buddy_api.views.enum import AtomType
+
+# the engine pool is loaded at startup, dronebuddylib only with the first engine
+logger = LazyLogger()
+
+DEFAULT_ENGINE_POOL_SETTINGS = {
+    'MAX_ENGINES': 8,
+    'IDLE_TIMEOUT_SECONDS': 900,
+    'MAX_MEMORY_MB': 4096,
+    'MAX_CONCURRENCY_PER_ENGINE': 1,
+    'ACQUIRE_TIMEOUT_SECONDS': 30,
+}
+
+
+def canonicalize_engine_configurations(engine_configurations):
+    """
+    Returns a stable string representation of the engine configurations, independent of key order.
+    """
+    return json.dumps(engine_configurations, sort_keys=True, separators=(',', ':'), default=str)
+
+
+def make_engine_key(atom: AtomType, algorithm_name, engine_configurations) -> tuple:
+    configurations_hash = hashlib.sha256(
+        canonicalize_engine_configurations(engine_configurations).encode('utf-8')).hexdigest()
+    return atom.value, str(algorithm_name), configurations_hash
+
+
+def create_engine(atom: AtomType, algorithm_name, engine_configurations):
+    """
+    Builds a new dronebuddylib engine for the given atom. Imports are kept local so that
+    only the libraries of the atoms that are actually used get loaded.
+    """
+    from dronebuddylib.models import EngineConfigurations
+
+    engine_configs = EngineConfigurations(copy.deepcopy(engine_configurations))
+    if atom == AtomType.OBJECT_DETECTION:
+        from drone_buddy_api.utils.benchmark import STUB_ALGORITHM, StubObjectDetectionEngine
+        if algorithm_name == STUB_ALGORITHM:
+            return StubObjectDetectionEngine.from_settings()
+        from dronebuddylib import ObjectDetectionEngine
+        return ObjectDetectionEngine(algorithm_name, engine_configs)
+    elif atom == AtomType.FACE_RECOGNITION:
+        from drone_buddy_api.utils.benchmark import STUB_ALGORITHM, StubFaceRecognitionEngine
+        if algorithm_name == STUB_ALGORITHM:
+            return StubFaceRecognitionEngine.from_settings()
+        from dronebuddylib import FaceRecognitionEngine
+        return FaceRecognitionEngine(algorithm_name, engine_configs)
+    elif atom == AtomType.HAND_FEATURE_EXTRACTION:
+        from drone_buddy_api.utils.gesture_tracking import PooledHandFeatureExtraction
+        return PooledHandFeatureExtraction.create(copy.deepcopy(engine_configurations))
+    elif atom == AtomType.INTENT_RECOGNITION:
+        from drone_buddy_api.utils.intent_recognition import MOCK_ALGORITHM, MockIntentRecognitionEngine
+        if algorithm_name == MOCK_ALGORITHM:
+            return MockIntentRecognitionEngine.from_settings()
+        from dronebuddylib import IntentRecognitionEngine
+        return IntentRecognitionEngine(algorithm_name, engine_configs)
+    elif atom == AtomType.TEXT_RECOGNITION:
+        from drone_buddy_api.utils.text_recognition import LOCAL_ALGORITHM, LocalTextRecognitionEngine
+        if algorithm_name == LOCAL_ALGORITHM:
+            return LocalTextRecognitionEngine.from_settings()
+        from dronebuddylib import TextRecognitionEngine
+        return TextRecognitionEngine(algorithm_name, engine_configs)
+    raise ValueError('Unsupported atom : ' + str(atom))
+
+
+def get_resident_memory_bytes() -> int:
+    """
+    Returns the resident set size of the current process, or 0 where /proc is not available.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+class PooledEngine:
+    def __init__(self, key: tuple, engine, max_concurrency: int, memory_bytes: int):
+        self.key = key
+        self.engine = engine
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.memory_bytes = memory_bytes
+        self.last_used = time.monotonic()
+        self.users = 0
+        self.pinned = False
+
+
+class EnginePool:
+    """
+    Process wide cache of constructed engines, keyed by atom, algorithm and the canonical hash of the
+    engine configurations. Engines are evicted least recently used first once the pool is over its size
+    or memory budget, or when they have been idle for too long. Engines that are in use or pinned are never
+    evicted. The memory of an engine is the growth of the resident memory of the process while it was
+    constructed; constructions are measured one at a time, but memory allocated meanwhile by requests running
+    on other engines still counts, so the budget is an estimate.
+    """
+
+    def __init__(self, max_engines: int, idle_timeout_seconds: float, max_memory_bytes: int,
+                 max_concurrency_per_engine: int, acquire_timeout_seconds: float, factory=create_engine):
+        self.max_engines = max_engines
+        self.idle_timeout_seconds = idle_timeout_seconds
+        self.max_memory_bytes = max_memory_bytes
+        self.max_concurrency_per_engine = max_concurrency_per_engine
+        self.acquire_timeout_seconds = acquire_timeout_seconds
+        self.factory = factory
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._construction_locks = {}
+        self._measure_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        pool_settings = {**DEFAULT_ENGINE_POOL_SETTINGS, **getattr(settings, 'ENGINE_POOL', {})}
+        return cls(max_engines=pool_settings['MAX_ENGINES'],
+                   idle_timeout_seconds=pool_settings['IDLE_TIMEOUT_SECONDS'],
+                   max_memory_bytes=pool_settings['MAX_MEMORY_MB'] * 1024 * 1024,
+                   max_concurrency_per_engine=pool_settings['MAX_CONCURRENCY_PER_ENGINE'],
+                   acquire_timeout_seconds=pool_settings['ACQUIRE_TIMEOUT_SECONDS'])
+
+    @contextmanager
+    def acquire(self, atom: AtomType, algorithm_name, engine_configurations, units: int = 1):
+        """
+        Yields a warm engine for exclusive use (up to the per engine concurrency limit) by the caller, who runs
+        ``units`` frames on it.
+
+        Raises:
+            EngineBusyException: if no slot on the engine became free within the acquire timeout.
+            DeadlineExceededException: if the scheduler dropped the request, see InferenceScheduler.slot.
+        """
+        key = make_engine_key(atom, algorithm_name, engine_configurations)
+        # constructed before the scheduler slot is taken, so that construction neither holds a slot nor counts
+        # in the estimated service time of the engine
+        entry = self._checkout(key, atom, algorithm_name, engine_configurations)
+        try:
+            # the scheduler lets at most max_concurrency_per_engine requests of an engine through at once
+            with get_scheduler().slot(atom, key, self.max_concurrency_per_engine, units):
+                with timed_phase(PHASE_ACQUIRE):
+                    acquired = entry.semaphore.acquire(timeout=self.acquire_timeout_seconds)
+                if not acquired:
+                    raise EngineBusyException()
+                try:
+                    # the caller runs inference on the engine while it holds it
+                    with timed_phase(PHASE_INFERENCE):
+                        yield entry.engine
+                finally:
+                    entry.semaphore.release()
+        finally:
+            self._checkin(entry)
+
+    def pin(self, atom: AtomType, algorithm_name, engine_configurations):
+        """
+        Constructs the engine if needed and keeps it for the lifetime of the process, e.g. engines loaded in
+        the gunicorn master that the workers share.
+        """
+        key = make_engine_key(atom, algorithm_name, engine_configurations)
+        entry = self._checkout(key, atom, algorithm_name, engine_configurations)
+        with self._lock:
+            entry.pinned = True
+        self._checkin(entry)
+        return entry.engine
+
+    def _checkout(self, key, atom, algorithm_name, engine_configurations) -> PooledEngine:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                entry.users += 1
+                self._entries.move_to_end(key)
+                return entry
+            construction_lock = self._construction_locks.setdefault(key, threading.Lock())
+
+        # construct outside the pool lock so that other engines stay usable, but only once per key
+        with construction_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self.hits += 1
+                    entry.users += 1
+                    self._entries.move_to_end(key)
+                    return entry
+
+            logger.log_info("engine_pool", 'Creating engine : ' + atom.value + ' : ' + str(algorithm_name))
+            # one construction at a time, so that concurrent constructions do not count each other's memory
+            with timed_phase(PHASE_CONSTRUCT), self._measure_lock:
+                memory_before = get_resident_memory_bytes()
+                engine = self.factory(atom, algorithm_name, engine_configurations)
+                memory_bytes = max(get_resident_memory_bytes() - memory_before, 0)
+
+            with self._lock:
+                self.misses += 1
+                entry = PooledEngine(key, engine, self.max_concurrency_per_engine, memory_bytes)
+                entry.users += 1
+                self._entries[key] = entry
+                self._construction_locks.pop(key, None)
+        self.evict()
+        return entry
+
+    def _checkin(self, entry: PooledEngine):
+        with self._lock:
+            entry.users -= 1
+            entry.last_used = time.monotonic()
+        self.evict()
+
+    def evict(self):
+        """
+        Drops idle engines that exceed the idle timeout, the engine count or the memory ceiling.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.users == 0 and not entry.pinned and now - entry.last_used > self.idle_timeout_seconds:
+                    self._remove(key)
+
+            for key, entry in list(self._entries.items()):
+                if len(self._entries) <= self.max_engines and self.memory_bytes() <= self.max_memory_bytes:
+                    break
+                if entry.users == 0 and not entry.pinned:
+                    self._remove(key)
+
+    def memory_bytes(self) -> int:
+        return sum(entry.memory_bytes for entry in self._entries.values())
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        logger.log_info("engine_pool", 'Evicting engine : ' + entry.key[0] + ' : ' + entry.key[1])
+
+    def clear(self):
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry.users == 0:
+                    self._remove(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'engines': len(self._entries),
+                'in_use': sum(1 for entry in self._entries.values() if entry.users > 0),
+                'pinned': sum(1 for entry in self._entries.values() if entry.pinned),
+                'memory_bytes': self.memory_bytes(),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+_engine_pool = None
+_engine_pool_lock = threading.Lock()
+
+
+def get_engine_pool() -> EnginePool:
+    global _engine_pool
+    if _engine_pool is None:
+        with _engine_pool_lock:
+            if _engine_pool is None:
+                _engine_pool = EnginePool.from_settings()
+    return _engine_pool
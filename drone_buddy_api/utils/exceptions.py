@@ -0,0 +1,62 @@
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class EngineBusyException(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'All engine instances are busy, try again later.'
+    default_code = 'engine_busy'
+
+
+class ExecutorSaturatedException(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many inference requests are queued, try again later.'
+    default_code = 'executor_saturated'
+
+
+class TextRecognitionBackendException(APIException):
+    status_code = status.HTTP_502_BAD_GATEWAY
+    default_detail = 'The text recognition backend failed to process the image.'
+    default_code = 'text_recognition_backend_failed'
+
+
+class VoiceGenerationBusyException(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many voice generation requests are queued, try again later.'
+    default_code = 'voice_generation_busy'
+
+
+class VoiceGenerationException(APIException):
+    status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+    default_detail = 'The text could not be synthesized.'
+    default_code = 'voice_generation_failed'
+
+
+class InferenceWorkersUnavailableException(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The inference workers are not reachable, try again later.'
+    default_code = 'inference_workers_unavailable'
+
+
+class FrameTooLargeException(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'The frame does not fit an inference worker slot, send a smaller frame or set max_side.'
+    default_code = 'frame_too_large'
+
+
+class DeadlineExceededException(APIException):
+    status_code = status.HTTP_504_GATEWAY_TIMEOUT
+    default_detail = 'The deadline of the request passed before its inference could finish, it was dropped.'
+    default_code = 'deadline_exceeded'
+
+
+class IntentRecognitionBackendException(APIException):
+    status_code = status.HTTP_502_BAD_GATEWAY
+    default_detail = 'The intent recognition backend did not return an intent for every utterance.'
+    default_code = 'intent_recognition_backend_failed'
+
+
+class TrackingSessionMismatchException(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'The tracking session was started with other settings, start a new session to change them.'
+    default_code = 'tracking_session_mismatch'
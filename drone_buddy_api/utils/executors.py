@@ -0,0 +1,112 @@
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from drone_buddy_api.utils.exceptions import ExecutorSaturatedException
+from drone_buddy_api.views.enum import AtomType, InferencePool
+
+DEFAULT_INFERENCE_EXECUTORS_SETTINGS = {
+    InferencePool.VISION.value: {'MAX_WORKERS': 4, 'MAX_QUEUE_DEPTH': 16},
+    InferencePool.TEXT.value: {'MAX_WORKERS': 8, 'MAX_QUEUE_DEPTH': 32},
+}
+
+ATOM_INFERENCE_POOLS = {
+    AtomType.OBJECT_DETECTION: InferencePool.VISION,
+    AtomType.FACE_RECOGNITION: InferencePool.VISION,
+    AtomType.HAND_FEATURE_EXTRACTION: InferencePool.VISION,
+    AtomType.INTENT_RECOGNITION: InferencePool.TEXT,
+    AtomType.TEXT_RECOGNITION: InferencePool.TEXT,
+}
+
+
+class BoundedExecutor:
+    """
+    Thread pool that rejects work instead of queueing it without limit. At most ``max_workers`` tasks
+    run at once and at most ``max_queue_depth`` more wait for a worker.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue_depth: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue_depth = max_queue_depth
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Raises:
+            ExecutorSaturatedException: if the queue of waiting tasks is full.
+        """
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue_depth:
+                raise ExecutorSaturatedException()
+            self._pending += 1
+        try:
+            # run in a copy of the caller's context, so that work done for a request is attributed to it
+            future = self._executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        except Exception:
+            self._task_done(None)
+            raise
+        future.add_done_callback(self._task_done)
+        return future
+
+    async def run(self, fn, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def _task_done(self, _):
+        with self._lock:
+            self._pending -= 1
+
+    def pending(self) -> int:
+        return self._pending
+
+    def queue_depth(self) -> int:
+        return max(self._pending - self.max_workers, 0)
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(pool: InferencePool) -> BoundedExecutor:
+    with _executors_lock:
+        executor = _executors.get(pool)
+        if executor is None:
+            executor_settings = {**DEFAULT_INFERENCE_EXECUTORS_SETTINGS,
+                                 **getattr(settings, 'INFERENCE_EXECUTORS', {})}[pool.value]
+            executor = BoundedExecutor('inference-' + pool.value.lower(), executor_settings['MAX_WORKERS'],
+                                       executor_settings['MAX_QUEUE_DEPTH'])
+            _executors[pool] = executor
+    return executor
+
+
+def get_executor_for_atom(atom: AtomType) -> BoundedExecutor:
+    return get_executor(ATOM_INFERENCE_POOLS[atom])
+
+
+def get_created_executors() -> dict:
+    """
+    Returns the executors that were created so far by pool, for readers that should not create them.
+    """
+    with _executors_lock:
+        return dict(_executors)
+
+
+_pipeline_executor = None
+
+
+def get_pipeline_executor() -> ThreadPoolExecutor:
+    """
+    Runs the atoms of pipeline requests. It is separate from the bounded inference executors, so a pipeline
+    request running on one of those never waits for a worker of its own pool.
+    """
+    global _pipeline_executor
+    with _executors_lock:
+        if _pipeline_executor is None:
+            max_workers = {'MAX_WORKERS': 8, **getattr(settings, 'PIPELINE', {})}['MAX_WORKERS']
+            _pipeline_executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pipeline')
+    return _pipeline_executor
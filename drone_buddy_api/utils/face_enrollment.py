@@ -0,0 +1,130 @@
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+from dronebuddylib.utils.logger import Logger
+
+from drone_buddy_api.utils.face_index import get_face_index, get_face_index_settings, remember_known_faces, \
+    ENCODING_DIMENSIONS
+
+logger = Logger()
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp'}
+
+
+class EnrollmentFailureReason:
+    NO_FACE = 'NO_FACE'
+    MULTIPLE_FACES = 'MULTIPLE_FACES'
+    UNREADABLE = 'UNREADABLE'
+
+
+def scan_directory(directory) -> list:
+    """
+    Lists (person, image path) pairs of a directory that has either one sub directory of images per person,
+    or images named after the person directly in it.
+    """
+    entries = []
+    for path in sorted(Path(directory).iterdir()):
+        if path.is_dir():
+            entries.extend((path.name, str(image_path)) for image_path in sorted(path.iterdir())
+                           if image_path.suffix.lower() in IMAGE_EXTENSIONS)
+        elif path.suffix.lower() in IMAGE_EXTENSIONS:
+            entries.append((path.stem, str(path)))
+    return entries
+
+
+def read_manifest(manifest_path) -> list:
+    """
+    Reads (person, image path) pairs from a json manifest ({"person": ["path", ...]} or a list of
+    {"person_name": ..., "image_path": ...}) or a csv manifest with person,image_path rows.
+    Relative image paths are resolved against the directory of the manifest.
+    """
+    manifest_path = Path(manifest_path)
+    if manifest_path.suffix.lower() == '.json':
+        with open(manifest_path, 'r') as manifest_file:
+            entries = parse_manifest(json.load(manifest_file))
+    else:
+        with open(manifest_path, 'r', newline='') as manifest_file:
+            entries = [(row[0].strip(), row[1].strip()) for row in csv.reader(manifest_file)
+                       if len(row) >= 2 and row[0].strip() and row[0].strip() != 'person_name']
+    return [(person, str(manifest_path.parent / image_path)) for person, image_path in entries]
+
+
+def parse_manifest(manifest) -> list:
+    if isinstance(manifest, dict):
+        return [(person, image_path) for person, image_paths in manifest.items()
+                for image_path in ([image_paths] if isinstance(image_paths, str) else image_paths)]
+    return [(entry['person_name'], entry['image_path']) for entry in manifest]
+
+
+def encode_enrollment_image(image_path) -> tuple:
+    """
+    Runs in the worker processes.
+
+    Returns:
+        tuple: the encoding of the single face in the image or None, and the failure reason or None.
+    """
+    import face_recognition
+
+    try:
+        image = face_recognition.load_image_file(image_path)
+    except (OSError, ValueError):
+        return None, EnrollmentFailureReason.UNREADABLE
+    face_locations = face_recognition.face_locations(image)
+    if len(face_locations) == 0:
+        return None, EnrollmentFailureReason.NO_FACE
+    if len(face_locations) > 1:
+        return None, EnrollmentFailureReason.MULTIPLE_FACES
+    encoding = face_recognition.face_encodings(image, face_locations)[0]
+    return np.asarray(encoding, dtype=np.float32), None
+
+
+def enroll_faces(entries: list, processes: int = None) -> dict:
+    """
+    Encodes the images of all (person, image path) entries on a process pool and remembers every face that
+    could be encoded: the first image of each person is stored with the known faces of the face recognition
+    engine, which keeps one image per person, and all faces are added to the face index, when it is enabled,
+    in a single append. Images without exactly one face are reported instead of aborting the batch.
+    """
+    if processes is None:
+        processes = get_face_index_settings().get('ENROLLMENT_PROCESSES') or os.cpu_count()
+    image_paths = [image_path for _, image_path in entries]
+
+    if processes > 1 and len(entries) > 1:
+        chunksize = max(len(entries) // (processes * 4), 1)
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(encode_enrollment_image, image_paths, chunksize=chunksize))
+    else:
+        results = [encode_enrollment_image(image_path) for image_path in image_paths]
+
+    names = []
+    encodings = []
+    person_images = {}
+    failures = []
+    for (person, image_path), (encoding, failure_reason) in zip(entries, results):
+        if failure_reason is None:
+            names.append(person)
+            encodings.append(encoding)
+            person_images.setdefault(person, image_path)
+        else:
+            failures.append({'person_name': person, 'image_path': image_path, 'reason': failure_reason})
+
+    # loaded (built from the known faces on first use) before the known faces change, so that the append below
+    # adds the new faces once
+    face_index = get_face_index() if get_face_index_settings()['ENABLED'] else None
+    known_faces = remember_known_faces(person_images)
+    if face_index is not None:
+        known_faces = len(face_index)
+        if names:
+            known_faces = face_index.append(names, np.asarray(encodings).reshape(-1, ENCODING_DIMENSIONS))
+    logger.log_info("face_enrollment", 'Enrolled ' + str(len(names)) + ' faces, ' + str(len(failures))
+                    + ' images failed')
+    return {
+        'enrolled': len(names),
+        'people': sorted(set(names)),
+        'failed': failures,
+        'known_faces': known_faces,
+    }
@@ -0,0 +1,343 @@
+import fcntl
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import cv2
+import numpy as np
+from django.conf import settings
+from dronebuddylib.utils.logger import Logger
+
+logger = Logger()
+
+DEFAULT_FACE_INDEX_SETTINGS = {
+    'ENABLED': True,
+    'PATH': 'face_index',
+    'TOLERANCE': 0.6,
+    'FRAME_SCALE': 0.25,
+}
+
+ENCODING_DIMENSIONS = 128
+
+
+def get_face_index_settings() -> dict:
+    return {**DEFAULT_FACE_INDEX_SETTINGS, **getattr(settings, 'FACE_INDEX', {})}
+
+
+class FaceIndex:
+    """
+    Known face encodings stored as one contiguous float32 matrix in a memory mapped file, with the name of
+    each row in a json file next to it. Every worker process maps the same file, so the encodings live in the
+    page cache once instead of once per worker. Rows are only ever appended; the names file is replaced
+    atomically after the rows are written, so readers never see a name without its encoding. In memory the
+    names, encodings and their squared norms are published together as one snapshot, so a search running
+    during a refresh sees either the old or the new index, never a mix.
+    """
+    ENCODINGS_FILE = 'encodings.f32'
+    NAMES_FILE = 'names.json'
+    LOCK_FILE = '.lock'
+
+    def __init__(self, path, dimensions: int = ENCODING_DIMENSIONS):
+        self.path = Path(path)
+        self.dimensions = dimensions
+        self._snapshot = ([], np.empty((0, dimensions), np.float32), np.empty((0,), np.float32))
+        self._version = None
+        self._lock = threading.Lock()
+
+    @property
+    def names(self) -> list:
+        return self._snapshot[0]
+
+    @property
+    def encodings(self) -> np.ndarray:
+        return self._snapshot[1]
+
+    @property
+    def squared_norms(self) -> np.ndarray:
+        return self._snapshot[2]
+
+    def exists(self) -> bool:
+        return (self.path / self.NAMES_FILE).exists()
+
+    def __len__(self):
+        self.refresh()
+        return len(self.names)
+
+    @contextmanager
+    def _file_lock(self, operation: int):
+        self.path.mkdir(parents=True, exist_ok=True)
+        with open(self.path / self.LOCK_FILE, 'a') as lock_file:
+            fcntl.flock(lock_file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _write_lock(self):
+        return self._file_lock(fcntl.LOCK_EX)
+
+    def _read_version(self):
+        try:
+            stat = os.stat(self.path / self.NAMES_FILE)
+            return stat.st_mtime_ns, stat.st_size, stat.st_ino
+        except FileNotFoundError:
+            return None
+
+    def _read_names(self) -> list:
+        try:
+            with open(self.path / self.NAMES_FILE, 'r') as names_file:
+                return json.load(names_file)
+        except FileNotFoundError:
+            return []
+
+    def _write_names(self, names: list):
+        temporary_path = self.path / (self.NAMES_FILE + '.tmp')
+        with open(temporary_path, 'w') as names_file:
+            json.dump(names, names_file)
+            names_file.flush()
+            os.fsync(names_file.fileno())
+        os.replace(temporary_path, self.path / self.NAMES_FILE)
+
+    def refresh(self):
+        """
+        Re-maps the index when another process or request appended to it since it was last loaded.
+        """
+        if self._read_version() == self._version:
+            return
+        # shared with other readers, excluded while a writer has replaced the encodings but not the names yet
+        with self._lock, self._file_lock(fcntl.LOCK_SH):
+            version = self._read_version()
+            if version == self._version:
+                return
+            names = self._read_names()
+            if names:
+                encodings = np.memmap(self.path / self.ENCODINGS_FILE, dtype=np.float32, mode='r',
+                                      shape=(len(names), self.dimensions))
+            else:
+                encodings = np.empty((0, self.dimensions), np.float32)
+            self._snapshot = (names, encodings, np.einsum('ij,ij->i', encodings, encodings))
+            self._version = version
+
+    def append(self, names: list, encodings) -> int:
+        """
+        Appends encodings with their names, returns the new number of known faces.
+        """
+        encodings = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, self.dimensions)
+        with self._write_lock():
+            known_names = self._read_names()
+            with open(self.path / self.ENCODINGS_FILE, 'ab') as encodings_file:
+                # drop rows of an append that crashed before its names were written
+                encodings_file.truncate(len(known_names) * self.dimensions * 4)
+                encodings_file.write(encodings.tobytes())
+                encodings_file.flush()
+                os.fsync(encodings_file.fileno())
+            self._write_names(known_names + list(names))
+        self.refresh()
+        return len(known_names) + len(names)
+
+    def rebuild(self, names: list, encodings) -> int:
+        """
+        Replaces the whole index, returns the number of known faces.
+        """
+        encodings = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, self.dimensions)
+        with self._write_lock():
+            temporary_path = self.path / (self.ENCODINGS_FILE + '.tmp')
+            encodings.tofile(temporary_path)
+            os.replace(temporary_path, self.path / self.ENCODINGS_FILE)
+            self._write_names(list(names))
+        self.refresh()
+        return len(names)
+
+    def search(self, queries, top_k: int = 1, threshold: float = None) -> list:
+        """
+        Finds the nearest known faces of every query encoding with a single matrix product.
+
+        Returns:
+            list: for each query a list of (name, distance) tuples, nearest first, at most top_k long and
+            only containing matches closer than the threshold when one is given.
+        """
+        self.refresh()
+        # read once, a concurrent refresh replaces the snapshot as a whole
+        names, encodings, squared_norms = self._snapshot
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dimensions)
+        if len(names) == 0 or len(queries) == 0:
+            return [[] for _ in range(len(queries))]
+
+        # |q - e|^2 = |q|^2 + |e|^2 - 2 q.e
+        squared_distances = (np.einsum('ij,ij->i', queries, queries)[:, None] + squared_norms[None, :]
+                             - 2.0 * queries @ encodings.T)
+        distances = np.sqrt(np.maximum(squared_distances, 0.0))
+
+        top_k = min(max(top_k, 1), len(names))
+        if top_k < len(names):
+            candidates = np.argpartition(distances, top_k - 1, axis=1)[:, :top_k]
+        else:
+            candidates = np.tile(np.arange(len(names)), (len(queries), 1))
+
+        matches = []
+        for row, row_candidates in enumerate(candidates):
+            ordered = row_candidates[np.argsort(distances[row, row_candidates])]
+            matches.append([(names[index], float(distances[row, index])) for index in ordered
+                            if threshold is None or distances[row, index] <= threshold])
+        return matches
+
+
+def compute_face_encodings(rgb_image: np.ndarray) -> tuple:
+    """
+    Returns the face locations and 128 dimensional encodings of all faces in an RGB image.
+    """
+    import face_recognition
+
+    face_locations = face_recognition.face_locations(rgb_image)
+    face_encodings = face_recognition.face_encodings(rgb_image, face_locations)
+    return face_locations, np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_DIMENSIONS)
+
+
+def recognize_faces(face_index: FaceIndex, bgr_image: np.ndarray, top_k: int = 1, threshold: float = None,
+                    frame_scale: float = None) -> tuple:
+    """
+    Recognizes the faces of a BGR frame against the index, shrinking the frame like the face recognition
+    engine does before looking for faces.
+
+    Returns:
+        tuple: the recognized names ("Unknown" when nothing is within the threshold) and the matches per face.
+    """
+    face_index_settings = get_face_index_settings()
+    threshold = face_index_settings['TOLERANCE'] if threshold is None else threshold
+    frame_scale = face_index_settings['FRAME_SCALE'] if frame_scale is None else frame_scale
+    if frame_scale != 1.0:
+        bgr_image = cv2.resize(bgr_image, (0, 0), fx=frame_scale, fy=frame_scale)
+    rgb_image = cv2.cvtColor(bgr_image, cv2.COLOR_BGR2RGB)
+
+    _, face_encodings = compute_face_encodings(rgb_image)
+    matches = face_index.search(face_encodings, top_k=top_k, threshold=threshold)
+    names = [face_matches[0][0] if face_matches else 'Unknown' for face_matches in matches]
+    return names, matches
+
+
+def encode_image_file(image_path) -> np.ndarray:
+    """
+    Returns the encodings of all faces in an image file.
+    """
+    import face_recognition
+
+    _, face_encodings = compute_face_encodings(face_recognition.load_image_file(image_path))
+    return face_encodings
+
+
+def load_known_faces() -> tuple:
+    """
+    Encodes the faces remembered by the dronebuddylib face recognition engine.
+
+    Returns:
+        tuple: the names and their encodings, people whose image has no face are skipped.
+    """
+    import pkg_resources
+    from dronebuddylib.atoms.facerecognition import face_recognition_impl
+    from dronebuddylib.atoms.facerecognition.face_recognition_impl import FaceRecognitionImpl
+
+    with open(FaceRecognitionImpl.KNOWN_NAMES_FILE_PATH, 'r') as names_file:
+        known_names = [line.rstrip('\n') for line in names_file if line.strip()]
+
+    names = []
+    encodings = []
+    for name in known_names:
+        image_path = pkg_resources.resource_filename(face_recognition_impl.__name__,
+                                                     FaceRecognitionImpl.IMAGE_PATH + name + '.jpg')
+        try:
+            face_encodings = encode_image_file(image_path)
+        except FileNotFoundError:
+            logger.log_warning("face_index", 'No image for known face : ' + name)
+            continue
+        if len(face_encodings) == 0:
+            logger.log_warning("face_index", 'No face found for known face : ' + name)
+            continue
+        names.append(name)
+        encodings.append(face_encodings[0])
+    return names, np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIMENSIONS)
+
+
+def remember_known_faces(image_paths: dict) -> int:
+    """
+    Remembers faces the way the dronebuddylib face recognition engine does, so the engine recognizes them too:
+    the image of every person (name to image path) is stored under the name and new names are added to the
+    known names. The image of a known name is replaced, like remembering them again.
+
+    Returns:
+        int: the number of names the engine knows.
+    """
+    import pkg_resources
+    from dronebuddylib.atoms.facerecognition import face_recognition_impl
+    from dronebuddylib.atoms.facerecognition.face_recognition_impl import FaceRecognitionImpl
+
+    for name, image_path in image_paths.items():
+        stored_image_path = pkg_resources.resource_filename(face_recognition_impl.__name__,
+                                                            FaceRecognitionImpl.IMAGE_PATH + name + '.jpg')
+        # copied as is, the engine loads its images by content whatever their extension
+        shutil.copyfile(image_path, stored_image_path)
+
+    names_path = FaceRecognitionImpl.KNOWN_NAMES_FILE_PATH
+    try:
+        with open(names_path, 'r') as names_file:
+            known_names = [line.rstrip('\n') for line in names_file if line.strip()]
+    except FileNotFoundError:
+        known_names = []
+    known_name_set = set(known_names)
+    new_names = [name for name in image_paths if name not in known_name_set]
+    if image_paths:
+        with open(names_path, 'a') as names_file:
+            names_file.writelines(name + '\n' for name in new_names)
+        # replaced images change the known faces as well, let read_known_faces_version see it
+        os.utime(names_path)
+    return len(known_names) + len(new_names)
+
+
+def get_face_index_path() -> Path:
+    path = Path(get_face_index_settings()['PATH'])
+    return path if path.is_absolute() else Path(settings.BASE_DIR) / path
+
+
+def read_known_faces_version() -> str:
+    """
+    Identifies the known faces on disk, the face index and the faces remembered by the engine, so results that
+    depend on them can be keyed by it in every process whichever process changed them.
+    """
+    paths = [get_face_index_path() / FaceIndex.NAMES_FILE]
+    try:
+        from dronebuddylib.atoms.facerecognition.face_recognition_impl import FaceRecognitionImpl
+        paths.append(FaceRecognitionImpl.KNOWN_NAMES_FILE_PATH)
+    except ImportError:
+        # without the face_recognition library no engine can have remembered faces
+        pass
+
+    parts = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            parts.append(str(stat.st_mtime_ns) + ':' + str(stat.st_size) + ':' + str(stat.st_ino))
+        except FileNotFoundError:
+            parts.append('-')
+    return ','.join(parts)
+
+
+_face_index = None
+_face_index_lock = threading.Lock()
+
+
+def get_face_index() -> FaceIndex:
+    """
+    Returns the process wide face index, building it from the known faces of the engine on first use.
+    """
+    global _face_index
+    with _face_index_lock:
+        if _face_index is None:
+            path = get_face_index_path()
+            face_index = FaceIndex(path)
+            if not face_index.exists():
+                logger.log_info("face_index", 'Building face index from known faces at ' + str(path))
+                face_index.rebuild(*load_known_faces())
+            _face_index = face_index
+    return _face_index
@@ -0,0 +1,191 @@
+import functools
+import time
+from collections import deque
+
+import numpy as np
+from django.conf import settings
+
+DEFAULT_GESTURE_TRACKING_SETTINGS = {
+    'SMOOTHING_WINDOW': 3,
+    'STABLE_FRAMES': 2,
+    'MAX_HANDS': 2,
+}
+
+NO_GESTURE = 'None'
+
+
+def get_gesture_tracking_settings() -> dict:
+    return {**DEFAULT_GESTURE_TRACKING_SETTINGS, **getattr(settings, 'GESTURE_TRACKING', {})}
+
+
+@functools.lru_cache(maxsize=4)
+def read_gesture_model(model_path) -> bytes:
+    """
+    Reads a gesture recognizer model once per process. None selects the model shipped with dronebuddylib.
+    """
+    if model_path is None:
+        import pkg_resources
+        from dronebuddylib.atoms.bodyfeatureextraction import hand_feature_extraction_impl
+
+        model_path = pkg_resources.resource_filename(hand_feature_extraction_impl.__name__,
+                                                     'resources/gesture_recognizer.task')
+    with open(model_path, 'rb') as model_file:
+        return model_file.read()
+
+
+def create_video_gesture_recognizer(engine_configurations: dict, max_hands: int):
+    """
+    Creates a MediaPipe gesture recognizer in VIDEO running mode. Unlike the IMAGE mode recognizer of
+    HandFeatureExtractionImpl, it tracks the hands from the landmarks of the previous frame and only runs the
+    palm detector again when a hand is lost, so a stream does not pay for hand detection on every frame.
+    """
+    from dronebuddylib.models.enums import AtomicEngineConfigurations
+    from mediapipe.tasks.python import BaseOptions
+    from mediapipe.tasks.python.vision import GestureRecognizer, GestureRecognizerOptions, RunningMode
+
+    model_path = (engine_configurations or {}).get(
+        AtomicEngineConfigurations.HAND_FEATURE_EXTRACTION_GESTURE_RECOGNITION_MODEL_PATH.value)
+    options = GestureRecognizerOptions(base_options=BaseOptions(model_asset_buffer=read_gesture_model(model_path)),
+                                       running_mode=RunningMode.VIDEO, num_hands=max_hands)
+    return GestureRecognizer.create_from_options(options)
+
+
+def create_image_gesture_recognizer(engine_configurations: dict):
+    """
+    Creates a MediaPipe gesture recognizer in IMAGE running mode from the model of the engine configurations.
+    """
+    from dronebuddylib.models.enums import AtomicEngineConfigurations
+    from mediapipe.tasks.python import BaseOptions
+    from mediapipe.tasks.python.vision import GestureRecognizer, GestureRecognizerOptions, RunningMode
+
+    model_path = (engine_configurations or {}).get(
+        AtomicEngineConfigurations.HAND_FEATURE_EXTRACTION_GESTURE_RECOGNITION_MODEL_PATH.value)
+    options = GestureRecognizerOptions(base_options=BaseOptions(model_asset_buffer=read_gesture_model(model_path)),
+                                       running_mode=RunningMode.IMAGE)
+    return GestureRecognizer.create_from_options(options)
+
+
+class PooledHandFeatureExtraction:
+    """
+    HandFeatureExtractionImpl for the engine pool. Its get_gesture reads the model file and builds a new
+    recognizer on every call, this one keeps a single IMAGE mode recognizer for the lifetime of the engine.
+    Everything else is delegated to the wrapped engine.
+    """
+
+    def __init__(self, engine, recognizer):
+        self.engine = engine
+        self.recognizer = recognizer
+
+    @classmethod
+    def create(cls, engine_configurations: dict):
+        from dronebuddylib.atoms.bodyfeatureextraction import HandFeatureExtractionImpl
+        from dronebuddylib.models import EngineConfigurations
+
+        engine = HandFeatureExtractionImpl(EngineConfigurations(dict(engine_configurations or {})))
+        return cls(engine, create_image_gesture_recognizer(engine_configurations))
+
+    def get_gesture(self, numpy_image):
+        import mediapipe as mp
+
+        return self.recognizer.recognize(mp.Image(image_format=mp.ImageFormat.SRGB, data=numpy_image))
+
+    def __getattr__(self, name):
+        return getattr(self.engine, name)
+
+    def __del__(self):
+        recognizer = self.__dict__.get('recognizer')
+        if recognizer is not None:
+            recognizer.close()
+
+
+class HandState:
+
+    def __init__(self, smoothing_window: int):
+        self.landmarks = deque(maxlen=smoothing_window)
+        self.gesture = NO_GESTURE
+        self.candidate = NO_GESTURE
+        self.candidate_frames = 0
+
+
+class GestureTracker:
+    """
+    Follows the hands of a video stream with a VIDEO mode recognizer, averages the landmarks of every hand
+    over the last ``smoothing_window`` frames and reports a gesture change only after the new gesture was
+    recognized on ``stable_frames`` consecutive frames, so that a flickering classification does not produce
+    a stream of events. Hands are told apart by their handedness.
+    """
+
+    def __init__(self, recognizer, smoothing_window: int, stable_frames: int):
+        self.recognizer = recognizer
+        self.smoothing_window = smoothing_window
+        self.stable_frames = stable_frames
+        self.hands = {}
+        self._started = time.monotonic()
+        self._last_timestamp_ms = -1
+
+    @classmethod
+    def from_settings(cls, engine_configurations: dict):
+        tracking_settings = get_gesture_tracking_settings()
+        recognizer = create_video_gesture_recognizer(engine_configurations, tracking_settings['MAX_HANDS'])
+        return cls(recognizer, tracking_settings['SMOOTHING_WINDOW'], tracking_settings['STABLE_FRAMES'])
+
+    def recognize(self, rgb_image: np.ndarray):
+        import mediapipe as mp
+
+        # VIDEO mode needs strictly increasing timestamps
+        timestamp_ms = max(int((time.monotonic() - self._started) * 1000), self._last_timestamp_ms + 1)
+        self._last_timestamp_ms = timestamp_ms
+        return self.recognizer.recognize_for_video(mp.Image(image_format=mp.ImageFormat.SRGB, data=rgb_image),
+                                                   timestamp_ms)
+
+    def update(self, result_dict: dict) -> list:
+        """
+        Takes the serialized gesture result of the next frame, see convert_to_serializable, smooths its image
+        landmarks in place and returns the gesture change events of the frame.
+        """
+        events = []
+        seen = set()
+        for index, handedness in enumerate(result_dict['handedness']):
+            hand = handedness[0]['category_name'] if handedness else str(index)
+            seen.add(hand)
+            state = self.hands.setdefault(hand, HandState(self.smoothing_window))
+
+            landmarks = result_dict['hand_landmarks'][index]
+            state.landmarks.append(np.array([[landmark['x'], landmark['y'], landmark['z']]
+                                             for landmark in landmarks], dtype=np.float32))
+            smoothed = np.mean(state.landmarks, axis=0)
+            for landmark, (x, y, z) in zip(landmarks, smoothed.tolist()):
+                landmark['x'], landmark['y'], landmark['z'] = x, y, z
+
+            gestures = result_dict['gestures'][index] if index < len(result_dict['gestures']) else []
+            gesture = gestures[0] if gestures else {'category_name': NO_GESTURE, 'score': 0.0}
+            event = self._observe(hand, state, gesture['category_name'])
+            if event is not None:
+                event.update({'score': gesture['score'], 'hand_landmarks': landmarks})
+                events.append(event)
+
+        for hand in list(self.hands):
+            if hand not in seen:
+                # the hand left the frame, forget its landmark history
+                state = self.hands.pop(hand)
+                if state.gesture != NO_GESTURE:
+                    events.append({'hand': hand, 'gesture': NO_GESTURE, 'previous_gesture': state.gesture,
+                                   'score': 0.0, 'hand_landmarks': []})
+        return events
+
+    def _observe(self, hand: str, state: HandState, gesture: str):
+        if gesture == state.gesture:
+            state.candidate, state.candidate_frames = gesture, 0
+            return None
+        if gesture == state.candidate:
+            state.candidate_frames += 1
+        else:
+            state.candidate, state.candidate_frames = gesture, 1
+        if state.candidate_frames < self.stable_frames:
+            return None
+        previous_gesture, state.gesture = state.gesture, gesture
+        state.candidate_frames = 0
+        return {'hand': hand, 'gesture': gesture, 'previous_gesture': previous_gesture}
+
+    def close(self):
+        self.recognizer.close()
@@ -0,0 +1,76 @@
+import cv2
+import numpy as np
+from django.core.files.uploadedfile import InMemoryUploadedFile, TemporaryUploadedFile
+from rest_framework import serializers
+
+from drone_buddy_api.utils.metrics import PHASE_DECODE, timed_phase
+from drone_buddy_api.views.enum import PixelFormat
+
+COLOR_CONVERSIONS = {
+    (PixelFormat.BGR, PixelFormat.RGB): cv2.COLOR_BGR2RGB,
+    (PixelFormat.RGB, PixelFormat.BGR): cv2.COLOR_RGB2BGR,
+}
+
+
+def get_upload_buffer(uploaded_file) -> np.ndarray:
+    """
+    Returns the uploaded bytes as a read only uint8 array without copying them into an intermediate bytes
+    object. In memory uploads are viewed through their BytesIO buffer, uploads spooled to disk are memory
+    mapped. Frames received as bytes, e.g. stream messages, are viewed directly. The array is read only so
+    that images viewing it, e.g. raw frames, are copied before being changed instead of changing the upload.
+    """
+    if isinstance(uploaded_file, (bytes, bytearray, memoryview)):
+        buffer = np.frombuffer(uploaded_file, np.uint8)
+    elif isinstance(uploaded_file, InMemoryUploadedFile) and hasattr(uploaded_file.file, 'getbuffer'):
+        buffer = np.frombuffer(uploaded_file.file.getbuffer(), np.uint8)
+    elif isinstance(uploaded_file, TemporaryUploadedFile):
+        buffer = np.memmap(uploaded_file.temporary_file_path(), dtype=np.uint8, mode='r')
+    else:
+        uploaded_file.seek(0)
+        buffer = np.frombuffer(uploaded_file.read(), np.uint8)
+    buffer.flags.writeable = False
+    return buffer
+
+
+@timed_phase(PHASE_DECODE)
+def decode_image(uploaded_file, flags=cv2.IMREAD_COLOR) -> np.ndarray:
+    """
+    Decodes an encoded (JPEG, PNG, ...) upload exactly once into a BGR image.
+
+    Raises:
+        serializers.ValidationError: if the upload is not a decodable image.
+    """
+    cv_image = cv2.imdecode(get_upload_buffer(uploaded_file), flags)
+    if cv_image is None:
+        raise serializers.ValidationError({'image': ['Upload a valid image.']})
+    return cv_image
+
+
+def frame_from_raw(uploaded_file, width: int, height: int, stride: int = None, channels: int = 3) -> np.ndarray:
+    """
+    Interprets an upload of raw interleaved 8 bit pixels as an image without decoding or copying it.
+    ``stride`` is the number of bytes per row, including any padding, and defaults to width * channels.
+
+    Raises:
+        serializers.ValidationError: if the upload is smaller than the declared frame.
+    """
+    stride = stride or width * channels
+    buffer = get_upload_buffer(uploaded_file)
+    if stride < width * channels or buffer.size < stride * (height - 1) + width * channels:
+        raise serializers.ValidationError({'image': ['Raw frame is smaller than width, height and stride.']})
+    return np.ndarray(shape=(height, width, channels), dtype=np.uint8, buffer=buffer,
+                      strides=(stride, channels, 1))
+
+
+def convert_color(image: np.ndarray, source_format: PixelFormat, target_format: PixelFormat) -> np.ndarray:
+    """
+    Converts between BGR and RGB, in place when the array allows it. Returns the image unchanged when no
+    conversion is needed.
+    """
+    if source_format == target_format:
+        return image
+    conversion = COLOR_CONVERSIONS[(source_format, target_format)]
+    if image.flags.writeable and image.flags.c_contiguous:
+        return cv2.cvtColor(image, conversion, dst=image)
+    return cv2.cvtColor(image, conversion)
+
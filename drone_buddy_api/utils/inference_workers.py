@@ -0,0 +1,459 @@
+import atexit
+import itertools
+import os
+import pickle
+import queue
+import stat
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from importlib import import_module
+from multiprocessing import resource_tracker
+from multiprocessing.connection import Client, Listener
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from drone_buddy_api.utils.atom_loading import ATOM_VIEW_MODULES, LazyLogger
+from drone_buddy_api.utils.engine_pool import make_engine_key
+from drone_buddy_api.utils.exceptions import FrameTooLargeException, InferenceWorkersUnavailableException
+from drone_buddy_api.utils.metrics import PHASE_INFERENCE, timed_phase
+from drone_buddy_api.utils.scheduler import get_scheduler
+from drone_buddy_api.views.enum import AtomType
+
+logger = LazyLogger()
+
+DEFAULT_INFERENCE_WORKERS_SETTINGS = {
+    'ENABLED': False,
+    # defaults to a socket in a directory of the temporary directory private to the user
+    'SOCKET_PATH': None,
+    # required, both sides unpickle what comes over the socket: whoever knows the key can run code in them
+    'AUTHKEY': None,
+    # worker processes per atom, atoms not listed run in the request process
+    'WORKERS': {
+        AtomType.OBJECT_DETECTION.value: 1,
+        AtomType.FACE_RECOGNITION.value: 1,
+        AtomType.HAND_FEATURE_EXTRACTION.value: 1,
+    },
+    'RING_SLOTS': 8,
+    'SLOT_BYTES': 1920 * 1080 * 3,
+    'TIMEOUT_SECONDS': 30,
+    # shared memory rings a worker keeps attached
+    'MAX_ATTACHED_RINGS': 64,
+}
+
+# set in the worker processes, where the atoms run on the local engine pool
+_in_worker_process = False
+
+
+def get_inference_workers_settings() -> dict:
+    return {**DEFAULT_INFERENCE_WORKERS_SETTINGS, **getattr(settings, 'INFERENCE_WORKERS', {})}
+
+
+def get_authkey(inference_workers_settings: dict) -> bytes:
+    """
+    Raises:
+        ImproperlyConfigured: if no AUTHKEY is set.
+    """
+    authkey = inference_workers_settings['AUTHKEY']
+    if not authkey:
+        raise ImproperlyConfigured('INFERENCE_WORKERS AUTHKEY must be set to a secret shared by the HTTP workers '
+                                   'and run_inference_workers, e.g. with DRONE_BUDDY_INFERENCE_AUTHKEY')
+    return authkey if isinstance(authkey, bytes) else authkey.encode()
+
+
+def get_socket_path(inference_workers_settings: dict) -> str:
+    """
+    Returns SOCKET_PATH, or a socket in a directory only this user can enter, created if needed.
+
+    Raises:
+        ImproperlyConfigured: if that directory exists but is not private to this user.
+    """
+    if inference_workers_settings['SOCKET_PATH']:
+        return inference_workers_settings['SOCKET_PATH']
+    directory = os.path.join(tempfile.gettempdir(), 'drone_buddy-' + str(os.getuid()))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    status = os.lstat(directory)
+    if not stat.S_ISDIR(status.st_mode) or status.st_uid != os.getuid() or status.st_mode & 0o077:
+        raise ImproperlyConfigured(directory + ' must be a directory owned by and only accessible to this user')
+    return os.path.join(directory, 'inference.sock')
+
+
+def check_inference_workers_settings():
+    """
+    Fails at startup, rather than at the first frame, when the inference workers are enabled without an AUTHKEY.
+    """
+    inference_workers_settings = get_inference_workers_settings()
+    if inference_workers_settings['ENABLED']:
+        get_authkey(inference_workers_settings)
+        get_socket_path(inference_workers_settings)
+
+
+def uses_inference_workers(atom: AtomType) -> bool:
+    """
+    Whether the frames of the atom are sent to the inference worker processes instead of running here.
+    """
+    if _in_worker_process:
+        return False
+    inference_workers_settings = get_inference_workers_settings()
+    return bool(inference_workers_settings['ENABLED']) and \
+        bool(inference_workers_settings['WORKERS'].get(atom.value))
+
+
+def run_atom_locally(atom: AtomType, algorithm_name, engine_configurations, frame, options: dict):
+    """
+    Runs one frame of the atom in this process, what a worker does with every task.
+    """
+    if atom == AtomType.OBJECT_DETECTION:
+        from drone_buddy_api.utils.batched_object_detection import detect_objects
+        return detect_objects(algorithm_name, engine_configurations, frame)
+    if atom == AtomType.FACE_RECOGNITION:
+        from drone_buddy_api.views.face_recognition import recognize_faces_in_image
+        return recognize_faces_in_image(algorithm_name, engine_configurations, frame, options)
+    if atom == AtomType.HAND_FEATURE_EXTRACTION:
+        from drone_buddy_api.views.hand_feature_extraction import get_gesture
+        return get_gesture(engine_configurations, frame)
+    raise ValueError('Inference workers do not run ' + atom.value)
+
+
+class InferenceClient:
+    """
+    Sends frames of this process to the inference workers. Frames are copied into a slot of a shared memory
+    ring owned by this process and only the slot is sent over the worker socket, the pixels are never
+    pickled. Results come back on the same connection and are handed to the waiting request by id. A slot is
+    reused once the result of its frame arrived, at most ``slots`` frames are in flight at once.
+    """
+
+    def __init__(self, address: str, authkey: bytes, slots: int, slot_bytes: int, timeout_seconds: float):
+        self.address = address
+        self.authkey = authkey
+        self.slot_bytes = slot_bytes
+        self.timeout_seconds = timeout_seconds
+        self.ring = SharedMemory(name='drone_buddy_' + str(os.getpid()) + '_' + uuid.uuid4().hex[:8],
+                                 create=True, size=slots * slot_bytes)
+        # last freed first, its pages are the most likely to be resident
+        self._free_slots = queue.LifoQueue()
+        for slot in range(slots):
+            self._free_slots.put(slot)
+        self._request_ids = itertools.count()
+        self._pending = {}
+        self._connection = None
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        atexit.register(self.close)
+
+    @classmethod
+    def from_settings(cls):
+        inference_workers_settings = get_inference_workers_settings()
+        return cls(get_socket_path(inference_workers_settings), get_authkey(inference_workers_settings),
+                   inference_workers_settings['RING_SLOTS'], inference_workers_settings['SLOT_BYTES'],
+                   inference_workers_settings['TIMEOUT_SECONDS'])
+
+    def run(self, atom: AtomType, algorithm_name, engine_configurations, frame, options: dict = None):
+        """
+        Runs the atom on the frame in a worker and returns its result, exceptions raised by the atom in the
+        worker are raised here.
+
+        Raises:
+            FrameTooLargeException: if the frame does not fit a slot.
+            InferenceWorkersUnavailableException: if the workers are not reachable, no slot became free or
+                the result did not arrive within the timeout.
+        """
+        frame = np.asarray(frame)
+        if frame.nbytes > self.slot_bytes:
+            raise FrameTooLargeException('A frame of ' + str(frame.nbytes) + ' bytes does not fit the '
+                                         + str(self.slot_bytes) + ' bytes of an inference worker slot.')
+        key = make_engine_key(atom, algorithm_name, engine_configurations)
+        with get_scheduler().slot(atom, key), timed_phase(PHASE_INFERENCE):
+            try:
+                slot = self._free_slots.get(timeout=self.timeout_seconds)
+            except queue.Empty:
+                raise InferenceWorkersUnavailableException('No inference worker slot became free in time.')
+            request_id = next(self._request_ids)
+            try:
+                offset = slot * self.slot_bytes
+                np.copyto(np.ndarray(frame.shape, frame.dtype, buffer=self.ring.buf, offset=offset), frame)
+                future = Future()
+                self._pending[request_id] = future
+                # (request id, atom, algorithm, configurations, options, ring, offset, shape, dtype)
+                self._send((request_id, atom.value, algorithm_name, engine_configurations, options or {},
+                            self.ring.name, offset, frame.shape, frame.dtype.str))
+                try:
+                    succeeded, payload = future.result(timeout=self.timeout_seconds)
+                except FutureTimeoutError:
+                    raise InferenceWorkersUnavailableException('The inference worker did not answer in time.')
+            finally:
+                # a worker still reading an abandoned frame only spoils a result nobody waits for
+                self._pending.pop(request_id, None)
+                self._free_slots.put(slot)
+        result = pickle.loads(payload)
+        if not succeeded:
+            raise result
+        return result
+
+    def _send(self, message):
+        with self._lock:
+            if self._connection is None:
+                try:
+                    self._connection = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+                except (OSError, EOFError) as e:
+                    logger.log_error('Inference workers', 'Could not connect to ' + self.address + ': ' + str(e))
+                    raise InferenceWorkersUnavailableException()
+                threading.Thread(target=self._receive, args=(self._connection,), name='inference-client',
+                                 daemon=True).start()
+            try:
+                self._connection.send(message)
+            except OSError:
+                self._disconnect(self._connection)
+                raise InferenceWorkersUnavailableException()
+
+    def _receive(self, connection):
+        while True:
+            try:
+                request_id, succeeded, payload = connection.recv()
+            except (EOFError, OSError):
+                break
+            future = self._pending.get(request_id)
+            if future is not None and not future.done():
+                future.set_result((succeeded, payload))
+        with self._lock:
+            self._disconnect(connection)
+        # the requests in flight on this connection are lost, fail them now instead of at the timeout
+        for future in list(self._pending.values()):
+            if not future.done():
+                future.set_result((False, pickle.dumps(InferenceWorkersUnavailableException(
+                    'The connection to the inference workers was lost.'))))
+
+    def _disconnect(self, connection):
+        # called with the lock held
+        if self._connection is connection:
+            self._connection = None
+        try:
+            connection.close()
+        except OSError:
+            pass
+
+    def close(self):
+        if os.getpid() != self._pid:
+            # a forked child runs the exit handlers of its parent, the ring is still in use there
+            return
+        with self._lock:
+            if self._connection is not None:
+                self._disconnect(self._connection)
+        try:
+            self.ring.close()
+            self.ring.unlink()
+        except (BufferError, FileNotFoundError):
+            pass
+
+
+_inference_client = None
+_inference_client_pid = None
+_inference_client_lock = threading.Lock()
+
+
+def get_inference_client() -> InferenceClient:
+    """
+    Returns the inference client of this process, a forked worker gets its own ring and connection.
+    """
+    global _inference_client, _inference_client_pid
+    if _inference_client is None or _inference_client_pid != os.getpid():
+        with _inference_client_lock:
+            if _inference_client is None or _inference_client_pid != os.getpid():
+                _inference_client = InferenceClient.from_settings()
+                _inference_client_pid = os.getpid()
+    return _inference_client
+
+
+def attach_ring(rings: OrderedDict, name: str, max_attached: int) -> SharedMemory:
+    """
+    Returns the shared memory ring of a client, attached once per worker and kept for later frames.
+    """
+    ring = rings.get(name)
+    if ring is not None:
+        rings.move_to_end(name)
+        return ring
+    ring = SharedMemory(name=name)
+    # the client owns the ring, the resource tracker must not unlink it when this worker exits
+    resource_tracker.unregister(ring._name, 'shared_memory')
+    rings[name] = ring
+    while len(rings) > max_attached:
+        _, evicted = rings.popitem(last=False)
+        try:
+            evicted.close()
+        except BufferError:
+            pass
+    return ring
+
+
+def dump_exception(exception: Exception) -> bytes:
+    try:
+        return pickle.dumps(exception, pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return pickle.dumps(RuntimeError(type(exception).__name__ + ': ' + str(exception)))
+
+
+def inference_worker_main(atom_value: str, task_queue, result_queue):
+    """
+    Entry point of a worker process: runs the frames of one atom on its own engine pool until it gets None.
+    """
+    global _in_worker_process
+    _in_worker_process = True
+    import django
+    django.setup()
+    # before the first frame, not on it
+    import_module(ATOM_VIEW_MODULES[atom_value])
+
+    atom = AtomType(atom_value)
+    max_attached = get_inference_workers_settings()['MAX_ATTACHED_RINGS']
+    rings = OrderedDict()
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        connection_id, request_id, algorithm_name, engine_configurations, options, ring_name, offset, shape, \
+            dtype = task
+        try:
+            frame = np.ndarray(shape, np.dtype(dtype), buffer=attach_ring(rings, ring_name, max_attached).buf,
+                               offset=offset)
+            try:
+                result = run_atom_locally(atom, algorithm_name, engine_configurations, frame, options)
+            finally:
+                # no view on the ring may outlive the task, the slot is reused once the result is sent
+                del frame
+            # pickled here, a result the queue fails to pickle would be dropped silently
+            succeeded, payload = True, pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.log_error('Inference workers', atom_value + ' failed: ' + str(e))
+            succeeded, payload = False, dump_exception(e)
+        result_queue.put((connection_id, request_id, succeeded, payload))
+
+
+class InferenceServer:
+    """
+    Runs ``workers[atom]`` worker processes per atom and accepts the connections of the HTTP workers on a
+    Unix socket. Tasks of every atom wait in one queue shared by its workers, results of all workers come back
+    on one queue and are sent to the connection the task came from. Workers that die are restarted.
+    """
+
+    def __init__(self, address: str, authkey: bytes, workers: dict):
+        import multiprocessing
+        # spawned, not forked: the workers must not inherit the threads and sockets of the server
+        self._context = multiprocessing.get_context('spawn')
+        self.address = address
+        self.authkey = authkey
+        self.workers = {atom: count for atom, count in workers.items() if count}
+        self._task_queues = {atom: self._context.Queue() for atom in self.workers}
+        self._result_queue = self._context.Queue()
+        self._processes = {atom: [] for atom in self.workers}
+        self._connections = {}
+        self._connection_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._listener = None
+
+    def _start_worker(self, atom: AtomType):
+        process = self._context.Process(target=inference_worker_main,
+                                        args=(atom.value, self._task_queues[atom], self._result_queue),
+                                        name='inference-worker-' + atom.value.lower(), daemon=True)
+        process.start()
+        return process
+
+    def start(self):
+        for atom, count in self.workers.items():
+            self._processes[atom] = [self._start_worker(atom) for _ in range(count)]
+        if os.path.exists(self.address):
+            # left behind by a server that did not shut down
+            os.unlink(self.address)
+        # only this user may connect, the socket is created without access for anyone else
+        previous_umask = os.umask(0o177)
+        try:
+            self._listener = Listener(self.address, family='AF_UNIX', authkey=self.authkey)
+        finally:
+            os.umask(previous_umask)
+        os.chmod(self.address, 0o600)
+        for target, name in ((self._dispatch_results, 'inference-results'), (self._monitor, 'inference-monitor')):
+            threading.Thread(target=target, name=name, daemon=True).start()
+
+    def serve_forever(self):
+        while not self._stopped.is_set():
+            try:
+                connection = self._listener.accept()
+            except OSError:
+                if self._stopped.is_set():
+                    break
+                continue
+            except Exception as e:
+                # e.g. a client with the wrong authkey
+                logger.log_warning('Inference workers', 'Rejected a connection: ' + str(e))
+                continue
+            connection_id = next(self._connection_ids)
+            with self._lock:
+                self._connections[connection_id] = (connection, threading.Lock())
+            threading.Thread(target=self._serve_connection, args=(connection_id, connection),
+                             name='inference-connection-' + str(connection_id), daemon=True).start()
+
+    def _serve_connection(self, connection_id: int, connection):
+        while True:
+            try:
+                request_id, atom_value, *task = connection.recv()
+            except (EOFError, OSError):
+                break
+            task_queue = self._task_queues.get(AtomType(atom_value))
+            if task_queue is None:
+                self._send(connection_id, (request_id, False, dump_exception(InferenceWorkersUnavailableException(
+                    'No inference workers run ' + atom_value + '.'))))
+                continue
+            task_queue.put((connection_id, request_id, *task))
+        with self._lock:
+            self._connections.pop(connection_id, None)
+        connection.close()
+
+    def _send(self, connection_id: int, message):
+        with self._lock:
+            entry = self._connections.get(connection_id)
+        if entry is None:
+            # the client is gone, so is the request waiting for the result
+            return
+        connection, send_lock = entry
+        try:
+            with send_lock:
+                connection.send(message)
+        except OSError:
+            pass
+
+    def _dispatch_results(self):
+        while True:
+            connection_id, request_id, succeeded, payload = self._result_queue.get()
+            self._send(connection_id, (request_id, succeeded, payload))
+
+    def _monitor(self):
+        while not self._stopped.wait(1.0):
+            for atom, processes in self._processes.items():
+                for index, process in enumerate(processes):
+                    if not process.is_alive() and not self._stopped.is_set():
+                        # the task it was running is lost, its request fails at the client timeout
+                        logger.log_warning('Inference workers', 'Worker ' + process.name + ' exited with '
+                                           + str(process.exitcode) + ', restarting it')
+                        processes[index] = self._start_worker(atom)
+
+    def stop(self):
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        if self._listener is not None:
+            self._listener.close()
+        for atom, processes in self._processes.items():
+            for _ in processes:
+                self._task_queues[atom].put(None)
+        for processes in self._processes.values():
+            for process in processes:
+                process.join(5)
+                if process.is_alive():
+                    process.terminate()
+        if os.path.exists(self.address):
+            os.unlink(self.address)
@@ -0,0 +1,243 @@
+import hashlib
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+from django.conf import settings
+from dronebuddylib.atoms.intentrecognition.recognized_intent_result import RecognizedEntities, RecognizedIntent
+from dronebuddylib.models.enums import DroneCommands
+
+from drone_buddy_api.utils.engine_pool import canonicalize_engine_configurations, get_engine_pool
+from drone_buddy_api.utils.exceptions import IntentRecognitionBackendException
+from drone_buddy_api.utils.result_cache import LocalResultCacheBackend, ResultCache, normalize_text
+from drone_buddy_api.views.enum import AtomType
+
+DEFAULT_INTENT_RECOGNITION_SETTINGS = {
+    'CACHE_ENABLED': True,
+    'CACHE_MAX_BYTES': 8 * 1024 * 1024,
+    'CACHE_TTL_SECONDS': 3600,
+    'MAX_BATCH_SIZE': 64,
+    'MOCK_LATENCY_MS': 0,
+}
+
+# algorithm name of the offline mock backend, next to the algorithms of IntentRecognitionAlgorithm
+MOCK_ALGORITHM = 'MOCK'
+
+# where an intent came from: the utterance cache, a call made by a concurrent request, or the backend
+SOURCE_CACHE = 'cache'
+SOURCE_SHARED = 'shared'
+SOURCE_BACKEND = 'backend'
+
+
+def get_intent_recognition_settings() -> dict:
+    return {**DEFAULT_INTENT_RECOGNITION_SETTINGS, **getattr(settings, 'INTENT_RECOGNITION', {})}
+
+
+def normalize_utterance(text: str) -> str:
+    """
+    Collapses whitespace and case and drops the punctuation around an utterance, so that "Take off!" and
+    "take  off" are recognized and cached once.
+    """
+    return normalize_text(text).strip('.,!?;: ')
+
+
+def make_utterance_key(algorithm_name, engine_configurations, utterance: str) -> str:
+    return hashlib.sha256('\0'.join([str(algorithm_name), canonicalize_engine_configurations(engine_configurations),
+                                     utterance]).encode('utf-8')).hexdigest()
+
+
+class MockIntentRecognitionEngine:
+    """
+    Offline stand-in for the LLM backed intent recognition, used to measure the latency of the text path
+    without the remote service. Intents are matched by keywords and distances are reported as entities. Each
+    backend call waits ``latency_ms`` to model the round trip of the LLM, which a batch pays once.
+    """
+    # longer phrases first, "counter clockwise" must not match ROTATE_CLOCKWISE
+    KEYWORDS = [
+        ('counter clockwise', DroneCommands.ROTATE_COUNTER_CLOCKWISE),
+        ('anticlockwise', DroneCommands.ROTATE_COUNTER_CLOCKWISE),
+        ('clockwise', DroneCommands.ROTATE_CLOCKWISE),
+        ('take off', DroneCommands.TAKE_OFF),
+        ('takeoff', DroneCommands.TAKE_OFF),
+        ('land', DroneCommands.LAND),
+        ('forward', DroneCommands.FORWARD),
+        ('back', DroneCommands.BACKWARD),
+        ('left', DroneCommands.LEFT),
+        ('right', DroneCommands.RIGHT),
+        ('up', DroneCommands.UP),
+        ('down', DroneCommands.DOWN),
+        ('battery', DroneCommands.BATTERY),
+        ('speed', DroneCommands.SPEED),
+        ('height', DroneCommands.HEIGHT),
+        ('stop', DroneCommands.STOP),
+        ('flip', DroneCommands.FLIP),
+        ('who', DroneCommands.RECOGNIZE_PEOPLE),
+        ('people', DroneCommands.RECOGNIZE_PEOPLE),
+        ('read', DroneCommands.RECOGNIZE_TEXT),
+        ('see', DroneCommands.RECOGNIZE_OBJECTS),
+    ]
+    DISTANCE = re.compile(r'(\d+(?:\.\d+)?)\s*(meters?|metres?|m|centimeters?|cm|degrees?)\b')
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency_ms = latency_ms
+
+    @classmethod
+    def from_settings(cls):
+        return cls(get_intent_recognition_settings()['MOCK_LATENCY_MS'])
+
+    def recognize_intent(self, text: str) -> RecognizedIntent:
+        return self.recognize_intents([text])[0]
+
+    def recognize_intents(self, texts: list) -> list:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        return [self._recognize(text) for text in texts]
+
+    def _recognize(self, text: str) -> RecognizedIntent:
+        text = text.casefold()
+        intent = DroneCommands.NONE
+        for keyword, command in self.KEYWORDS:
+            if re.search(r'\b' + keyword + r'\b', text):
+                intent = command
+                break
+        entities = [RecognizedEntities('distance', value + ' ' + unit) for value, unit in self.DISTANCE.findall(text)]
+        return RecognizedIntent(intent.name, entities, 0.9 if intent != DroneCommands.NONE else 0.1,
+                                intent != DroneCommands.NONE)
+
+
+class SingleFlight:
+    """
+    Lets concurrent callers asking for the same key share one computation: the first caller of a key leads
+    and computes the value, callers arriving while it is in flight wait for the leader's result (or exception).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def begin(self, key) -> tuple:
+        """
+        Returns the future of the key and whether the caller leads, i.e. has to resolve it with finish.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def finish(self, key, result=None, exception: BaseException = None):
+        with self._lock:
+            future = self._calls.pop(key)
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def __len__(self):
+        return len(self._calls)
+
+
+class IntentRecognizer:
+    """
+    The text side of intent recognition: utterances are normalized, served from the utterance cache when they
+    were recognized before, joined to an identical call that is already in flight, and only otherwise sent to
+    the pooled engine. Intents are kept as their JSON.
+    """
+
+    def __init__(self, cache: ResultCache = None, max_batch_size: int = 64):
+        self.cache = cache
+        self.max_batch_size = max_batch_size
+        self.flight = SingleFlight()
+
+    @classmethod
+    def from_settings(cls):
+        intent_settings = get_intent_recognition_settings()
+        cache = None
+        if intent_settings['CACHE_ENABLED']:
+            cache = ResultCache(LocalResultCacheBackend(intent_settings['CACHE_MAX_BYTES']),
+                                {AtomType.INTENT_RECOGNITION.value: intent_settings['CACHE_TTL_SECONDS']})
+        return cls(cache, intent_settings['MAX_BATCH_SIZE'])
+
+    def recognize(self, algorithm_name, engine_configurations, text: str) -> tuple:
+        """
+        Returns the intent JSON of one utterance and its source (cache, shared or backend).
+        """
+        return self.recognize_many(algorithm_name, engine_configurations, [text])[0]
+
+    def recognize_many(self, algorithm_name, engine_configurations, texts: list) -> list:
+        """
+        Returns (intent JSON, source) for every utterance. Repeated utterances are recognized once; the
+        missing ones go to the engine in a single call when it takes batches (the mock backend), one call each
+        otherwise.
+        """
+        utterances = [normalize_utterance(text) for text in texts]
+        keys = [make_utterance_key(algorithm_name, engine_configurations, utterance) for utterance in utterances]
+
+        found = {}
+        for key in set(keys):
+            cached = self.cache.get(AtomType.INTENT_RECOGNITION, key) if self.cache is not None else None
+            if cached is not None:
+                found[key] = (cached, SOURCE_CACHE)
+
+        led, joined = {}, {}
+        for key, utterance in zip(keys, utterances):
+            if key in found or key in led or key in joined:
+                continue
+            future, leader = self.flight.begin(key)
+            (led if leader else joined)[key] = (future, utterance)
+
+        if led:
+            self._recognize_led(algorithm_name, engine_configurations, led)
+            for key, (future, _) in led.items():
+                found[key] = (future.result(), SOURCE_BACKEND)
+        for key, (future, _) in joined.items():
+            found[key] = (future.result(), SOURCE_SHARED)
+        return [found[key] for key in keys]
+
+    def _recognize_led(self, algorithm_name, engine_configurations, led: dict):
+        pending = list(led.keys())
+        try:
+            with get_engine_pool().acquire(AtomType.INTENT_RECOGNITION, algorithm_name,
+                                           engine_configurations) as engine:
+                while pending:
+                    batch = pending[:self.max_batch_size] if hasattr(engine, 'recognize_intents') else pending[:1]
+                    utterances = [led[key][1] for key in batch]
+                    if hasattr(engine, 'recognize_intents'):
+                        intents = engine.recognize_intents(utterances)
+                    else:
+                        intents = [engine.recognize_intent(utterances[0])]
+                    if len(intents) != len(batch):
+                        raise IntentRecognitionBackendException(
+                            'The intent engine returned ' + str(len(intents)) + ' intents for ' + str(len(batch))
+                            + ' utterances.')
+                    for key, intent in zip(batch, intents):
+                        intent_json = intent.to_json()
+                        if self.cache is not None:
+                            self.cache.set(AtomType.INTENT_RECOGNITION, key, intent_json)
+                        # out of pending before it is finished, so that a later failure does not finish it again
+                        pending.remove(key)
+                        self.flight.finish(key, intent_json)
+        except BaseException as e:
+            # waiting callers of the keys not finished yet get the same error instead of hanging
+            for key in pending:
+                self.flight.finish(key, exception=e)
+            raise
+
+    def invalidate(self):
+        if self.cache is not None:
+            self.cache.invalidate(AtomType.INTENT_RECOGNITION)
+
+
+_intent_recognizer = None
+_intent_recognizer_lock = threading.Lock()
+
+
+def get_intent_recognizer() -> IntentRecognizer:
+    global _intent_recognizer
+    with _intent_recognizer_lock:
+        if _intent_recognizer is None:
+            _intent_recognizer = IntentRecognizer.from_settings()
+    return _intent_recognizer
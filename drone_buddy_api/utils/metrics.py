@@ -0,0 +1,392 @@
+import bisect
+import contextvars
+import functools
+import math
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+DEFAULT_METRICS_SETTINGS = {
+    'ENABLED': True,
+    'SERVER_TIMING': True,
+    # seconds, from cheap phases like parsing up to slow engine construction
+    'BUCKETS': (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+}
+
+METRICS_PREFIX = 'drone_buddy_'
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# request phases, in the order they are reported in Server-Timing
+PHASE_PARSE = 'parse'
+PHASE_DECODE = 'decode'
+PHASE_ACQUIRE = 'acquire'
+PHASE_CONSTRUCT = 'construct'
+PHASE_INFERENCE = 'inference'
+PHASE_SERIALIZE = 'serialize'
+PHASES = [PHASE_PARSE, PHASE_DECODE, PHASE_ACQUIRE, PHASE_CONSTRUCT, PHASE_INFERENCE, PHASE_SERIALIZE]
+
+
+def get_metrics_settings() -> dict:
+    return {**DEFAULT_METRICS_SETTINGS, **getattr(settings, 'METRICS', {})}
+
+
+def format_labels(label_names, label_values) -> str:
+    if not label_names:
+        return ''
+    return '{' + ','.join(name + '="' + str(value).replace('\\', '\\\\').replace('"', '\\"')
+                          .replace('\n', '\\n') + '"' for name, value in zip(label_names, label_values)) + '}'
+
+
+def format_value(value) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+
+    def __init__(self, name: str, documentation: str, label_names=()):
+        self.name = METRICS_PREFIX + name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def exposition(self) -> list:
+        lines = ['# HELP ' + self.name + ' ' + self.documentation, '# TYPE ' + self.name + ' counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(self.name + format_labels(self.label_names, label_values) + ' ' + format_value(value))
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative histogram per label set, rendered like the histograms of the Prometheus client libraries.
+    """
+
+    def __init__(self, name: str, documentation: str, label_names=(), buckets=DEFAULT_METRICS_SETTINGS['BUCKETS']):
+        self.name = METRICS_PREFIX + name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(label_values, (None, 0.0))
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1)
+            counts[index] += 1
+            self._values[label_values] = (counts, total + value)
+
+    def exposition(self) -> list:
+        lines = ['# HELP ' + self.name + ' ' + self.documentation, '# TYPE ' + self.name + ' histogram']
+        label_names = self.label_names + ('le',)
+        with self._lock:
+            for label_values, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (math.inf,), counts):
+                    cumulative += count
+                    labels = format_labels(label_names, label_values + (format_value(bound),))
+                    lines.append(self.name + '_bucket' + labels + ' ' + str(cumulative))
+                labels = format_labels(self.label_names, label_values)
+                lines.append(self.name + '_sum' + labels + ' ' + format_value(total))
+                lines.append(self.name + '_count' + labels + ' ' + str(cumulative))
+        return lines
+
+
+def gauge_exposition(name: str, documentation: str, samples: list, label_names=()) -> list:
+    """
+    Renders a gauge read at scrape time from (label values, value) samples.
+    """
+    name = METRICS_PREFIX + name
+    lines = ['# HELP ' + name + ' ' + documentation, '# TYPE ' + name + ' gauge']
+    for label_values, value in samples:
+        lines.append(name + format_labels(label_names, label_values) + ' ' + format_value(value))
+    return lines
+
+
+class RequestTimings:
+    """
+    The time spent in each phase of one request. Phases measured on other threads on behalf of the request,
+    e.g. the atoms of a pipeline, add up, so they may exceed the duration of the request.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float):
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def server_timing(self, total_seconds: float) -> str:
+        entries = [phase + ';dur=' + format(self.phases[phase] * 1000.0, '.3f')
+                   for phase in PHASES if phase in self.phases]
+        entries.append('total;dur=' + format(total_seconds * 1000.0, '.3f'))
+        return ', '.join(entries)
+
+
+# the timings of the request being handled, carried over to executor threads with the context
+current_request_timings = contextvars.ContextVar('current_request_timings', default=None)
+
+
+@contextmanager
+def timed_phase(phase: str):
+    """
+    Adds the time spent in the block, or in the decorated function, to ``phase`` of the current request.
+    Outside of a request it does nothing.
+    """
+    timings = current_request_timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(phase, time.perf_counter() - started)
+
+
+def timed_request_parsing(post):
+    """
+    Decorator for the post method of atom views: parses the request body up front so that the parse phase is
+    measured apart from the work of the view.
+    """
+
+    @functools.wraps(post)
+    def wrapper(self, request, *args, **kwargs):
+        with timed_phase(PHASE_PARSE):
+            request.data
+        return post(self, request, *args, **kwargs)
+
+    return wrapper
+
+
+class MetricsRegistry:
+
+    def __init__(self, buckets):
+        self.requests = Counter('requests_total', 'Handled requests.', ('endpoint', 'algorithm', 'status'))
+        self.request_seconds = Histogram('request_duration_seconds', 'Duration of requests.',
+                                         ('endpoint', 'algorithm'), buckets)
+        self.phase_seconds = Histogram('request_phase_seconds', 'Time spent in each phase of a request.',
+                                       ('endpoint', 'algorithm', 'phase'), buckets)
+        self.result_cache = Counter('result_cache_requests_total', 'Requests answered from the result cache (HIT) '
+                                    'or not (MISS).', ('endpoint', 'result'))
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def request_started(self):
+        with self._lock:
+            self.in_flight += 1
+
+    def request_finished(self, endpoint: str, algorithm: str, status: int, timings: RequestTimings,
+                         total_seconds: float, cache_result=None):
+        with self._lock:
+            self.in_flight -= 1
+        self.requests.inc(endpoint, algorithm, str(status))
+        self.request_seconds.observe(total_seconds, endpoint, algorithm)
+        for phase, seconds in list(timings.phases.items()):
+            self.phase_seconds.observe(seconds, endpoint, algorithm, phase)
+        if cache_result is not None:
+            self.result_cache.inc(endpoint, cache_result)
+
+    def exposition(self) -> str:
+        lines = []
+        for metric in (self.requests, self.request_seconds, self.phase_seconds, self.result_cache):
+            lines.extend(metric.exposition())
+        lines.extend(gauge_exposition('requests_in_flight', 'Requests being handled.', [((), self.in_flight)]))
+        lines.extend(collect_component_metrics())
+        return '\n'.join(lines) + '\n'
+
+
+def collect_component_metrics() -> list:
+    """
+    Reads the memory of the process and the state of the engine pool, the executors and the background
+    workers at scrape time. Components that were never used are not created for it.
+    """
+    from drone_buddy_api.utils import engine_pool, executors, process_memory, scheduler
+
+    lines = []
+    lines.extend(gauge_exposition('process_resident_memory_bytes', 'Resident memory of the worker process.',
+                                  [((), engine_pool.get_resident_memory_bytes())]))
+    # ru_maxrss is in kilobytes on Linux
+    lines.extend(gauge_exposition('process_peak_resident_memory_bytes', 'Peak resident memory of the worker '
+                                  'process.', [((), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024)]))
+    memory_usage = process_memory.read_memory_usage()
+    if memory_usage is not None:
+        # pages shared with the gunicorn master and the other workers, e.g. preloaded model weights
+        lines.extend(gauge_exposition('process_shared_memory_bytes', 'Resident memory of the worker process '
+                                      'shared with other processes.', [((), memory_usage['shared'])]))
+        lines.extend(gauge_exposition('process_private_memory_bytes', 'Resident memory of the worker process '
+                                      'not shared with other processes.', [((), memory_usage['private'])]))
+    pool = engine_pool._engine_pool
+    if pool is not None:
+        stats = pool.stats()
+        lines.extend(['# HELP ' + METRICS_PREFIX + 'engine_pool_lookups_total Engine pool lookups that found a '
+                      'warm engine (hit) or constructed one (miss).',
+                      '# TYPE ' + METRICS_PREFIX + 'engine_pool_lookups_total counter',
+                      METRICS_PREFIX + 'engine_pool_lookups_total{result="hit"} ' + str(stats['hits']),
+                      METRICS_PREFIX + 'engine_pool_lookups_total{result="miss"} ' + str(stats['misses'])])
+        lines.extend(gauge_exposition('engine_pool_engines', 'Engines in the pool.', [((), stats['engines'])]))
+        lines.extend(gauge_exposition('engine_pool_engines_in_use', 'Engines in use.', [((), stats['in_use'])]))
+        lines.extend(gauge_exposition('engine_pool_engines_pinned', 'Engines kept for the lifetime of the process.',
+                                      [((), stats['pinned'])]))
+        lines.extend(gauge_exposition('engine_pool_memory_bytes', 'Estimated memory of the pooled engines.',
+                                      [((), stats['memory_bytes'])]))
+
+    pools = sorted(executors.get_created_executors().items(), key=lambda item: item[0].value)
+    if pools:
+        lines.extend(gauge_exposition('executor_pending', 'Tasks running or queued on an inference executor.',
+                                      [((pool.value,), executor.pending()) for pool, executor in pools], ('pool',)))
+        lines.extend(gauge_exposition('executor_queue_depth', 'Tasks waiting for a worker of an inference '
+                                      'executor.', [((pool.value,), executor.queue_depth())
+                                                    for pool, executor in pools], ('pool',)))
+
+    inference_scheduler = scheduler.get_scheduler_if_created()
+    if inference_scheduler is not None:
+        stats = inference_scheduler.stats()
+        lines.extend(gauge_exposition('scheduler_running', 'Inferences running per priority class.',
+                                      sorted(((priority,), count) for priority, count in stats['running'].items()),
+                                      ('priority',)))
+        lines.extend(gauge_exposition('scheduler_waiting', 'Requests waiting for an inference slot per priority '
+                                      'class.', sorted(((priority,), count)
+                                                       for priority, count in stats['waiting'].items()),
+                                      ('priority',)))
+        lines.extend(['# HELP ' + METRICS_PREFIX + 'scheduler_rejected_total Requests dropped by the scheduler '
+                      'because their deadline could not be met or they waited too long.',
+                      '# TYPE ' + METRICS_PREFIX + 'scheduler_rejected_total counter']
+                     + [METRICS_PREFIX + 'scheduler_rejected_total{reason="' + reason + '"} ' + str(count)
+                        for reason, count in sorted(stats['rejected'].items())])
+
+    adaptive_quality = sys.modules.get('drone_buddy_api.utils.adaptive_quality')
+    controllers = sorted(adaptive_quality._controllers.items(), key=lambda item: item[0].value) \
+        if adaptive_quality is not None else []
+    if controllers:
+        lines.extend(gauge_exposition('adaptive_quality_level', 'Adaptive quality level of a vision atom, 0 is full '
+                                      'quality.', [((atom.value,), controller.level)
+                                                   for atom, controller in controllers], ('atom',)))
+
+    # voice generation is only imported with its atom, which loads dronebuddylib
+    voice_generation = sys.modules.get('drone_buddy_api.utils.voice_generation')
+    synthesizer = voice_generation._synthesizer if voice_generation is not None else None
+    if synthesizer is not None:
+        lines.extend(gauge_exposition('voice_generation_queue_depth', 'Phrases waiting for the TTS engine.',
+                                      [((), synthesizer.queue_depth())]))
+    return lines
+
+
+# algorithm label of requests naming an algorithm no view knows, so clients cannot grow the series without bound
+OTHER_ALGORITHM = 'other'
+
+
+@functools.lru_cache(maxsize=None)
+def get_known_algorithm_names() -> frozenset:
+    # imported here, these modules report their phases to this one
+    from dronebuddylib.models import enums
+
+    from drone_buddy_api.utils.benchmark import STUB_ALGORITHM
+    from drone_buddy_api.utils.intent_recognition import MOCK_ALGORITHM
+    from drone_buddy_api.utils.text_recognition import LOCAL_ALGORITHM
+
+    algorithm_enums = (enums.VisionAlgorithm, enums.FaceRecognitionAlgorithm, enums.IntentRecognitionAlgorithm,
+                       enums.TextRecognitionAlgorithm, enums.SpeechGenerationAlgorithm)
+    return frozenset([algorithm.name for algorithm_enum in algorithm_enums for algorithm in algorithm_enum]
+                     + [STUB_ALGORITHM, MOCK_ALGORITHM, LOCAL_ALGORITHM])
+
+
+def algorithm_label(algorithm_name: str) -> str:
+    if not algorithm_name or algorithm_name in get_known_algorithm_names():
+        return algorithm_name
+    return OTHER_ALGORITHM
+
+
+class MetricsMiddleware:
+    """
+    Times every request and its phases (see timed_phase), records them per endpoint (URL name) and algorithm
+    and reports them in a Server-Timing header. Works for sync and async views without switching modes.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        metrics_settings = get_metrics_settings()
+        self.enabled = metrics_settings['ENABLED']
+        self.server_timing = metrics_settings['SERVER_TIMING']
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        timings, token = self.start()
+        response = None
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request_timings.reset(token)
+            self.finish(request, response, timings)
+        return response
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        timings, token = self.start()
+        response = None
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request_timings.reset(token)
+            self.finish(request, response, timings)
+        return response
+
+    @staticmethod
+    def start() -> tuple:
+        get_metrics_registry().request_started()
+        timings = RequestTimings()
+        return timings, current_request_timings.set(timings)
+
+    def finish(self, request, response, timings: RequestTimings):
+        # imported here, the result cache depends on the engine pool, which reports its phases to this module
+        from drone_buddy_api.utils.result_cache import CACHE_HEADER
+
+        total_seconds = time.perf_counter() - timings.started
+        resolver_match = getattr(request, 'resolver_match', None)
+        endpoint = (resolver_match.url_name or resolver_match.route) if resolver_match is not None else 'unmatched'
+        # no response means the view raised, which Django answers with 500
+        status_code = response.status_code if response is not None else 500
+        cache_result = response.get(CACHE_HEADER) if response is not None else None
+        algorithm = algorithm_label(request.GET.get('algorithm_name', ''))
+        get_metrics_registry().request_finished(endpoint, algorithm, status_code, timings, total_seconds,
+                                                cache_result)
+        if self.server_timing and response is not None:
+            response['Server-Timing'] = timings.server_timing(total_seconds)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics_registry() -> MetricsRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry(get_metrics_settings()['BUCKETS'])
+    return _registry
@@ -0,0 +1,82 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Coalesces items submitted from concurrent requests into batches. A batch is handed to
+    ``process_batch`` as soon as it is full or ``max_wait_seconds`` after its first item arrived,
+    whichever happens first. ``process_batch`` must return one result per item, in order, otherwise every
+    item of the batch fails. The worker thread exits after ``idle_seconds`` without items and is started again
+    by the next submit.
+    """
+
+    def __init__(self, process_batch, max_batch_size: int, max_wait_seconds: float, name: str = 'micro-batcher',
+                 idle_seconds: float = 60.0):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_seconds = max_wait_seconds
+        self.name = name
+        self.idle_seconds = idle_seconds
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        # queued and checked under the lock an idle worker exits under, so no item is left without a worker
+        with self._lock:
+            self._queue.put((item, future))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        return future
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def is_idle(self) -> bool:
+        return self._thread is None
+
+    def _collect_batch(self) -> list:
+        """
+        Returns the next batch, an empty one when the batcher stayed idle for idle_seconds.
+        """
+        try:
+            batch = [self._queue.get(timeout=self.idle_seconds)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_wait_seconds
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if not batch:
+                with self._lock:
+                    if self._queue.empty():
+                        self._thread = None
+                        return
+                continue
+            items = [item for item, _ in batch]
+            try:
+                results = list(self.process_batch(items))
+                if len(results) != len(batch):
+                    raise ValueError(self.name + ' got ' + str(len(results)) + ' results for a batch of '
+                                     + str(len(batch)) + ' items')
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
@@ -0,0 +1,306 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from django.conf import settings
+from dronebuddylib.atoms.objectdetection.detected_object import BoundingBox, DetectedObject, ObjectDetectionResult
+
+from drone_buddy_api.utils.exceptions import TrackingSessionMismatchException
+
+DEFAULT_OBJECT_TRACKING_SETTINGS = {
+    'DETECT_INTERVAL': 5,
+    'SCENE_CHANGE_THRESHOLD': 0.12,
+    'IOU_THRESHOLD': 0.3,
+    'MAX_MISSED_DETECTIONS': 2,
+    'SESSION_IDLE_SECONDS': 60,
+    # sessions kept per process, the least recently used one is forgotten beyond it
+    'MAX_SESSIONS': 1024,
+}
+
+# frames are compared on tiny grey thumbnails to detect scene changes
+SCENE_THUMBNAIL_SIZE = (32, 32)
+# points per side of the grid that is followed with optical flow inside every box
+FLOW_GRID_SIZE = 5
+LUCAS_KANADE_PARAMETERS = {
+    'winSize': (15, 15),
+    'maxLevel': 2,
+    'criteria': (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03),
+}
+
+
+def get_tracking_settings() -> dict:
+    return {**DEFAULT_OBJECT_TRACKING_SETTINGS, **getattr(settings, 'OBJECT_TRACKING', {})}
+
+
+def has_box(detected_object: DetectedObject) -> bool:
+    box = detected_object.bounding_box
+    return box is not None and box.width > 0 and box.height > 0
+
+
+def category_name(detected_object: DetectedObject):
+    categories = detected_object.detected_categories
+    return categories[0].category_name if categories else None
+
+
+def intersection_over_union(box_a: BoundingBox, box_b: BoundingBox) -> float:
+    x0, y0 = max(box_a.origin_x, box_b.origin_x), max(box_a.origin_y, box_b.origin_y)
+    x1 = min(box_a.origin_x + box_a.width, box_b.origin_x + box_b.width)
+    y1 = min(box_a.origin_y + box_a.height, box_b.origin_y + box_b.height)
+    intersection = max(x1 - x0, 0) * max(y1 - y0, 0)
+    union = box_a.width * box_a.height + box_b.width * box_b.height - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+class Track:
+
+    def __init__(self, track_id: int, detected_object: DetectedObject):
+        self.track_id = track_id
+        self.detected_object = detected_object
+        self.box = detected_object.bounding_box
+        self.missed_detections = 0
+
+
+class ObjectTracker:
+    """
+    Follows the objects of a video stream between full detections. The detector runs on the first frame,
+    every ``detect_interval`` frames and whenever the scene changes; detections are associated with the
+    existing tracks by IoU so that an object keeps its track id. In between, the boxes are moved with the
+    median optical flow of a grid of points inside them (one pyramidal Lucas-Kanade call for all boxes), which
+    costs a small fraction of a detection.
+    """
+
+    def __init__(self, detect_interval: int, scene_change_threshold: float, iou_threshold: float,
+                 max_missed_detections: int):
+        self.detect_interval = detect_interval
+        self.scene_change_threshold = scene_change_threshold
+        self.iou_threshold = iou_threshold
+        self.max_missed_detections = max_missed_detections
+        self.tracks = []
+        self.untracked_objects = []
+        self.frame_index = 0
+        self.frames_since_detection = 0
+        self.next_track_id = 1
+        self._previous_gray = None
+        self._keyframe_thumbnail = None
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls, **overrides):
+        tracking_settings = get_tracking_settings()
+        options = {
+            'detect_interval': tracking_settings['DETECT_INTERVAL'],
+            'scene_change_threshold': tracking_settings['SCENE_CHANGE_THRESHOLD'],
+            'iou_threshold': tracking_settings['IOU_THRESHOLD'],
+            'max_missed_detections': tracking_settings['MAX_MISSED_DETECTIONS'],
+        }
+        options.update({key: value for key, value in overrides.items() if value is not None})
+        return cls(**options)
+
+    def update(self, bgr_image: np.ndarray, detect) -> tuple:
+        """
+        Processes the next frame of the stream, calling ``detect(bgr_image)`` for an ObjectDetectionResult
+        only when a full detection is due.
+
+        Returns:
+            tuple: the ObjectDetectionResult of the frame, the track id of each of its detected objects (None
+            for objects without a box) and a dict describing what was done for the frame.
+        """
+        gray = cv2.cvtColor(bgr_image, cv2.COLOR_BGR2GRAY)
+        thumbnail = cv2.resize(gray, SCENE_THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+        scene_change = (self._keyframe_thumbnail is not None and
+                        float(np.mean(np.abs(thumbnail - self._keyframe_thumbnail))) / 255.0
+                        > self.scene_change_threshold)
+        detection_due = (self._keyframe_thumbnail is None or scene_change
+                         or self.frames_since_detection >= self.detect_interval
+                         or self._previous_gray is None or self._previous_gray.shape != gray.shape)
+
+        if detection_due:
+            self._associate(detect(bgr_image))
+            self._keyframe_thumbnail = thumbnail
+            self.frames_since_detection = 0
+        else:
+            self._follow(self._previous_gray, gray)
+        self._previous_gray = gray
+        self.frames_since_detection += 1
+        self.frame_index += 1
+
+        result, track_ids = self._result()
+        return result, track_ids, {
+            'frame_index': self.frame_index,
+            'detected': detection_due,
+            'scene_change': scene_change,
+        }
+
+    def _associate(self, detected_objects: ObjectDetectionResult):
+        detections = [detected_object for detected_object in detected_objects.detected_objects
+                      if has_box(detected_object)]
+        self.untracked_objects = [detected_object for detected_object in detected_objects.detected_objects
+                                  if not has_box(detected_object)]
+
+        # greedy matching, most overlapping pairs of the same category first
+        pairs = sorted(((intersection_over_union(track.box, detection.bounding_box), track_index, detection_index)
+                        for track_index, track in enumerate(self.tracks)
+                        for detection_index, detection in enumerate(detections)
+                        if category_name(track.detected_object) == category_name(detection)),
+                       reverse=True)
+        matched_tracks, matched_detections = set(), set()
+        for iou, track_index, detection_index in pairs:
+            if iou < self.iou_threshold:
+                break
+            if track_index in matched_tracks or detection_index in matched_detections:
+                continue
+            matched_tracks.add(track_index)
+            matched_detections.add(detection_index)
+            track = self.tracks[track_index]
+            track.detected_object = detections[detection_index]
+            track.box = detections[detection_index].bounding_box
+            track.missed_detections = 0
+
+        tracks = []
+        for track_index, track in enumerate(self.tracks):
+            if track_index not in matched_tracks:
+                track.missed_detections += 1
+            if track.missed_detections <= self.max_missed_detections:
+                tracks.append(track)
+        for detection_index, detection in enumerate(detections):
+            if detection_index not in matched_detections:
+                tracks.append(Track(self.next_track_id, detection))
+                self.next_track_id += 1
+        self.tracks = tracks
+
+    def _follow(self, previous_gray: np.ndarray, gray: np.ndarray):
+        tracks = [track for track in self.tracks if track.missed_detections == 0]
+        if not tracks:
+            return
+        steps = (np.arange(FLOW_GRID_SIZE, dtype=np.float32) + 0.5) / FLOW_GRID_SIZE
+        grid_x, grid_y = np.meshgrid(steps, steps)
+        points = np.concatenate([
+            np.stack([track.box.origin_x + grid_x.ravel() * track.box.width,
+                      track.box.origin_y + grid_y.ravel() * track.box.height], axis=1)
+            for track in tracks]).astype(np.float32).reshape(-1, 1, 2)
+
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(previous_gray, gray, points, None, **LUCAS_KANADE_PARAMETERS)
+        # forward-backward check, points that do not flow back to where they started are unreliable
+        returned, back_status, _ = cv2.calcOpticalFlowPyrLK(gray, previous_gray, moved, None,
+                                                            **LUCAS_KANADE_PARAMETERS)
+        error = np.linalg.norm(points - returned, axis=2).ravel()
+        valid = (status.ravel() == 1) & (back_status.ravel() == 1) & (error < 1.0)
+
+        points, moved = points.reshape(-1, 2), moved.reshape(-1, 2)
+        count = FLOW_GRID_SIZE * FLOW_GRID_SIZE
+        height, width = gray.shape
+        for index, track in enumerate(tracks):
+            track_valid = valid[index * count:(index + 1) * count]
+            if np.count_nonzero(track_valid) < 2:
+                continue
+            before = points[index * count:(index + 1) * count][track_valid]
+            after = moved[index * count:(index + 1) * count][track_valid]
+            dx, dy = np.median(after - before, axis=0)
+            spread_before = np.linalg.norm(before - before.mean(axis=0), axis=1)
+            spread_after = np.linalg.norm(after - after.mean(axis=0), axis=1)
+            usable = spread_before > 1e-3
+            scale = float(np.median(spread_after[usable] / spread_before[usable])) if usable.any() else 1.0
+
+            box = track.box
+            center_x = box.origin_x + box.width / 2.0 + float(dx)
+            center_y = box.origin_y + box.height / 2.0 + float(dy)
+            box_width, box_height = box.width * scale, box.height * scale
+            origin_x = min(max(center_x - box_width / 2.0, 0.0), width - 1.0)
+            origin_y = min(max(center_y - box_height / 2.0, 0.0), height - 1.0)
+            track.box = BoundingBox(origin_x, origin_y, min(box_width, width - origin_x),
+                                    min(box_height, height - origin_y))
+
+    def _result(self) -> tuple:
+        detected_objects = []
+        track_ids = []
+        for track in self.tracks:
+            if track.missed_detections:
+                continue
+            box = track.box
+            detected_objects.append(DetectedObject(list(track.detected_object.detected_categories),
+                                                   BoundingBox(box.origin_x, box.origin_y, box.width, box.height)))
+            track_ids.append(track.track_id)
+        for detected_object in self.untracked_objects:
+            detected_objects.append(detected_object)
+            track_ids.append(None)
+        object_names = [category_name(detected_object) for detected_object in detected_objects]
+        return ObjectDetectionResult(object_names, detected_objects), track_ids
+
+
+def tracking_result_to_json(result: ObjectDetectionResult, track_ids: list, tracking: dict) -> dict:
+    """
+    The usual object detection JSON with the track id of every detected object and the tracking state.
+    """
+    result_json = result.to_json()
+    for detected_object, track_id in zip(result_json['detected_objects'], track_ids):
+        detected_object['track_id'] = track_id
+    result_json['tracking'] = tracking
+    return result_json
+
+
+class TrackingSessionStore:
+    """
+    Keeps the trackers of HTTP tracking sessions, identified by a client chosen session name, in least recently
+    used order. Sessions idle for longer than ``idle_seconds`` are forgotten, and the least recently used one
+    once there are more than ``max_sessions``. Trackers live in the memory of one process, so the frames of a
+    session have to reach the same worker.
+    """
+
+    def __init__(self, idle_seconds: float, max_sessions: int):
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max_sessions
+        self._trackers = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        tracking_settings = get_tracking_settings()
+        return cls(tracking_settings['SESSION_IDLE_SECONDS'], tracking_settings['MAX_SESSIONS'])
+
+    def get(self, session_name: str, **overrides) -> ObjectTracker:
+        """
+        Returns the tracker of the session, created with the ``overrides`` of the ObjectTracker settings on the
+        first frame. Later frames may repeat them but not change them.
+
+        Raises:
+            TrackingSessionMismatchException: if an override differs from the one the session was created with.
+        """
+        now = time.monotonic()
+        with self._lock:
+            # least recently used first, only the head can be idle
+            while self._trackers:
+                name, (_, last_used) = next(iter(self._trackers.items()))
+                if now - last_used <= self.idle_seconds:
+                    break
+                del self._trackers[name]
+            tracker = self._trackers.get(session_name, (None, None))[0]
+            if tracker is None:
+                tracker = ObjectTracker.from_settings(**overrides)
+            else:
+                for key, value in overrides.items():
+                    if value is not None and getattr(tracker, key) != value:
+                        raise TrackingSessionMismatchException(
+                            'Tracking session ' + session_name + ' was started with ' + key + ' '
+                            + str(getattr(tracker, key)) + ', start a new session to change it.')
+            self._trackers[session_name] = (tracker, now)
+            self._trackers.move_to_end(session_name)
+            while len(self._trackers) > self.max_sessions:
+                self._trackers.popitem(last=False)
+        return tracker
+
+    def __len__(self):
+        return len(self._trackers)
+
+
+_tracking_sessions = None
+_tracking_sessions_lock = threading.Lock()
+
+
+def get_tracking_sessions() -> TrackingSessionStore:
+    global _tracking_sessions
+    with _tracking_sessions_lock:
+        if _tracking_sessions is None:
+            _tracking_sessions = TrackingSessionStore.from_settings()
+    return _tracking_sessions
@@ -0,0 +1,121 @@
+import gc
+import os
+import sys
+import types
+from importlib import import_module
+
+from django.conf import settings
+
+from drone_buddy_api.utils.atom_loading import ATOM_VIEW_MODULES, LazyLogger, is_atom_enabled
+
+logger = LazyLogger()
+
+DEFAULT_PRELOAD_SETTINGS = {
+    # atoms whose engines run threads (the MediaPipe graph) that do not survive a fork: only their libraries
+    # are imported in the master, every worker builds its own engine
+    'IMPORT_ONLY': ['HAND_FEATURE_EXTRACTION'],
+    'SHARE_TORCH_TENSORS': True,
+    'FREEZE_GC': True,
+}
+
+# set by gunicorn.conf.py when the application is loaded in the gunicorn master before it forks the workers
+PRELOAD_ENVIRONMENT_VARIABLE = 'DRONE_BUDDY_PRELOAD'
+
+
+def get_preload_settings() -> dict:
+    return {**DEFAULT_PRELOAD_SETTINGS, **getattr(settings, 'PRELOAD', {})}
+
+
+def is_preloading() -> bool:
+    return os.environ.get(PRELOAD_ENVIRONMENT_VARIABLE) == '1'
+
+
+def share_torch_modules(root, max_depth: int = 4) -> int:
+    """
+    Moves the tensors of the torch modules reachable from ``root`` (an engine and its attributes) to shared
+    memory, so that the workers map the same pages instead of copying them on write. Returns the number of
+    modules and tensors moved, 0 when torch is not loaded.
+    """
+    torch = sys.modules.get('torch')
+    if torch is None:
+        return 0
+    shared = 0
+    seen = set()
+    pending = [(root, 0)]
+    while pending:
+        value, depth = pending.pop()
+        if id(value) in seen:
+            continue
+        seen.add(id(value))
+        if isinstance(value, torch.nn.Module):
+            # covers the submodules
+            value.share_memory()
+            shared += 1
+        elif isinstance(value, torch.Tensor):
+            value.share_memory_()
+            shared += 1
+        elif depth >= max_depth or isinstance(value, (type, types.ModuleType, str, bytes)):
+            continue
+        elif isinstance(value, dict):
+            pending.extend((item, depth + 1) for item in value.values())
+        elif isinstance(value, (list, tuple, set)):
+            pending.extend((item, depth + 1) for item in value)
+        elif hasattr(value, '__dict__'):
+            pending.extend((item, depth + 1) for item in vars(value).values())
+    return shared
+
+
+def preload_models():
+    """
+    Runs in the gunicorn master before it forks the workers (on_starting hook): imports the libraries of the
+    enabled atoms, builds the WARMUP engines, pins them in the engine pool, moves torch weights to shared
+    memory and freezes the objects so far, so the collector of a worker never writes to the pages it shares
+    with the master. The workers run the dummy inference themselves after the fork.
+    """
+    from drone_buddy_api.utils.engine_pool import get_engine_pool, get_resident_memory_bytes
+    from drone_buddy_api.utils.warmup import get_warmup_settings
+    from drone_buddy_api.views.enum import AtomType
+
+    preload_settings = get_preload_settings()
+    warmup_settings = get_warmup_settings()
+    memory_before = get_resident_memory_bytes()
+    for atom, module in ATOM_VIEW_MODULES.items():
+        if is_atom_enabled(atom):
+            import_module(module)
+
+    engines = warmup_settings['ENGINES'] if warmup_settings['ENABLED'] else []
+    preloaded = []
+    for spec in engines:
+        if not is_atom_enabled(spec['atom']) or spec['atom'] in preload_settings['IMPORT_ONLY']:
+            continue
+        name = spec['atom'] + ' : ' + str(spec.get('algorithm_name'))
+        try:
+            engine = get_engine_pool().pin(AtomType[spec['atom']], spec.get('algorithm_name'),
+                                           spec.get('engine_configurations', {}))
+        except Exception as e:
+            # the workers build it themselves when they warm up
+            logger.log_error('preload', 'Preloading ' + name + ' failed : ' + str(e))
+            continue
+        if preload_settings['SHARE_TORCH_TENSORS']:
+            share_torch_modules(engine)
+        preloaded.append(name)
+
+    gc.collect()
+    if preload_settings['FREEZE_GC']:
+        gc.freeze()
+    gc.enable()
+    logger.log_info('preload', 'Preloaded ' + (', '.join(preloaded) or 'no engines') + ', '
+                    + str((get_resident_memory_bytes() - memory_before) // (1024 * 1024)) + ' MB before fork')
+
+
+def after_fork():
+    """
+    Runs in every gunicorn worker after the fork (post_fork hook): warms up the engines, which runs the dummy
+    inference on the shared ones and builds the IMPORT_ONLY ones.
+    """
+    from drone_buddy_api.utils.warmup import get_warmup_settings, launch_warmup
+
+    gc.enable()
+    warmup_settings = get_warmup_settings()
+    if warmup_settings['ENABLED'] and warmup_settings['ENGINES']:
+        launch_warmup(warmup_settings)
@@ -0,0 +1,245 @@
+import io
+
+import cv2
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+from rest_framework import serializers
+
+from drone_buddy_api.utils.image_ingestion import get_upload_buffer, frame_from_raw, convert_color
+from drone_buddy_api.utils.metrics import PHASE_DECODE, timed_phase
+from drone_buddy_api.views.enum import PixelFormat, Interpolation
+
+INTERPOLATIONS = {
+    Interpolation.NEAREST: cv2.INTER_NEAREST,
+    Interpolation.LINEAR: cv2.INTER_LINEAR,
+    Interpolation.AREA: cv2.INTER_AREA,
+    Interpolation.CUBIC: cv2.INTER_CUBIC,
+}
+
+# decode time reductions supported by OpenCV, largest first
+REDUCED_DECODE_FLAGS = [
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+]
+
+
+class ImageTransform:
+    """
+    Describes how the image handed to the engine relates to the uploaded image, so that coordinates found
+    by the engine can be mapped back into the coordinates of the original image.
+    A point (x, y) of the processed image is (x / scale_x + offset_x, y / scale_y + offset_y) in the original.
+    """
+
+    def __init__(self, original_width: int, original_height: int, width: int, height: int,
+                 scale_x: float = 1.0, scale_y: float = 1.0, offset_x: float = 0.0, offset_y: float = 0.0):
+        self.original_width = original_width
+        self.original_height = original_height
+        self.width = width
+        self.height = height
+        self.scale_x = scale_x
+        self.scale_y = scale_y
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+
+    def is_identity(self) -> bool:
+        return self.scale_x == 1.0 and self.scale_y == 1.0 and self.offset_x == 0 and self.offset_y == 0
+
+    def to_original_point(self, x, y) -> tuple:
+        return x / self.scale_x + self.offset_x, y / self.scale_y + self.offset_y
+
+    def to_original_box(self, origin_x, origin_y, width, height) -> tuple:
+        x, y = self.to_original_point(origin_x, origin_y)
+        return x, y, width / self.scale_x, height / self.scale_y
+
+    def to_original_normalized_point(self, x, y) -> tuple:
+        """
+        Maps a point normalized to the processed image (as MediaPipe reports landmarks) to a point normalized
+        to the original image.
+        """
+        original_x, original_y = self.to_original_point(x * self.width, y * self.height)
+        return original_x / self.original_width, original_y / self.original_height
+
+    def to_json(self):
+        return {
+            'original_size': [self.original_width, self.original_height],
+            'processed_size': [self.width, self.height],
+            'scale': [self.scale_x, self.scale_y],
+            'offset': [self.offset_x, self.offset_y],
+        }
+
+
+class BufferReader(io.RawIOBase):
+    """
+    Read only file over a buffer, Pillow reads the header it needs from it without the buffer being copied
+    (io.BytesIO copies anything but bytes).
+    """
+
+    def __init__(self, buffer):
+        super().__init__()
+        self._view = memoryview(buffer).cast('B')
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        chunk = self._view[self._position:self._position + len(target)]
+        target[:len(chunk)] = chunk
+        self._position += len(chunk)
+        return len(chunk)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(base + offset, 0)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+def read_image_size(buffer: np.ndarray):
+    """
+    Reads width and height from the image header without decoding the pixels, None if the format is unknown.
+    """
+    try:
+        with Image.open(BufferReader(buffer)) as image:
+            return image.size
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        return None
+
+
+def choose_reduction(region_width: int, region_height: int, max_side) -> int:
+    if not max_side:
+        return 1
+    for reduction, _ in REDUCED_DECODE_FLAGS:
+        if max(region_width, region_height) / reduction >= max_side:
+            return reduction
+    return 1
+
+
+def clip_roi(roi, width: int, height: int):
+    x, y, roi_width, roi_height = roi
+    x0, y0 = max(int(x), 0), max(int(y), 0)
+    x1, y1 = min(int(x + roi_width), width), min(int(y + roi_height), height)
+    if x1 <= x0 or y1 <= y0:
+        raise serializers.ValidationError({'roi': ['The region of interest lies outside of the image.']})
+    return x0, y0, x1 - x0, y1 - y0
+
+
+@timed_phase(PHASE_DECODE)
+def preprocess_image(validated_data: dict, target_format: PixelFormat = PixelFormat.BGR, uploaded_file=None):
+    """
+    Decodes the uploaded image and applies the optional ``roi`` crop and ``max_side`` downscale of the
+    request, doing as little work on the full resolution frame as possible: encoded images are decoded at
+    1/2, 1/4 or 1/8 size when that still leaves at least max_side pixels, and cropping happens before
+    the final resize and colour conversion.
+
+    Returns:
+        tuple: the image for the engine and the ImageTransform that maps its coordinates back.
+    """
+    uploaded_file = uploaded_file if uploaded_file is not None else validated_data['image']
+    max_side = validated_data.get('max_side')
+    roi = validated_data.get('roi')
+    interpolation = INTERPOLATIONS[Interpolation[validated_data.get('interpolation') or Interpolation.AREA.value]]
+    raw_format = validated_data.get('raw_format')
+
+    if raw_format:
+        image = frame_from_raw(uploaded_file, validated_data['width'], validated_data['height'],
+                               validated_data.get('stride'))
+        source_format = PixelFormat[raw_format]
+        original_width, original_height = validated_data['width'], validated_data['height']
+    else:
+        source_format = PixelFormat.BGR
+        buffer = get_upload_buffer(uploaded_file)
+        original_size = read_image_size(buffer) if (max_side or roi) else None
+        reduction = 1
+        if original_size is not None:
+            region_width, region_height = original_size
+            if roi:
+                _, _, region_width, region_height = clip_roi(roi, *original_size)
+            reduction = choose_reduction(region_width, region_height, max_side)
+        flags = dict(REDUCED_DECODE_FLAGS).get(reduction, cv2.IMREAD_COLOR)
+        image = cv2.imdecode(buffer, flags)
+        if image is None:
+            raise serializers.ValidationError({'image': ['Upload a valid image.']})
+        if reduction == 1 or original_size is None:
+            original_width, original_height = image.shape[1], image.shape[0]
+        else:
+            original_width, original_height = original_size
+            if abs(image.shape[1] * reduction - original_width) > reduction:
+                # the decoder applied an EXIF rotation, the header size is transposed
+                original_width, original_height = original_height, original_width
+
+    scale_x = image.shape[1] / original_width
+    scale_y = image.shape[0] / original_height
+    offset_x, offset_y = 0, 0
+
+    if roi:
+        roi_x, roi_y, roi_width, roi_height = clip_roi(roi, original_width, original_height)
+        x0, y0 = int(round(roi_x * scale_x)), int(round(roi_y * scale_y))
+        x1, y1 = int(round((roi_x + roi_width) * scale_x)), int(round((roi_y + roi_height) * scale_y))
+        # slicing only creates a view, nothing outside the region is touched afterwards
+        image = image[y0:max(y1, y0 + 1), x0:max(x1, x0 + 1)]
+        offset_x, offset_y = x0 / scale_x, y0 / scale_y
+
+    if max_side and max(image.shape[:2]) > max_side:
+        resize_factor = max_side / max(image.shape[:2])
+        new_size = (max(int(round(image.shape[1] * resize_factor)), 1),
+                    max(int(round(image.shape[0] * resize_factor)), 1))
+        scale_x *= new_size[0] / image.shape[1]
+        scale_y *= new_size[1] / image.shape[0]
+        image = cv2.resize(image, new_size, interpolation=interpolation)
+
+    image = np.ascontiguousarray(convert_color(np.ascontiguousarray(image), source_format, target_format))
+    transform = ImageTransform(original_width, original_height, image.shape[1], image.shape[0],
+                               scale_x, scale_y, offset_x, offset_y)
+    return image, transform
+
+
+def rescale_object_detection_result(detected_objects, transform: ImageTransform):
+    """
+    Maps the bounding boxes of an ObjectDetectionResult back into original image coordinates, in place.
+    Empty boxes, which some algorithms report when they do not compute boxes, are left as they are.
+    """
+    if transform.is_identity():
+        return detected_objects
+    for detected_object in detected_objects.detected_objects:
+        box = detected_object.bounding_box
+        if box is None or (not box.width and not box.height):
+            continue
+        box.origin_x, box.origin_y, box.width, box.height = transform.to_original_box(
+            box.origin_x, box.origin_y, box.width, box.height)
+    return detected_objects
+
+
+def rescale_hand_landmarks(result_dict: dict, transform: ImageTransform):
+    """
+    Maps the normalized image landmarks of a serialized gesture result back to the original image, in place.
+    World landmarks are metric and independent of the image, they are not changed.
+    """
+    if transform.is_identity():
+        return result_dict
+    z_factor = transform.width / (transform.scale_x * transform.original_width)
+    for hand in result_dict['hand_landmarks']:
+        for landmark in hand:
+            landmark['x'], landmark['y'] = transform.to_original_normalized_point(landmark['x'], landmark['y'])
+            landmark['z'] = landmark['z'] * z_factor
+    return result_dict
+
+
+def rescale_landmark_array(landmarks: np.ndarray, transform: ImageTransform):
+    """
+    Array version of rescale_hand_landmarks for packed landmarks, whose last axis starts with x, y, z.
+    """
+    if transform.is_identity():
+        return landmarks
+    landmarks[..., 0] = ((landmarks[..., 0] * transform.width / transform.scale_x + transform.offset_x)
+                         / transform.original_width)
+    landmarks[..., 1] = ((landmarks[..., 1] * transform.height / transform.scale_y + transform.offset_y)
+                         / transform.original_height)
+    landmarks[..., 2] *= transform.width / (transform.scale_x * transform.original_width)
+    return landmarks
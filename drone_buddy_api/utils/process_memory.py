@@ -0,0 +1,103 @@
+import os
+
+# fields of /proc/<pid>/smaps that are summed, in kB
+SMAPS_FIELDS = ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty', 'Swap')
+
+
+def summarize_smaps_fields(fields: dict) -> dict:
+    """
+    Turns summed smaps fields (kB) into bytes: shared memory is mapped by other processes as well (e.g. model
+    weights loaded before fork), private memory only by this one, PSS splits shared pages between their users.
+    """
+    return {
+        'rss': fields['Rss'] * 1024,
+        'pss': fields['Pss'] * 1024,
+        'shared': (fields['Shared_Clean'] + fields['Shared_Dirty']) * 1024,
+        'private': (fields['Private_Clean'] + fields['Private_Dirty']) * 1024,
+        'swap': fields['Swap'] * 1024,
+    }
+
+
+def parse_smaps(lines) -> tuple:
+    """
+    Parses the lines of /proc/<pid>/smaps (or smaps_rollup) into the totals of SMAPS_FIELDS and the same
+    fields per mapped path (anonymous mappings under their name, e.g. [heap], or [anonymous]).
+    """
+    totals = dict.fromkeys(SMAPS_FIELDS, 0)
+    per_path = {}
+    current = None
+    for line in lines:
+        name, _, rest = line.partition(':')
+        if name in totals:
+            value = int(rest.split()[0])
+            totals[name] += value
+            if current is not None:
+                current[name] += value
+        elif '-' in name.split(' ', 1)[0]:
+            # header of a mapping: address range, permissions, offset, device, inode and the optional path
+            parts = line.split(None, 5)
+            path = parts[5].strip() if len(parts) > 5 else '[anonymous]'
+            current = per_path.setdefault(path, dict.fromkeys(SMAPS_FIELDS, 0))
+    return totals, per_path
+
+
+def read_memory_usage(pid='self') -> dict:
+    """
+    Returns the rss, pss, shared, private and swap bytes of a process, None if it is gone or not readable.
+    """
+    for name in ('smaps_rollup', 'smaps'):
+        try:
+            with open('/proc/' + str(pid) + '/' + name, 'r') as smaps:
+                return summarize_smaps_fields(parse_smaps(smaps)[0])
+        except FileNotFoundError:
+            # smaps_rollup needs Linux 4.14, the process may also have exited
+            continue
+        except (OSError, ValueError):
+            return None
+    return None
+
+
+def read_memory_per_mapping(pid='self') -> list:
+    """
+    Returns (path, usage) of every mapped path of a process, most private memory first.
+    """
+    try:
+        with open('/proc/' + str(pid) + '/smaps', 'r') as smaps:
+            _, per_path = parse_smaps(smaps)
+    except (OSError, ValueError):
+        return []
+    usages = [(path, summarize_smaps_fields(fields)) for path, fields in per_path.items()]
+    return sorted(usages, key=lambda item: item[1]['private'], reverse=True)
+
+
+def read_command_line(pid) -> str:
+    try:
+        with open('/proc/' + str(pid) + '/cmdline', 'rb') as cmdline:
+            return cmdline.read().replace(b'\0', b' ').decode(errors='replace').strip()
+    except OSError:
+        return ''
+
+
+def find_child_pids(pid) -> list:
+    """
+    Returns the children of a process, e.g. the workers of a gunicorn master, and their children.
+    """
+    parents = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/' + entry + '/stat', 'r') as stat:
+                # the command in parentheses may contain spaces, the parent pid is the second field after it
+                parents[int(entry)] = int(stat.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+    children = []
+    pending = [int(pid)]
+    while pending:
+        parent = pending.pop()
+        for child, child_parent in sorted(parents.items()):
+            if child_parent == parent:
+                children.append(child)
+                pending.append(child)
+    return children
@@ -0,0 +1,84 @@
+import msgpack
+import numpy as np
+import orjson
+from django.utils.functional import Promise
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from drone_buddy_api.utils.metrics import PHASE_SERIALIZE, timed_phase
+
+MSGPACK_MEDIA_TYPE = 'application/x-msgpack'
+
+# Response data contract: views put plain structures into their responses (dicts, lists, strings, numbers and
+# NumPy arrays or scalars) and the renderer encodes them exactly once. Result objects of dronebuddylib that
+# slip through are encoded with their to_json().
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def encode_default(value):
+    """
+    Encodes the values the renderers do not support natively.
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        # orjson only serializes C contiguous arrays of native byte order natively
+        return value.tolist()
+    if hasattr(value, 'to_json'):
+        return value.to_json()
+    if isinstance(value, Promise):
+        return str(value)
+    raise TypeError('Cannot encode ' + type(value).__name__)
+
+
+def encode_packed_array(value):
+    """
+    MessagePack has no array type, NumPy arrays are sent as {"dtype", "shape", "data"} maps where data holds
+    the little endian, C ordered elements, so a client rebuilds them with one call, e.g.
+    numpy.frombuffer(data, dtype).reshape(shape).
+    """
+    if isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value, dtype=value.dtype.newbyteorder('<'))
+        return {'dtype': array.dtype.name, 'shape': list(array.shape), 'data': array.tobytes()}
+    return encode_default(value)
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Drop in replacement of the JSONRenderer built on orjson, which encodes NumPy arrays and scalars natively
+    and is several times faster than the json module. NaN and infinity are rendered as null.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        options = ORJSON_OPTIONS
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+        with timed_phase(PHASE_SERIALIZE):
+            return orjson.dumps(data, default=encode_default, option=options)
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renders responses as MessagePack for clients sending "Accept: application/x-msgpack". Atoms with large
+    coordinate payloads (hand landmarks, bounding boxes, OCR polygons) answer such requests with packed
+    float32 arrays instead of one object per point, see wants_packed_arrays.
+    """
+    media_type = MSGPACK_MEDIA_TYPE
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    packed_arrays = True
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        with timed_phase(PHASE_SERIALIZE):
+            return msgpack.packb(data, default=encode_packed_array, use_bin_type=True)
+
+
+def wants_packed_arrays(request) -> bool:
+    """
+    Whether the negotiated renderer of the request takes packed arrays, available once the view is called.
+    """
+    return getattr(getattr(request, 'accepted_renderer', None), 'packed_arrays', False)
@@ -0,0 +1,245 @@
+import functools
+import hashlib
+import json
+import os
+import pickle
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from rest_framework.response import Response
+
+from drone_buddy_api.utils.adaptive_quality import QUALITY_HEADER
+from drone_buddy_api.utils.engine_pool import canonicalize_engine_configurations
+from drone_buddy_api.utils.image_ingestion import get_upload_buffer
+from drone_buddy_api.views.enum import AtomType
+
+DEFAULT_RESULT_CACHE_SETTINGS = {
+    'ENABLED': False,
+    'BACKEND': 'LOCAL',
+    'CACHE_ALIAS': 'default',
+    'MAX_BYTES': 64 * 1024 * 1024,
+    'TTL_SECONDS': {},
+}
+
+CACHE_HEADER = 'X-Cache'
+
+
+class LocalResultCacheBackend:
+    """
+    In process LRU cache with a budget on the total size of the stored values.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                self._delete(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value: bytes, ttl_seconds):
+        if len(value) > self.max_bytes:
+            return
+        expires_at = time.monotonic() + ttl_seconds if ttl_seconds is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._delete(key)
+            self._entries[key] = (expires_at, value)
+            self.size_bytes += len(value)
+            while self.size_bytes > self.max_bytes:
+                self._delete(next(iter(self._entries)))
+
+    def get_counter(self, key) -> int:
+        return self._counters.get(key, 0)
+
+    def incr(self, key) -> int:
+        # counters are kept apart from the LRU entries so that they are never evicted
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def _delete(self, key):
+        _, value = self._entries.pop(key)
+        self.size_bytes -= len(value)
+
+
+class DjangoResultCacheBackend:
+    """
+    Stores results in one of the caches of settings.CACHES, e.g. a file based or memcached cache that all
+    worker processes share.
+    """
+
+    def __init__(self, alias: str):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value: bytes, ttl_seconds):
+        self.cache.set(key, value, timeout=ttl_seconds)
+
+    def get_counter(self, key) -> int:
+        return self.cache.get(key, 0)
+
+    def incr(self, key) -> int:
+        self.cache.add(key, 0, timeout=None)
+        return self.cache.incr(key)
+
+
+class ResultCache:
+    """
+    Caches the results of atom calls. Every atom has a generation number that is part of its keys, so
+    invalidating an atom makes all its existing entries unreachable at once.
+    """
+
+    def __init__(self, backend, ttl_seconds: dict):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+
+    def _full_key(self, atom: AtomType, key: str) -> str:
+        generation = self.backend.get_counter('generation:' + atom.value)
+        return 'atom-result:' + atom.value + ':' + str(generation) + ':' + key
+
+    def get(self, atom: AtomType, key: str):
+        value = self.backend.get(self._full_key(atom, key))
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, atom: AtomType, key: str, result):
+        # pickled rather than JSON encoded, results may hold the NumPy arrays of packed responses
+        value = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        self.backend.set(self._full_key(atom, key), value, self.ttl_seconds.get(atom.value))
+
+    def invalidate(self, atom: AtomType):
+        self.backend.incr('generation:' + atom.value)
+
+
+def get_result_cache_settings() -> dict:
+    return {**DEFAULT_RESULT_CACHE_SETTINGS, **getattr(settings, 'RESULT_CACHE', {})}
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """
+    Returns the process wide result cache, or None when caching is disabled.
+    """
+    global _result_cache
+    cache_settings = get_result_cache_settings()
+    if not cache_settings['ENABLED']:
+        return None
+    with _result_cache_lock:
+        if _result_cache is None:
+            if cache_settings['BACKEND'] == 'DJANGO':
+                backend = DjangoResultCacheBackend(cache_settings['CACHE_ALIAS'])
+            else:
+                backend = LocalResultCacheBackend(cache_settings['MAX_BYTES'])
+            _result_cache = ResultCache(backend, cache_settings['TTL_SECONDS'])
+    return _result_cache
+
+
+def normalize_text(text: str) -> str:
+    return re.sub(r'\s+', ' ', text).strip().casefold()
+
+
+def hash_request_field(name, value, digest):
+    digest.update(name.encode('utf-8') + b'\0')
+    if isinstance(value, UploadedFile):
+        digest.update(hashlib.sha256(get_upload_buffer(value)).digest())
+    elif name == 'engine_configurations':
+        try:
+            value = json.loads(value)
+        except (TypeError, ValueError):
+            pass
+        digest.update(canonicalize_engine_configurations(value).encode('utf-8'))
+    elif name == 'text':
+        digest.update(normalize_text(str(value)).encode('utf-8'))
+    elif name == 'image_path':
+        # the file may be replaced in place, include its modification time and size
+        try:
+            stat = os.stat(value)
+            value = value + ':' + str(stat.st_mtime_ns) + ':' + str(stat.st_size)
+        except OSError:
+            pass
+        digest.update(str(value).encode('utf-8'))
+    else:
+        digest.update(str(value).encode('utf-8'))
+    digest.update(b'\0')
+
+
+def make_request_key(endpoint: str, request, version: str = None) -> str:
+    """
+    Hashes everything that determines the result of an atom call: the endpoint, the negotiated media type, the
+    query parameters (e.g. the algorithm name), the canonical engine configurations, the content of uploaded
+    images and the other fields, and the ``version`` of the state the result depends on besides the request.
+    """
+    digest = hashlib.sha256(endpoint.encode('utf-8') + b'\0')
+    if version is not None:
+        digest.update(version.encode('utf-8') + b'\0')
+    digest.update(str(getattr(request, 'accepted_media_type', '')).encode('utf-8') + b'\0')
+    for name in sorted(request.query_params.keys()):
+        hash_request_field(name, request.query_params.getlist(name), digest)
+    for name in sorted(request.data.keys()):
+        values = request.data.getlist(name) if hasattr(request.data, 'getlist') else [request.data[name]]
+        for value in values:
+            hash_request_field(name, value, digest)
+    return digest.hexdigest()
+
+
+def cached_atom_response(atom: AtomType, endpoint: str, uncacheable_fields: tuple = (), key_version=None):
+    """
+    Serves repeated identical atom calls from the result cache, marking responses with X-Cache HIT or MISS.
+    Clients can skip the cache with a "Cache-Control: no-cache" request header. Requests with any of the
+    ``uncacheable_fields``, e.g. ones that depend on state kept between requests, always skip it.
+    ``key_version`` returns the version of shared state the results depend on, e.g. files another process may
+    change; it is part of the key, so a change makes older entries unreachable in every process.
+    """
+
+    def decorator(post):
+        @functools.wraps(post)
+        def wrapper(self, request, *args, **kwargs):
+            cache = get_result_cache()
+            if (cache is None or 'no-cache' in request.headers.get('Cache-Control', '')
+                    or any(field in request.data for field in uncacheable_fields)):
+                return post(self, request, *args, **kwargs)
+
+            key = make_request_key(endpoint, request, key_version() if key_version is not None else None)
+            cached_result = cache.get(atom, key)
+            if cached_result is not None:
+                response = Response(cached_result)
+                response[CACHE_HEADER] = 'HIT'
+                return response
+
+            response = post(self, request, *args, **kwargs)
+            # results computed at a reduced adaptive quality level are not worth keeping
+            if response.status_code == 200 and response.get(QUALITY_HEADER, '0') == '0':
+                cache.set(atom, key, response.data)
+            response[CACHE_HEADER] = 'MISS'
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def invalidate_atom_results(atom: AtomType):
+    cache = get_result_cache()
+    if cache is not None:
+        cache.invalidate(atom)
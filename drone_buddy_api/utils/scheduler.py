@@ -0,0 +1,412 @@
+import contextvars
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import JsonResponse
+
+from drone_buddy_api.utils.exceptions import DeadlineExceededException, EngineBusyException
+from drone_buddy_api.utils.metrics import PHASE_ACQUIRE, timed_phase
+from drone_buddy_api.views.enum import AtomType, PriorityClass
+
+DEFAULT_SCHEDULER_SETTINGS = {
+    'ENABLED': True,
+    # inferences running at once in this process, defaults to the number of CPUs
+    'MAX_CONCURRENT': None,
+    'ATOM_PRIORITIES': {
+        AtomType.OBJECT_DETECTION.value: PriorityClass.CRITICAL.value,
+        AtomType.FACE_RECOGNITION.value: PriorityClass.INTERACTIVE.value,
+        AtomType.HAND_FEATURE_EXTRACTION.value: PriorityClass.INTERACTIVE.value,
+        AtomType.INTENT_RECOGNITION.value: PriorityClass.BACKGROUND.value,
+        AtomType.TEXT_RECOGNITION.value: PriorityClass.BACKGROUND.value,
+    },
+    # share of MAX_CONCURRENT a priority class may occupy, so a burst of one class leaves room for the others
+    'MAX_SHARE': {
+        PriorityClass.CRITICAL.value: 1.0,
+        PriorityClass.INTERACTIVE.value: 1.0,
+        PriorityClass.BACKGROUND.value: 0.5,
+    },
+    # time budget of the request in milliseconds from its arrival, sent by the client
+    'DEADLINE_HEADER': 'X-Deadline-Ms',
+    'DEFAULT_DEADLINE_MS': None,
+    # requests are queued fairly per client id, the client address without it
+    'CLIENT_ID_HEADER': 'X-Client-Id',
+    # longest wait of a request without deadline
+    'MAX_WAIT_SECONDS': 30,
+}
+
+# weight of the latest inference in the running estimate of the service time of an engine
+SERVICE_TIME_SMOOTHING = 0.2
+
+
+def get_scheduler_settings() -> dict:
+    return {**DEFAULT_SCHEDULER_SETTINGS, **getattr(settings, 'SCHEDULER', {})}
+
+
+class RequestSchedule:
+    """
+    Who sent the request being handled and until when its result is of use (time.monotonic(), None for no
+    deadline). ``explicit_client_id`` tells a client id the client sent apart from one derived from its
+    address, which clients behind the same NAT or proxy share.
+    """
+
+    def __init__(self, client_id: str, deadline, explicit_client_id: bool = False):
+        self.client_id = client_id
+        self.deadline = deadline
+        self.explicit_client_id = explicit_client_id
+
+    def remaining_seconds(self):
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+
+# the schedule of the request being handled, carried over to executor threads with the context
+current_request_schedule = contextvars.ContextVar('current_request_schedule', default=None)
+
+
+class Waiter:
+    __slots__ = ('atom', 'priority', 'rank', 'client_id', 'deadline', 'key', 'key_limit', 'units', 'tag',
+                 'sequence', 'cost', 'state', 'event')
+
+    WAITING = 'WAITING'
+    GRANTED = 'GRANTED'
+    DROPPED = 'DROPPED'
+
+
+class InferenceScheduler:
+    """
+    Decides which request runs inference next once more requests want to than ``max_concurrent``. Requests of
+    the most urgent priority class go first, a class never holds more than its share of the slots. Within a
+    class the clients are served in turn (start time fair queuing weighted by the service time of the engine),
+    so one drone sending a burst does not delay the frames of the others. A request whose deadline can no
+    longer be met, given how long its engine takes per frame, is dropped while queued or as soon as it arrives
+    instead of being computed for nobody. The estimate only drops requests that compete with others: without
+    samples, or with nobody else waiting, a request runs and its time corrects the estimate.
+    """
+
+    def __init__(self, max_concurrent: int, atom_priorities: dict, max_share: dict, max_wait_seconds: float):
+        self.max_concurrent = max_concurrent
+        self.atom_priorities = atom_priorities
+        self.class_slots = {priority: max(1, int(math.floor(max_concurrent * max_share.get(priority.value, 1.0))))
+                            for priority in PriorityClass}
+        self.max_wait_seconds = max_wait_seconds
+        self.rejected = {'deadline': 0, 'timeout': 0}
+        self.granted = 0
+        self._waiters = []
+        self._running = 0
+        self._running_per_class = {priority: 0 for priority in PriorityClass}
+        self._running_per_key = {}
+        self._virtual_time = {priority: 0.0 for priority in PriorityClass}
+        self._client_finish_tags = {}
+        self._service_seconds = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls):
+        scheduler_settings = get_scheduler_settings()
+        atom_priorities = {AtomType(atom): PriorityClass(priority)
+                           for atom, priority in scheduler_settings['ATOM_PRIORITIES'].items()}
+        return cls(scheduler_settings['MAX_CONCURRENT'] or os.cpu_count() or 1, atom_priorities,
+                   scheduler_settings['MAX_SHARE'], scheduler_settings['MAX_WAIT_SECONDS'])
+
+    def service_seconds(self, atom: AtomType, key=None):
+        """
+        Returns the estimated inference time of one frame on the engine ``key`` of the atom, None before its
+        first inference.
+        """
+        return self._service_seconds.get((atom, key))
+
+    def waiting(self, atom: AtomType) -> int:
+        """
+        Returns the number of requests queued in the priority class of the atom, the ones it competes with.
+        """
+        priority = self.atom_priorities.get(atom, PriorityClass.INTERACTIVE)
+        with self._lock:
+            return sum(1 for waiter in self._waiters if waiter.priority == priority)
+
+    @contextmanager
+    def slot(self, atom: AtomType, key=None, key_limit: int = None, units: int = 1):
+        """
+        Waits until the request may run inference for the atom and holds the slot for the block. ``key`` names
+        the engine whose service time is estimated, ``key_limit`` bounds the slots given to it, e.g. its
+        concurrency in the engine pool, so that waiting for a busy engine never holds a slot. ``units`` is the
+        number of frames the block infers. Outside of a request (warm up, batcher threads) the block runs
+        right away.
+
+        Raises:
+            DeadlineExceededException: if the deadline of the request passed or can no longer be met.
+            EngineBusyException: if a request without deadline waited more than MAX_WAIT_SECONDS.
+        """
+        schedule = current_request_schedule.get()
+        if schedule is None:
+            yield
+            return
+        with timed_phase(PHASE_ACQUIRE):
+            waiter = self._enqueue(atom, schedule, key, key_limit, units)
+            self._wait(waiter)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(waiter, time.monotonic() - started)
+
+    def _enqueue(self, atom: AtomType, schedule: RequestSchedule, key, key_limit, units: int) -> Waiter:
+        priority = self.atom_priorities.get(atom, PriorityClass.INTERACTIVE)
+        waiter = Waiter()
+        waiter.atom = atom
+        waiter.priority = priority
+        waiter.rank = list(PriorityClass).index(priority)
+        waiter.client_id = schedule.client_id
+        waiter.deadline = schedule.deadline
+        waiter.key = key
+        waiter.key_limit = key_limit
+        waiter.units = units
+        waiter.sequence = next(self._sequence)
+        waiter.state = Waiter.WAITING
+        waiter.event = threading.Event()
+        with self._lock:
+            waiter.cost = max(self._estimate(waiter) or 0.0, 0.001)
+            contended = bool(self._waiters) or self._running >= self.max_concurrent
+            if self._cannot_meet_deadline(waiter, time.monotonic(), contended):
+                self.rejected['deadline'] += 1
+                raise DeadlineExceededException()
+            # the start tag of the client: after its previous request, but not before the present of the class
+            client = (priority, waiter.client_id)
+            waiter.tag = max(self._virtual_time[priority], self._client_finish_tags.get(client, 0.0))
+            self._client_finish_tags[client] = waiter.tag + waiter.cost
+            self._waiters.append(waiter)
+            self._dispatch()
+        return waiter
+
+    def _estimate(self, waiter: Waiter):
+        # called with the lock held
+        service_seconds = self.service_seconds(waiter.atom, waiter.key)
+        return None if service_seconds is None else service_seconds * waiter.units
+
+    def _cannot_meet_deadline(self, waiter: Waiter, now: float, contended: bool) -> bool:
+        # called with the lock held
+        if waiter.deadline is None:
+            return False
+        if now >= waiter.deadline:
+            return True
+        estimate = self._estimate(waiter)
+        return contended and estimate is not None and now + estimate > waiter.deadline
+
+    def _wait(self, waiter: Waiter):
+        try:
+            self._wait_for_decision(waiter)
+        except BaseException:
+            # interrupted or rejected: the waiter must neither stay queued nor keep a slot nobody releases
+            self._abandon(waiter)
+            raise
+
+    def _wait_for_decision(self, waiter: Waiter):
+        with self._lock:
+            estimate = self._estimate(waiter) or 0.0
+        give_up_at = time.monotonic() + self.max_wait_seconds if waiter.deadline is None \
+            else waiter.deadline - estimate
+        while True:
+            waiter.event.wait(max(give_up_at - time.monotonic(), 0.0))
+            with self._lock:
+                if waiter.state == Waiter.GRANTED:
+                    return
+                if waiter.state == Waiter.WAITING and time.monotonic() < give_up_at:
+                    # woken without a decision, e.g. the estimate of the service time changed
+                    continue
+                if waiter.state == Waiter.WAITING:
+                    self._waiters.remove(waiter)
+                    waiter.state = Waiter.DROPPED
+                reason = 'deadline' if waiter.deadline is not None else 'timeout'
+                self.rejected[reason] += 1
+            if reason == 'deadline':
+                raise DeadlineExceededException()
+            raise EngineBusyException()
+
+    def _abandon(self, waiter: Waiter):
+        with self._lock:
+            if waiter.state == Waiter.WAITING:
+                self._waiters.remove(waiter)
+                waiter.state = Waiter.DROPPED
+                return
+            if waiter.state != Waiter.GRANTED:
+                return
+            waiter.state = Waiter.DROPPED
+            self._free_slot(waiter)
+            self._dispatch()
+
+    def _dispatch(self):
+        # called with the lock held
+        now = time.monotonic()
+        while self._running < self.max_concurrent:
+            best = None
+            for waiter in list(self._waiters):
+                if self._cannot_meet_deadline(waiter, now, len(self._waiters) > 1):
+                    # stale, drop it instead of computing it
+                    self._waiters.remove(waiter)
+                    waiter.state = Waiter.DROPPED
+                    waiter.event.set()
+                    continue
+                if self._running_per_class[waiter.priority] >= self.class_slots[waiter.priority]:
+                    continue
+                if waiter.key is not None and waiter.key_limit is not None and \
+                        self._running_per_key.get(waiter.key, 0) >= waiter.key_limit:
+                    continue
+                if best is None or self._order(waiter) < self._order(best):
+                    best = waiter
+            if best is None:
+                return
+            self._waiters.remove(best)
+            self._running += 1
+            self._running_per_class[best.priority] += 1
+            if best.key is not None:
+                self._running_per_key[best.key] = self._running_per_key.get(best.key, 0) + 1
+            self._virtual_time[best.priority] = max(self._virtual_time[best.priority], best.tag)
+            self.granted += 1
+            best.state = Waiter.GRANTED
+            best.event.set()
+        self._forget_idle_clients()
+
+    @staticmethod
+    def _order(waiter: Waiter) -> tuple:
+        return (waiter.rank, waiter.tag, waiter.deadline if waiter.deadline is not None else math.inf,
+                waiter.sequence)
+
+    def _forget_idle_clients(self):
+        # clients whose last tag is in the past of their class start from the present anyway
+        if len(self._client_finish_tags) > 4096:
+            self._client_finish_tags = {client: tag for client, tag in self._client_finish_tags.items()
+                                        if tag > self._virtual_time[client[0]]}
+
+    def _free_slot(self, waiter: Waiter):
+        # called with the lock held
+        self._running -= 1
+        self._running_per_class[waiter.priority] -= 1
+        if waiter.key is not None:
+            self._running_per_key[waiter.key] -= 1
+            if not self._running_per_key[waiter.key]:
+                del self._running_per_key[waiter.key]
+
+    def _release(self, waiter: Waiter, service_seconds: float):
+        with self._lock:
+            self._free_slot(waiter)
+            estimate_key = (waiter.atom, waiter.key)
+            service_seconds = service_seconds / max(waiter.units, 1)
+            previous = self._service_seconds.get(estimate_key)
+            self._service_seconds[estimate_key] = service_seconds if previous is None else \
+                previous + SERVICE_TIME_SMOOTHING * (service_seconds - previous)
+            self._dispatch()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'running': dict((priority.value, count) for priority, count in self._running_per_class.items()),
+                'waiting': dict((priority.value, sum(1 for waiter in self._waiters if waiter.priority == priority))
+                                for priority in PriorityClass),
+                'granted': self.granted,
+                'rejected': dict(self.rejected),
+                'service_seconds': dict((atom.value + (' : ' + str(key) if key is not None else ''), seconds)
+                                        for (atom, key), seconds in self._service_seconds.items()),
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> InferenceScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = InferenceScheduler.from_settings()
+    return _scheduler
+
+
+def get_scheduler_if_created():
+    """
+    Returns the scheduler, or None when no request has used it yet, for readers that should not create it.
+    """
+    return _scheduler
+
+
+def deadline_exceeded_response() -> JsonResponse:
+    exception = DeadlineExceededException()
+    return JsonResponse({'detail': str(exception.detail)}, status=exception.status_code)
+
+
+def parse_deadline_ms(value, default_deadline_ms):
+    """
+    Returns the time budget in milliseconds sent by a client, or ``default_deadline_ms`` when none was sent.
+    """
+    try:
+        deadline_ms = float(value) if value is not None else None
+    except ValueError:
+        deadline_ms = None
+    if deadline_ms is not None and (not math.isfinite(deadline_ms) or deadline_ms <= 0):
+        # a malformed, infinite or non-positive budget schedules the request like one without
+        deadline_ms = None
+    return deadline_ms if deadline_ms is not None else default_deadline_ms
+
+
+def is_past_deadline() -> bool:
+    schedule = current_request_schedule.get()
+    return schedule is not None and schedule.deadline is not None and schedule.remaining_seconds() <= 0
+
+
+class SchedulingMiddleware:
+    """
+    Reads the deadline and the client id of every request for the inference scheduler, and answers requests
+    that arrive with no time left with 504 right away. Works for sync and async views without switching modes.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        scheduler_settings = get_scheduler_settings()
+        self.enabled = scheduler_settings['ENABLED']
+        self.deadline_header = scheduler_settings['DEADLINE_HEADER']
+        self.default_deadline_ms = scheduler_settings['DEFAULT_DEADLINE_MS']
+        self.client_id_header = scheduler_settings['CLIENT_ID_HEADER']
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        schedule = self.read_schedule(request)
+        if schedule.deadline is not None and schedule.remaining_seconds() <= 0:
+            return deadline_exceeded_response()
+        token = current_request_schedule.set(schedule)
+        try:
+            return self.get_response(request)
+        finally:
+            current_request_schedule.reset(token)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        schedule = self.read_schedule(request)
+        if schedule.deadline is not None and schedule.remaining_seconds() <= 0:
+            return deadline_exceeded_response()
+        token = current_request_schedule.set(schedule)
+        try:
+            return await self.get_response(request)
+        finally:
+            current_request_schedule.reset(token)
+
+    def read_schedule(self, request) -> RequestSchedule:
+        arrived = time.monotonic()
+        explicit_client_id = request.headers.get(self.client_id_header)
+        client_id = explicit_client_id or request.META.get('REMOTE_ADDR', '')
+        deadline_ms = parse_deadline_ms(request.headers.get(self.deadline_header), self.default_deadline_ms)
+        return RequestSchedule(client_id, arrived + deadline_ms / 1000.0 if deadline_ms is not None else None,
+                               bool(explicit_client_id))
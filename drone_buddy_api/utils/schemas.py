@@ -0,0 +1,25 @@
+from drf_yasg import openapi
+
+from drone_buddy_api.views.enum import PixelFormat, Interpolation
+
+# request body properties shared by the atoms that accept raw (undecoded) frames
+RAW_FRAME_PROPERTIES = {
+    'raw_format': openapi.Schema(type=openapi.TYPE_STRING,
+                                 enum=[pixel_format.value for pixel_format in PixelFormat],
+                                 description='Set when the uploaded file holds raw interleaved 8 bit pixels'),
+    'width': openapi.Schema(type=openapi.TYPE_INTEGER, description='Width of the raw frame in pixels'),
+    'height': openapi.Schema(type=openapi.TYPE_INTEGER, description='Height of the raw frame in pixels'),
+    'stride': openapi.Schema(type=openapi.TYPE_INTEGER,
+                             description='Bytes per row of the raw frame, defaults to width * 3'),
+}
+
+# request body properties of the atoms that support server side downscaling and cropping
+PREPROCESSING_PROPERTIES = {
+    'max_side': openapi.Schema(type=openapi.TYPE_INTEGER,
+                               description='Downscale so that the longer side of the image is at most this long'),
+    'roi': openapi.Schema(type=openapi.TYPE_STRING,
+                          description='Region of interest "x,y,width,height" in original image pixels'),
+    'interpolation': openapi.Schema(type=openapi.TYPE_STRING,
+                                    enum=[interpolation.value for interpolation in Interpolation],
+                                    description='Interpolation used for downscaling, defaults to AREA'),
+}
@@ -1,11 +1,81 @@
 from rest_framework import serializers
 
+from drone_buddy_api.views.enum import PixelFormat, Interpolation, AtomType
 
-class ImageAndConfigurationsSerializer(serializers.Serializer):
-    image = serializers.ImageField()  # Add an image field
+
+class RawFrameSerializer(serializers.Serializer):
+    # set raw_format to send undecoded pixels instead of an encoded image
+    raw_format = serializers.ChoiceField(choices=[pixel_format.value for pixel_format in PixelFormat],
+                                         required=False)
+    width = serializers.IntegerField(min_value=1, required=False)
+    height = serializers.IntegerField(min_value=1, required=False)
+    stride = serializers.IntegerField(min_value=1, required=False)  # bytes per row, defaults to width * 3
+
+    def validate(self, attrs):
+        if attrs.get('raw_format') and (attrs.get('width') is None or attrs.get('height') is None):
+            raise serializers.ValidationError('width and height are required for raw frames.')
+        return attrs
+
+
+class RegionOfInterestField(serializers.CharField):
+    """
+    Accepts "x,y,width,height" in pixels of the original image.
+    """
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        try:
+            roi = tuple(float(part) for part in value.strip('[]() ').split(','))
+        except ValueError:
+            roi = ()
+        if len(roi) != 4 or roi[2] <= 0 or roi[3] <= 0:
+            raise serializers.ValidationError('Expected "x,y,width,height" with a positive width and height.')
+        return roi
+
+
+class PreprocessingSerializer(RawFrameSerializer):
+    # optional server side downscale / crop, results are reported in original image coordinates
+    max_side = serializers.IntegerField(min_value=16, required=False)
+    roi = RegionOfInterestField(required=False)
+    interpolation = serializers.ChoiceField(choices=[interpolation.value for interpolation in Interpolation],
+                                            required=False)
+
+
+class ImageAndConfigurationsSerializer(PreprocessingSerializer):
+    # FileField instead of ImageField, the image is decoded once by image_ingestion instead of verified by Pillow
+    image = serializers.FileField()
     engine_configurations = serializers.CharField()  # Temporarily change this to a CharField
 
 
+class StreamSessionSerializer(PreprocessingSerializer):
+    # sent once as the first message of a stream session, applies to every frame of the session
+    algorithm_name = serializers.CharField(required=False)
+    engine_configurations = serializers.JSONField(required=False, default=dict)
+
+
+class ObjectDetectionStreamSerializer(StreamSessionSerializer):
+    algorithm_name = serializers.CharField()
+    # follow objects between full detections and report stable track ids
+    tracking = serializers.BooleanField(default=False)
+    detect_interval = serializers.IntegerField(min_value=1, required=False)
+
+
+class ObjectDetectionSerializer(ImageAndConfigurationsSerializer):
+    # frames sent with the same tracking_session are tracked, objects keep their track id across requests
+    tracking_session = serializers.CharField(required=False, max_length=128)
+    detect_interval = serializers.IntegerField(min_value=1, required=False)
+
+
+class GestureStreamSerializer(StreamSessionSerializer):
+    # gesture change events only carry the smoothed landmarks of the hand when asked to
+    include_landmarks = serializers.BooleanField(default=False)
+
+
+class FaceRecognitionImageSerializer(ImageAndConfigurationsSerializer):
+    top_k = serializers.IntegerField(min_value=1, required=False)
+    threshold = serializers.FloatField(min_value=0.0, required=False)
+
+
 class FaceRecognitionSerializer(serializers.Serializer):
     # image = serializers.ImageField()  # Add an image field
     image_path = serializers.CharField()  # Temporarily change this to a CharField
@@ -13,15 +83,80 @@ class FaceRecognitionSerializer(serializers.Serializer):
     person_name = serializers.CharField()  # Temporarily change this to a CharField
 
 
+class FaceEnrollmentSerializer(serializers.Serializer):
+    # exactly one of the three sources of (person, image path) pairs
+    directory = serializers.CharField(required=False)
+    manifest_path = serializers.CharField(required=False)
+    manifest = serializers.JSONField(required=False)
+
+    def validate(self, attrs):
+        if len([key for key in ('directory', 'manifest_path', 'manifest') if attrs.get(key)]) != 1:
+            raise serializers.ValidationError('Provide exactly one of directory, manifest_path or manifest.')
+        return attrs
+
+
 class TextRecognitionSerializer(serializers.Serializer):
-    image_path = serializers.CharField()  # Temporarily change this to a CharField
+    # exactly one image source: a path on the server, one uploaded image or several uploaded images
+    image_path = serializers.CharField(required=False)  # Temporarily change this to a CharField
+    image = serializers.FileField(required=False)
+    images = serializers.ListField(child=serializers.FileField(), required=False, allow_empty=False)
     engine_configurations = serializers.CharField()  # Temporarily change this to a CharField
 
+    def validate(self, attrs):
+        sources = [field for field in ('image_path', 'image', 'images') if field in attrs]
+        if len(sources) != 1:
+            raise serializers.ValidationError('Provide exactly one of image_path, image or images.')
+        return attrs
+
 
 class VoiceGenerationSerializer(serializers.Serializer):
     text = serializers.CharField()  # Temporarily change this to a CharField
+    # wav, or the raw PCM samples of the WAV with their format in response headers
+    audio_format = serializers.ChoiceField(choices=['wav', 'pcm'], default='wav')
 
 
 class IntentRecognitionSerializer(serializers.Serializer):
     engine_configurations = serializers.CharField()  # Temporarily change this to a CharField
     text = serializers.CharField()  # Temporarily change this to a CharField
+
+
+class IntentRecognitionBatchSerializer(serializers.Serializer):
+    engine_configurations = serializers.CharField()  # Temporarily change this to a CharField
+    texts = serializers.ListField(child=serializers.CharField(), allow_empty=False)
+
+
+class ImagesAndConfigurationsSerializer(PreprocessingSerializer):
+    images = serializers.ListField(child=serializers.FileField(), allow_empty=False)
+    engine_configurations = serializers.CharField()  # Temporarily change this to a CharField
+
+
+# atoms that work on an image and can be combined in a pipeline
+PIPELINE_ATOMS = [AtomType.OBJECT_DETECTION.value, AtomType.FACE_RECOGNITION.value,
+                  AtomType.HAND_FEATURE_EXTRACTION.value]
+
+
+class PipelineAtomSerializer(serializers.Serializer):
+    atom = serializers.ChoiceField(choices=PIPELINE_ATOMS)
+    algorithm_name = serializers.CharField(required=False)
+    engine_configurations = serializers.JSONField(required=False, default=dict)
+    # face recognition only
+    top_k = serializers.IntegerField(min_value=1, required=False)
+    threshold = serializers.FloatField(min_value=0.0, required=False)
+
+    def validate(self, attrs):
+        if attrs['atom'] != AtomType.HAND_FEATURE_EXTRACTION.value and not attrs.get('algorithm_name'):
+            raise serializers.ValidationError('algorithm_name is required for ' + attrs['atom'] + '.')
+        return attrs
+
+
+class PipelineSerializer(PreprocessingSerializer):
+    image = serializers.FileField()
+    # json list of atom specs, each atom runs on the same decoded image
+    atoms = serializers.JSONField()
+
+    def validate_atoms(self, value):
+        if not isinstance(value, list) or not value:
+            raise serializers.ValidationError('Expected a non empty list of atoms.')
+        atoms = PipelineAtomSerializer(data=value, many=True)
+        atoms.is_valid(raise_exception=True)
+        return atoms.validated_data
@@ -0,0 +1,246 @@
+import asyncio
+import json
+import time
+import uuid
+from contextlib import contextmanager
+
+import orjson
+
+from dronebuddylib.utils.logger import Logger
+from rest_framework.exceptions import APIException
+
+from drone_buddy_api.utils.exceptions import ExecutorSaturatedException
+from drone_buddy_api.utils.executors import get_executor_for_atom
+from drone_buddy_api.utils.metrics import RequestTimings, algorithm_label, current_request_timings, \
+    get_metrics_registry, get_metrics_settings
+from drone_buddy_api.utils.renderers import ORJSON_OPTIONS, encode_default
+from drone_buddy_api.utils.scheduler import RequestSchedule, current_request_schedule, get_scheduler_settings, \
+    parse_deadline_ms
+
+logger = Logger()
+
+# WebSocket close codes
+CLOSE_NORMAL = 1000
+CLOSE_POLICY_VIOLATION = 1008
+
+
+class LatestFrameSlot:
+    """
+    Holds the newest frame that has not been processed yet. Putting a frame while another one is still
+    waiting replaces it, so a consumer that falls behind always continues with the most recent frame and the
+    latency of a stream stays bounded by one inference instead of growing with a queue.
+    """
+
+    def __init__(self):
+        self.sequence = 0
+        self.dropped = 0
+        self.closed = False
+        self._frame = None
+        self._available = asyncio.Event()
+
+    def put(self, frame):
+        if self._frame is not None:
+            self.dropped += 1
+        self.sequence += 1
+        self._frame = (self.sequence, frame)
+        self._available.set()
+
+    async def get(self):
+        """
+        Returns the (sequence number, frame) waiting in the slot, waiting for one if the slot is empty.
+        Returns None once the slot is closed.
+        """
+        while self._frame is None and not self.closed:
+            self._available.clear()
+            await self._available.wait()
+        if self.closed:
+            return None
+        frame, self._frame = self._frame, None
+        return frame
+
+    def close(self):
+        self.closed = True
+        self._available.set()
+
+
+class StreamSession:
+    """
+    A stream of frames over one WebSocket connection. The first message of the connection is a JSON object
+    validated by ``serializer_class``, e.g. the algorithm and engine configurations, and applies to every
+    frame. Each binary message after it is a frame, processed by ``process_frame`` on the inference executor
+    of ``atom``, one frame at a time per session. Frames for which ``process_frame`` returns None are not
+    answered. Frames are counted in the metrics like requests to the endpoint ``name``.
+    """
+    atom = None
+    serializer_class = None
+    name = None
+
+    def __init__(self, validated_data: dict):
+        self.session_id = uuid.uuid4().hex
+        self.validated_data = validated_data
+
+    def process_frame(self, frame: bytes) -> dict:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class StreamConnection:
+    """
+    The client of a WebSocket connection as the scheduler and the metrics see it. The client id and the time
+    budget are read from the headers of the handshake, like SchedulingMiddleware reads them from each request,
+    and every frame is scheduled and measured as one request.
+    """
+
+    def __init__(self, scope):
+        scheduler_settings = get_scheduler_settings()
+        headers = dict((name.decode('latin-1').lower(), value.decode('latin-1'))
+                       for name, value in scope.get('headers', []))
+        explicit_client_id = headers.get(scheduler_settings['CLIENT_ID_HEADER'].lower())
+        client = scope.get('client')
+        self.client_id = explicit_client_id or (client[0] if client else '')
+        self.explicit_client_id = bool(explicit_client_id)
+        self.scheduling = scheduler_settings['ENABLED']
+        self.deadline_ms = parse_deadline_ms(headers.get(scheduler_settings['DEADLINE_HEADER'].lower()),
+                                             scheduler_settings['DEFAULT_DEADLINE_MS'])
+        self.metrics = get_metrics_settings()['ENABLED']
+
+    @contextmanager
+    def frame_context(self, session: StreamSession):
+        """
+        Runs the processing of one frame with a schedule for the inference scheduler and with timings, which
+        are recorded under the session's endpoint when the block is left.
+        """
+        schedule_token = timings_token = None
+        if self.scheduling:
+            deadline = time.monotonic() + self.deadline_ms / 1000.0 if self.deadline_ms is not None else None
+            schedule_token = current_request_schedule.set(
+                RequestSchedule(self.client_id, deadline, self.explicit_client_id))
+        if self.metrics:
+            get_metrics_registry().request_started()
+            timings = RequestTimings()
+            timings_token = current_request_timings.set(timings)
+        status_code = 500
+        try:
+            yield
+            status_code = 200
+        except APIException as e:
+            status_code = e.status_code
+            raise
+        finally:
+            if schedule_token is not None:
+                current_request_schedule.reset(schedule_token)
+            if timings_token is not None:
+                current_request_timings.reset(timings_token)
+                get_metrics_registry().request_finished(
+                    session.name, algorithm_label(session.validated_data.get('algorithm_name', '')), status_code,
+                    timings, time.perf_counter() - timings.started)
+
+
+async def send_json(send, message: dict):
+    await send({'type': 'websocket.send',
+                'text': orjson.dumps(message, default=encode_default, option=ORJSON_OPTIONS).decode('utf-8')})
+
+
+async def open_session(session_class, receive, send):
+    """
+    Waits for the opening message and creates the session, or closes the connection if it is not valid.
+    """
+    message = await receive()
+    if message['type'] == 'websocket.disconnect':
+        return None
+    try:
+        data = json.loads(message.get('text') or '')
+    except ValueError:
+        data = None
+    serializer = session_class.serializer_class(data=data)
+    if not isinstance(data, dict) or not serializer.is_valid():
+        errors = serializer.errors if isinstance(data, dict) else ['The first message must be a JSON object.']
+        await send_json(send, {'type': 'error', 'errors': errors})
+        await send({'type': 'websocket.close', 'code': CLOSE_POLICY_VIOLATION})
+        return None
+
+    session = session_class(serializer.validated_data)
+    await send_json(send, {'type': 'session', 'session_id': session.session_id})
+    logger.log_info("stream session", 'Opened ' + session_class.__name__ + ' ' + session.session_id)
+    return session
+
+
+async def process_frames(session: StreamSession, connection: StreamConnection, slot: LatestFrameSlot, send):
+    executor = get_executor_for_atom(session.atom)
+    while True:
+        item = await slot.get()
+        if item is None:
+            return
+        sequence, frame = item
+        started = time.perf_counter()
+        try:
+            with connection.frame_context(session):
+                result = await executor.run(session.process_frame, frame)
+        except ExecutorSaturatedException:
+            # the server is overloaded, skip this frame and continue with the next one
+            slot.dropped += 1
+            continue
+        except APIException as e:
+            await send_json(send, {'type': 'error', 'frame': sequence, 'errors': e.detail})
+            continue
+        except Exception as e:
+            logger.log_error("stream session", 'Frame ' + str(sequence) + ' of ' + session.session_id
+                             + ' failed : ' + str(e))
+            await send_json(send, {'type': 'error', 'frame': sequence, 'errors': ['Processing the frame failed.']})
+            continue
+        if slot.closed:
+            return
+        if result is None:
+            continue
+        await send_json(send, {
+            'type': 'result',
+            'frame': sequence,
+            'dropped': slot.dropped,
+            'processing_ms': round((time.perf_counter() - started) * 1000.0, 3),
+            'result': result,
+        })
+
+
+def stream_session_endpoint(session_class):
+    """
+    Creates the ASGI application serving WebSocket stream sessions of the given StreamSession subclass.
+    Frames arriving while the previous one is processed replace each other (latest frame wins), results
+    report how many frames were dropped so far.
+    """
+
+    async def endpoint(scope, receive, send):
+        message = await receive()
+        if message['type'] != 'websocket.connect':
+            return
+        await send({'type': 'websocket.accept'})
+        session = await open_session(session_class, receive, send)
+        if session is None:
+            return
+
+        slot = LatestFrameSlot()
+        worker = asyncio.ensure_future(process_frames(session, StreamConnection(scope), slot, send))
+        try:
+            while not worker.done():
+                receiving = asyncio.ensure_future(receive())
+                await asyncio.wait([receiving, worker], return_when=asyncio.FIRST_COMPLETED)
+                if not receiving.done():
+                    receiving.cancel()
+                    break
+                message = receiving.result()
+                if message['type'] == 'websocket.disconnect':
+                    break
+                if message.get('bytes') is not None:
+                    slot.put(message['bytes'])
+                elif message.get('text') == 'close':
+                    await send({'type': 'websocket.close', 'code': CLOSE_NORMAL})
+                    break
+        finally:
+            slot.close()
+            await asyncio.gather(worker, return_exceptions=True)
+            session.close()
+            logger.log_info("stream session", 'Closed ' + session.session_id + ', dropped '
+                            + str(slot.dropped) + ' of ' + str(slot.sequence) + ' frames')
+
+    return endpoint
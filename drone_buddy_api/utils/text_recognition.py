@@ -0,0 +1,166 @@
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+from django.conf import settings
+from dronebuddylib.atoms.textrecognition.text_recognition_result import BoundingPoly, \
+    TextRecognitionFullInformation, TextRecognitionResult, Vertices
+
+from drone_buddy_api.utils.engine_pool import get_engine_pool
+from drone_buddy_api.utils.exceptions import TextRecognitionBackendException
+from drone_buddy_api.views.enum import AtomType
+
+DEFAULT_TEXT_RECOGNITION_SETTINGS = {
+    'MAX_BATCH_SIZE': 16,
+    'LOCAL_LATENCY_MS': 0,
+}
+
+# algorithm name of the offline stand-in backend, next to the algorithms of TextRecognitionAlgorithm
+LOCAL_ALGORITHM = 'LOCAL'
+
+
+def get_text_recognition_settings() -> dict:
+    return {**DEFAULT_TEXT_RECOGNITION_SETTINGS, **getattr(settings, 'TEXT_RECOGNITION', {})}
+
+
+def read_upload(uploaded_file) -> bytes:
+    uploaded_file.seek(0)
+    return uploaded_file.read()
+
+
+def bounding_poly(x: float, y: float, width: float, height: float) -> BoundingPoly:
+    return BoundingPoly([Vertices(x, y), Vertices(x + width, y), Vertices(x + width, y + height),
+                         Vertices(x, y + height)])
+
+
+def reading_order(boxes: list) -> list:
+    """
+    Sorts (x, y, width, height) boxes into lines, top to bottom, and every line left to right.
+    """
+    lines = []
+    for box in sorted(boxes, key=lambda box: box[1] + box[3] / 2.0):
+        center = box[1] + box[3] / 2.0
+        if lines and lines[-1][0] <= center <= lines[-1][1]:
+            lines[-1][2].append(box)
+        else:
+            lines.append((box[1], box[1] + box[3], [box]))
+    return [box for _, _, line in lines for box in sorted(line)]
+
+
+class LocalTextRecognitionEngine:
+    """
+    Offline stand-in for a cloud OCR backend, used to benchmark the text recognition path without the cloud
+    service. It finds text like regions (dense clusters of strong edges) with OpenCV and reports them as
+    placeholder words, shaped like a Google Vision result: the first entry spans all regions. Each backend call
+    waits ``latency_ms`` to model the round trip of a remote service, which batching pays once per batch.
+    """
+
+    def __init__(self, latency_ms: float = 0):
+        self.latency_ms = latency_ms
+
+    @classmethod
+    def from_settings(cls):
+        return cls(get_text_recognition_settings()['LOCAL_LATENCY_MS'])
+
+    def recognize_text(self, image) -> TextRecognitionResult:
+        """
+        Recognizes the text of an image path or of encoded image bytes.
+        """
+        if isinstance(image, (str, os.PathLike)):
+            with open(image, 'rb') as image_file:
+                image = image_file.read()
+        return self.recognize_texts([image])[0]
+
+    def recognize_texts(self, images: list) -> list:
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        return [self._recognize(image) for image in images]
+
+    def _recognize(self, image: bytes) -> TextRecognitionResult:
+        gray = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            raise TextRecognitionBackendException('The image could not be decoded.')
+        gradient = cv2.morphologyEx(gray, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+        _, edges = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+        # join the characters of a word into one horizontal blob
+        words = cv2.morphologyEx(edges, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (9, 1)))
+        contours, _ = cv2.findContours(words, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+        boxes = []
+        for contour in contours:
+            x, y, width, height = cv2.boundingRect(contour)
+            if width < 8 or height < 8:
+                continue
+            # words are mostly solid once their characters are joined, noise is not
+            if cv2.countNonZero(words[y:y + height, x:x + width]) / float(width * height) < 0.4:
+                continue
+            boxes.append((x, y, width, height))
+        if not boxes:
+            return TextRecognitionResult('', '', [])
+
+        full_information = [TextRecognitionFullInformation('und', 'word' + str(index + 1), bounding_poly(*box))
+                            for index, box in enumerate(reading_order(boxes))]
+        text = ' '.join(item.description for item in full_information)
+        x0, y0 = min(box[0] for box in boxes), min(box[1] for box in boxes)
+        x1, y1 = max(box[0] + box[2] for box in boxes), max(box[1] + box[3] for box in boxes)
+        full_information.insert(0, TextRecognitionFullInformation('und', text, bounding_poly(x0, y0, x1 - x0,
+                                                                                            y1 - y0)))
+        return TextRecognitionResult(text, 'und', full_information)
+
+
+def google_vision_recognize_texts(client, images: list) -> list:
+    """
+    Sends several images to Google Vision in one batch_annotate_images call, in memory.
+    """
+    from google.cloud import vision
+
+    feature = vision.Feature(type_=vision.Feature.Type.TEXT_DETECTION)
+    response = client.batch_annotate_images(requests=[
+        vision.AnnotateImageRequest(image=vision.Image(content=image), features=[feature]) for image in images])
+    results = []
+    for image_response in response.responses:
+        if image_response.error.message:
+            raise TextRecognitionBackendException(image_response.error.message)
+        texts = image_response.text_annotations
+        if not texts:
+            results.append(TextRecognitionResult('', '', []))
+        else:
+            results.append(TextRecognitionResult(image_response.full_text_annotation.text, texts[0].locale, texts))
+    return results
+
+
+def recognize_texts_with_engine(engine, images: list) -> list:
+    """
+    Runs text recognition on several encoded images with one backend call where the engine supports it:
+    the local engine and Google Vision take a whole batch, other engines get the images one at a time through
+    a temporary file, as dronebuddylib engines only read images from a path.
+    """
+    if hasattr(engine, 'recognize_texts'):
+        return engine.recognize_texts(images)
+    client = getattr(getattr(engine, 'text_recognition_engine', None), 'client', None)
+    if client is not None and hasattr(client, 'batch_annotate_images'):
+        return google_vision_recognize_texts(client, images)
+
+    results = []
+    for image in images:
+        with tempfile.NamedTemporaryFile(suffix='.img') as image_file:
+            image_file.write(image)
+            image_file.flush()
+            results.append(engine.recognize_text(image_file.name))
+    return results
+
+
+def recognize_texts(algorithm_name, engine_configurations, images: list) -> list:
+    """
+    Recognizes the text of encoded images (JPEG, PNG, ...) given as bytes, in batches of at most
+    MAX_BATCH_SIZE images on one pooled engine, scheduled as one unit of work per image.
+    """
+    max_batch_size = get_text_recognition_settings()['MAX_BATCH_SIZE']
+    results = []
+    with get_engine_pool().acquire(AtomType.TEXT_RECOGNITION, algorithm_name, engine_configurations,
+                                   units=len(images)) as engine:
+        for start in range(0, len(images), max_batch_size):
+            results.extend(recognize_texts_with_engine(engine, images[start:start + max_batch_size]))
+    return results
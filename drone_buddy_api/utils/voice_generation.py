@@ -0,0 +1,221 @@
+import hashlib
+import os
+import queue
+import re
+import tempfile
+import threading
+from concurrent.futures import Future, TimeoutError
+
+from django.conf import settings
+from dronebuddylib.utils.logger import Logger
+
+from drone_buddy_api.utils.exceptions import VoiceGenerationBusyException, VoiceGenerationException
+from drone_buddy_api.utils.metrics import PHASE_INFERENCE, timed_phase
+
+logger = Logger()
+
+DEFAULT_VOICE_GENERATION_SETTINGS = {
+    'CACHE_DIR': None,
+    'CACHE_MAX_BYTES': 256 * 1024 * 1024,
+    'QUEUE_SIZE': 32,
+    'TIMEOUT_SECONDS': 30,
+    'RATE': None,
+    'VOICE': None,
+    'CHUNK_BYTES': 64 * 1024,
+    'ENGINE': 'pyttsx3',
+}
+
+
+def get_voice_generation_settings() -> dict:
+    return {**DEFAULT_VOICE_GENERATION_SETTINGS, **getattr(settings, 'VOICE_GENERATION', {})}
+
+
+def normalize_phrase(text: str) -> str:
+    # case and punctuation change how a phrase is spoken, only whitespace is collapsed
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class AudioCache:
+    """
+    Content addressed store of rendered WAV files: the file name is the hash of the phrase and of everything
+    that changes how it sounds (voice, rate). Files are written to a temporary name and renamed into place, so
+    worker processes sharing the directory never read a partial file. Once the directory is over ``max_bytes``
+    the least recently written files are removed.
+    """
+
+    def __init__(self, directory, max_bytes: int):
+        self.directory = str(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(text: str, voice, rate) -> str:
+        return hashlib.sha256('\0'.join([text, str(voice), str(rate)]).encode('utf-8')).hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + '.wav')
+
+    def open(self, key: str):
+        """
+        Returns the cached audio opened for reading, or None. The file is opened rather than checked for, an open
+        file stays readable after another request prunes it.
+        """
+        try:
+            return open(self.path(key), 'rb')
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, audio: bytes) -> str:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(file_descriptor, 'wb') as audio_file:
+            audio_file.write(audio)
+        os.replace(temporary_path, path)
+        self.prune()
+        return path
+
+    def prune(self):
+        entries = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.wav'):
+                    stat = os.stat(os.path.join(root, name))
+                    entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        size_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if size_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            size_bytes -= size
+
+
+def create_tts_engine(voice=None, rate=None):
+    import pyttsx3
+
+    engine = pyttsx3.init()
+    if voice is not None:
+        engine.setProperty('voice', voice)
+    if rate is not None:
+        engine.setProperty('rate', rate)
+    return engine
+
+
+class SpeechSynthesizer:
+    """
+    Owns one long lived pyttsx3 engine on a dedicated thread. pyttsx3 engines are neither thread safe nor cheap
+    to initialize, so requests are queued to that thread, which renders each phrase to a WAV file instead of
+    playing it and hands the bytes back. At most ``queue_size`` requests wait; more are rejected.
+    """
+
+    def __init__(self, queue_size: int, timeout_seconds: float, voice=None, rate=None, cache: AudioCache = None,
+                 engine_factory=create_tts_engine):
+        self.timeout_seconds = timeout_seconds
+        self.voice = voice
+        self.rate = rate
+        self.cache = cache
+        self.engine_factory = engine_factory
+        self.synthesized = 0
+        self._requests = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name='voice-generation', daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def from_settings(cls):
+        from drone_buddy_api.utils.benchmark import STUB_ALGORITHM, create_stub_tts_engine
+
+        voice_settings = get_voice_generation_settings()
+        cache = None
+        if voice_settings['CACHE_DIR'] is not None:
+            cache = AudioCache(voice_settings['CACHE_DIR'], voice_settings['CACHE_MAX_BYTES'])
+        engine_factory = create_stub_tts_engine if voice_settings['ENGINE'] == STUB_ALGORITHM else create_tts_engine
+        return cls(voice_settings['QUEUE_SIZE'], voice_settings['TIMEOUT_SECONDS'], voice_settings['VOICE'],
+                   voice_settings['RATE'], cache, engine_factory)
+
+    def cache_key(self, text: str) -> str:
+        return AudioCache.make_key(text, self.voice, self.rate)
+
+    def get_cached(self, text: str):
+        """
+        Returns the cached audio of the phrase opened for reading, or None. The caller closes the file.
+        """
+        return self.cache.open(self.cache_key(text)) if self.cache is not None else None
+
+    def synthesize(self, text: str) -> bytes:
+        """
+        Renders the phrase to WAV bytes on the synthesis thread and stores them in the audio cache.
+
+        Raises:
+            VoiceGenerationBusyException: if the request queue is full.
+            VoiceGenerationException: if synthesis failed or timed out.
+        """
+        future = Future()
+        try:
+            self._requests.put_nowait((text, future))
+        except queue.Full:
+            raise VoiceGenerationBusyException()
+        try:
+            # queued and synthesized on the TTS thread, the wait is the inference time of the request
+            with timed_phase(PHASE_INFERENCE):
+                return future.result(timeout=self.timeout_seconds)
+        except TimeoutError:
+            raise VoiceGenerationException('Voice generation timed out.')
+
+    def _run(self):
+        engine = None
+        while True:
+            text, future = self._requests.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                # an identical phrase queued earlier may have been rendered in the meantime
+                audio_file = self.get_cached(text)
+                if audio_file is not None:
+                    with audio_file:
+                        future.set_result(audio_file.read())
+                    continue
+                if engine is None:
+                    engine = self.engine_factory(self.voice, self.rate)
+                audio = self._render(engine, text)
+                if self.cache is not None:
+                    self.cache.put(self.cache_key(text), audio)
+                self.synthesized += 1
+                future.set_result(audio)
+            except Exception as e:
+                logger.log_error("voice generation", 'Synthesis failed : ' + str(e))
+                future.set_exception(VoiceGenerationException())
+                # start over with a fresh engine, a failed run may leave the driver loop in a bad state
+                engine = None
+
+    @staticmethod
+    def _render(engine, text: str) -> bytes:
+        file_descriptor, path = tempfile.mkstemp(suffix='.wav')
+        os.close(file_descriptor)
+        try:
+            engine.save_to_file(text, path)
+            engine.runAndWait()
+            with open(path, 'rb') as audio_file:
+                audio = audio_file.read()
+        finally:
+            os.remove(path)
+        if not audio:
+            raise VoiceGenerationException()
+        return audio
+
+    def queue_depth(self) -> int:
+        return self._requests.qsize()
+
+
+_synthesizer = None
+_synthesizer_lock = threading.Lock()
+
+
+def get_speech_synthesizer() -> SpeechSynthesizer:
+    global _synthesizer
+    with _synthesizer_lock:
+        if _synthesizer is None:
+            _synthesizer = SpeechSynthesizer.from_settings()
+    return _synthesizer
@@ -0,0 +1,136 @@
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from drone_buddy_api.utils.atom_loading import LazyLogger, is_atom_enabled
+from drone_buddy_api.utils.engine_pool import get_engine_pool
+from drone_buddy_api.utils.preload import is_preloading
+from drone_buddy_api.views.enum import AtomType
+
+logger = LazyLogger()
+
+DEFAULT_WARMUP_SETTINGS = {
+    'ENABLED': False,
+    'BACKGROUND': True,
+    'IMAGE_SHAPE': (480, 640, 3),
+    'ENGINES': [],
+}
+
+
+class WarmupState:
+    PENDING = 'PENDING'
+    RUNNING = 'RUNNING'
+    READY = 'READY'
+    FAILED = 'FAILED'
+
+    def __init__(self):
+        self.status = self.PENDING
+        self.engines = []
+        self.errors = []
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def is_ready(self) -> bool:
+        return self.status == self.READY
+
+    def to_json(self):
+        with self._lock:
+            duration = None
+            if self.started_at is not None and self.finished_at is not None:
+                duration = self.finished_at - self.started_at
+            return {
+                'status': self.status,
+                'engines': list(self.engines),
+                'errors': list(self.errors),
+                'duration_seconds': duration,
+            }
+
+
+warmup_state = WarmupState()
+
+
+def get_warmup_settings() -> dict:
+    return {**DEFAULT_WARMUP_SETTINGS, **getattr(settings, 'WARMUP', {})}
+
+
+def run_dummy_inference(atom: AtomType, engine, spec: dict, image_shape):
+    """
+    Runs the engine once so that lazily allocated buffers, graphs and weights are in place before the
+    first real request arrives.
+    """
+    if atom == AtomType.OBJECT_DETECTION:
+        engine.get_detected_objects(np.zeros(image_shape, np.uint8))
+    elif atom == AtomType.FACE_RECOGNITION:
+        engine.recognize_face(np.zeros(image_shape, np.uint8))
+    elif atom == AtomType.HAND_FEATURE_EXTRACTION:
+        engine.get_gesture(np.zeros(image_shape, np.uint8))
+    elif atom == AtomType.INTENT_RECOGNITION and spec.get('warmup_text'):
+        engine.recognize_intent(spec['warmup_text'])
+    elif atom == AtomType.TEXT_RECOGNITION and spec.get('warmup_image_path'):
+        engine.recognize_text(spec['warmup_image_path'])
+
+
+def run_warmup():
+    warmup_settings = get_warmup_settings()
+    warmup_state.status = WarmupState.RUNNING
+    warmup_state.started_at = time.monotonic()
+
+    for spec in warmup_settings['ENGINES']:
+        if not is_atom_enabled(spec['atom']):
+            # warming up an atom this process does not serve would load its libraries for nothing
+            continue
+        atom = AtomType[spec['atom']]
+        algorithm_name = spec.get('algorithm_name')
+        engine_configurations = spec.get('engine_configurations', {})
+        name = atom.value + ' : ' + str(algorithm_name)
+        try:
+            logger.log_info("warmup", 'Warming up ' + name)
+            with get_engine_pool().acquire(atom, algorithm_name, engine_configurations) as engine:
+                run_dummy_inference(atom, engine, spec, tuple(warmup_settings['IMAGE_SHAPE']))
+            with warmup_state._lock:
+                warmup_state.engines.append(name)
+        except Exception as e:
+            logger.log_error("warmup", 'Warm up failed for ' + name + ' : ' + str(e))
+            with warmup_state._lock:
+                warmup_state.errors.append({'engine': name, 'error': str(e)})
+
+    warmup_state.finished_at = time.monotonic()
+    warmup_state.status = WarmupState.FAILED if warmup_state.errors else WarmupState.READY
+    logger.log_info("warmup", 'Warm up finished with status ' + warmup_state.status)
+
+
+def is_serving_process() -> bool:
+    """
+    Management commands such as migrate also load the apps, only warm up when the process serves requests.
+    Under runserver the autoreloader parent only watches files, the child (RUN_MAIN) serves.
+    """
+    if not sys.argv or not os.path.basename(sys.argv[0]).startswith('manage.py'):
+        return True
+    if len(sys.argv) < 2 or sys.argv[1] != 'runserver':
+        return False
+    return os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv
+
+
+def start_warmup():
+    warmup_settings = get_warmup_settings()
+    if not warmup_settings['ENABLED'] or not warmup_settings['ENGINES']:
+        warmup_state.status = WarmupState.READY
+        return
+    if not is_serving_process():
+        return
+    if is_preloading():
+        # the gunicorn master must not start threads before it forks, every worker warms up after the fork
+        return
+    launch_warmup(warmup_settings)
+
+
+def launch_warmup(warmup_settings: dict):
+    if warmup_settings['BACKGROUND']:
+        threading.Thread(target=run_warmup, name='engine-warmup', daemon=True).start()
+    else:
+        run_warmup()
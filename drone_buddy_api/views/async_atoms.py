@@ -0,0 +1,59 @@
+from django.http import JsonResponse
+
+from drone_buddy_api.utils.atom_loading import LazyView
+from drone_buddy_api.utils.exceptions import ExecutorSaturatedException
+from drone_buddy_api.utils.executors import get_executor_for_atom
+from drone_buddy_api.utils.scheduler import deadline_exceeded_response, is_past_deadline
+from drone_buddy_api.views.enum import AtomType
+
+
+def render_view(view, request, *args, **kwargs):
+    if is_past_deadline():
+        # the deadline passed while the request waited for the executor, do not even decode it
+        return deadline_exceeded_response()
+    response = view(request, *args, **kwargs)
+    # render on the worker thread as well, so that serialization does not run on the event loop
+    if hasattr(response, 'render') and callable(response.render):
+        response.render()
+    return response
+
+
+def offload_to_executor(view, atom: AtomType):
+    """
+    Wraps a synchronous atom view into an async view that runs it, including parsing, decoding, inference
+    and rendering, on the bounded executor of the atom. When the executor queue is full the request is
+    rejected right away with 503 instead of piling up.
+    """
+
+    async def async_view(request, *args, **kwargs):
+        try:
+            return await get_executor_for_atom(atom).run(render_view, view, request, *args, **kwargs)
+        except ExecutorSaturatedException as e:
+            response = JsonResponse({'detail': str(e.detail)}, status=e.status_code)
+            response['Retry-After'] = '1'
+            return response
+
+    # csrf_exempt() of Django 4.2 turns coroutine functions into sync views, mark the view directly
+    async_view.csrf_exempt = True
+    return async_view
+
+
+# the views are imported on their first request, on the executor thread instead of the event loop
+detect_objects_async = offload_to_executor(
+    LazyView('drone_buddy_api.views.object_detection.DetectObjectsView'), AtomType.OBJECT_DETECTION)
+detect_objects_batch_async = offload_to_executor(
+    LazyView('drone_buddy_api.views.object_detection.DetectObjectsBatchView'), AtomType.OBJECT_DETECTION)
+recognize_face_async = offload_to_executor(
+    LazyView('drone_buddy_api.views.face_recognition.FaceRecognitionView'), AtomType.FACE_RECOGNITION)
+recognize_hand_gesture_async = offload_to_executor(
+    LazyView('drone_buddy_api.views.hand_feature_extraction.HandFeatureExtractionView'),
+    AtomType.HAND_FEATURE_EXTRACTION)
+recognize_intent_async = offload_to_executor(
+    LazyView('drone_buddy_api.views.intent_recognition.IntentRecognitionView'), AtomType.INTENT_RECOGNITION)
+recognize_intents_async = offload_to_executor(
+    LazyView('drone_buddy_api.views.intent_recognition.IntentRecognitionBatchView'), AtomType.INTENT_RECOGNITION)
+recognize_text_async = offload_to_executor(
+    LazyView('drone_buddy_api.views.text_recognition.TextRecognitionView'), AtomType.TEXT_RECOGNITION)
+# the atoms of a pipeline fan out to the pipeline executor, the request itself counts against the vision pool
+run_pipeline_async = offload_to_executor(
+    LazyView('drone_buddy_api.views.pipeline.PipelineView'), AtomType.OBJECT_DETECTION)
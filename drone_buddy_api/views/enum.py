@@ -0,0 +1,33 @@
+import enum
+
+
+class AtomType(enum.Enum):
+    OBJECT_DETECTION = 'OBJECT_DETECTION'
+    FACE_RECOGNITION = 'FACE_RECOGNITION'
+    HAND_FEATURE_EXTRACTION = 'HAND_FEATURE_EXTRACTION'
+    INTENT_RECOGNITION = 'INTENT_RECOGNITION'
+    TEXT_RECOGNITION = 'TEXT_RECOGNITION'
+
+
+class InferencePool(enum.Enum):
+    VISION = 'VISION'
+    TEXT = 'TEXT'
+
+
+class PriorityClass(enum.Enum):
+    # most urgent first
+    CRITICAL = 'CRITICAL'
+    INTERACTIVE = 'INTERACTIVE'
+    BACKGROUND = 'BACKGROUND'
+
+
+class PixelFormat(enum.Enum):
+    BGR = 'BGR'
+    RGB = 'RGB'
+
+
+class Interpolation(enum.Enum):
+    NEAREST = 'NEAREST'
+    LINEAR = 'LINEAR'
+    AREA = 'AREA'
+    CUBIC = 'CUBIC'
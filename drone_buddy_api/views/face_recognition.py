@@ -1,23 +1,31 @@
 import json
 
-import cv2
-import numpy as np
-from dronebuddylib import ObjectDetectionEngine, FaceRecognitionEngine
-from dronebuddylib.atoms.objectdetection.detected_object import DetectedCategories, ObjectDetectionResult
-from dronebuddylib.models import EngineConfigurations
-from dronebuddylib.models.enums import VisionAlgorithm, FaceRecognitionAlgorithm
+from dronebuddylib.models.enums import FaceRecognitionAlgorithm
 from dronebuddylib.utils.logger import Logger
 from rest_framework.views import APIView
-from rest_framework import serializers
 from rest_framework.response import Response
-from rest_framework.parsers import MultiPartParser, FormParser
 
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 
-from drone_buddy_api.utils.serializers import ImageAndConfigurationsSerializer, FaceRecognitionSerializer
+from drone_buddy_api.utils.adaptive_quality import adapt_engine_configurations, adapt_preprocessing, \
+    adaptive_quality
+from drone_buddy_api.utils.benchmark import STUB_ALGORITHM
+from drone_buddy_api.utils.engine_pool import get_engine_pool
+from drone_buddy_api.utils.inference_workers import get_inference_client, uses_inference_workers
+from drone_buddy_api.utils.metrics import PHASE_INFERENCE, timed_phase, timed_request_parsing
+from drone_buddy_api.utils.preprocessing import preprocess_image
+from drone_buddy_api.utils.schemas import RAW_FRAME_PROPERTIES, PREPROCESSING_PROPERTIES
+from drone_buddy_api.utils.face_enrollment import enroll_faces, scan_directory, read_manifest, parse_manifest
+from drone_buddy_api.utils.face_index import get_face_index, get_face_index_settings, recognize_faces, \
+    encode_image_file, read_known_faces_version
+from drone_buddy_api.utils.serializers import FaceRecognitionSerializer, FaceRecognitionImageSerializer, \
+    FaceEnrollmentSerializer
+from drone_buddy_api.utils.result_cache import cached_atom_response, invalidate_atom_results
+from drone_buddy_api.utils.scheduler import get_scheduler
+from drone_buddy_api.views.enum import AtomType
 
 # Define the serializer
 
@@ -35,7 +43,8 @@ class FaceRecognitionView(APIView):
             openapi.Parameter(
                 'algorithm_name', in_=openapi.IN_PATH,
                 type=openapi.TYPE_STRING,
-                enum=[algo.value for algo in FaceRecognitionAlgorithm],  # Enum values for the dropdown
+                # Enum values for the dropdown, STUB is an offline stand-in for benchmarks
+                enum=[algo.value for algo in FaceRecognitionAlgorithm] + [STUB_ALGORITHM],
                 description='The name of the algorithm to use for detection',
                 required=True,
             ),
@@ -44,6 +53,12 @@ class FaceRecognitionView(APIView):
             type=openapi.TYPE_OBJECT,
             properties={
                 'image': openapi.Schema(type=openapi.TYPE_FILE, description='Image file to upload'),
+                **RAW_FRAME_PROPERTIES,
+                **PREPROCESSING_PROPERTIES,
+                'top_k': openapi.Schema(type=openapi.TYPE_INTEGER,
+                                        description='Also return the k nearest known faces of every face'),
+                'threshold': openapi.Schema(type=openapi.TYPE_NUMBER,
+                                            description='Maximum encoding distance of a match, defaults to 0.6'),
                 'engine_configurations': openapi.Schema(
                     type=openapi.TYPE_OBJECT,
                     additional_properties=openapi.Schema(type=openapi.TYPE_STRING)
@@ -52,16 +67,19 @@ class FaceRecognitionView(APIView):
         ),
         responses={200: openapi.Response('Object detection successful')}
     )
+    @timed_request_parsing
+    @cached_atom_response(AtomType.FACE_RECOGNITION, 'recognize_face', key_version=read_known_faces_version)
+    @adaptive_quality(AtomType.FACE_RECOGNITION)
     def post(self, request, *args, **kwargs):
-        serializer = ImageAndConfigurationsSerializer(data=request.data)
+        serializer = FaceRecognitionImageSerializer(data=request.data)
         if serializer.is_valid():
             image = serializer.validated_data['image']
-            # Read the image data into a memory buffer
-            image_data = image.read()
-            # Convert the image data to a numpy array
-            numpy_array = np.frombuffer(image_data, np.uint8)
-            # Decode the image data into a format that OpenCV understands
-            cv_image = cv2.imdecode(numpy_array, cv2.IMREAD_COLOR)
+            # Decode the upload once, straight from the upload buffer (raw frames are not decoded at all),
+            # cropped and downscaled as requested or as the adaptive quality level asks. Only names are returned,
+            # nothing needs to be mapped back. The face index must see the adapted max_side too, a downscaled frame
+            # is not scaled down again
+            options = adapt_preprocessing(serializer.validated_data)
+            cv_image, _ = preprocess_image(options)
 
             # Now you can use the cv_image with OpenCV for processing
             # For example, let's just save it to the server
@@ -73,9 +91,15 @@ class FaceRecognitionView(APIView):
 
             logger.log_info("object_ detection", 'Received image: ' + image.name)
             algorithm_name = request.query_params['algorithm_name']
-            engine_configs = EngineConfigurations(engine_configurations)
-            engine = FaceRecognitionEngine(algorithm_name, engine_configs)
-            detected_objects = engine.recognize_face(cv_image)
+            top_k = serializer.validated_data.get('top_k')
+            engine_configurations = adapt_engine_configurations(AtomType.FACE_RECOGNITION, algorithm_name,
+                                                                engine_configurations)
+            detected_objects, matches = recognize_faces_in_image(algorithm_name, engine_configurations, cv_image,
+                                                                 options)
+            if top_k and matches is not None:
+                return Response({'message': 'Detection started using ' + algorithm_name,
+                                 'result': detected_objects,
+                                 'matches': matches_to_json(matches)})
 
             # Your logic here...
             return Response({'message': 'Detection started using ' + algorithm_name,
@@ -114,6 +138,7 @@ class FaceRecognitionRememberView(APIView):
         ),
         responses={200: openapi.Response('Object detection successful')}
     )
+    @timed_request_parsing
     def post(self, request, *args, **kwargs):
         serializer = FaceRecognitionSerializer(data=request.data)
         if serializer.is_valid():
@@ -137,12 +162,111 @@ class FaceRecognitionRememberView(APIView):
             logger.log_info("object_ detection", 'Received image: ' + image_path)
             algorithm_name = request.query_params['algorithm_name']
             person_name = serializer.validated_data['person_name']
-            engine_configs = EngineConfigurations(engine_configurations)
-            engine = FaceRecognitionEngine(algorithm_name, engine_configs)
-            detected_objects = engine.remember_face(image_path, person_name)
+            # loaded (built from the known faces on first use) before the person is remembered, so that the
+            # append below adds them once
+            face_index = get_face_index() if use_face_index(algorithm_name) else None
+            with get_engine_pool().acquire(AtomType.FACE_RECOGNITION, algorithm_name,
+                                           engine_configurations) as engine:
+                detected_objects = engine.remember_face(image_path, person_name)
+            if face_index is not None:
+                face_encodings = encode_image_file(image_path)
+                if len(face_encodings) > 0:
+                    face_index.append([person_name], face_encodings[:1])
+                else:
+                    logger.log_warning("face recognition", 'No face found to index in ' + image_path)
+            # the known faces changed, cached recognitions may be wrong now
+            invalidate_atom_results(AtomType.FACE_RECOGNITION)
 
             # Your logic here...
             return Response({'message': 'Detection started using ' + algorithm_name,
                              'result': detected_objects})
         else:
             return Response(serializer.errors, status=400)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class FaceRecognitionBulkRememberView(APIView):
+
+    # Define the POST method
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'directory': openapi.Schema(type=openapi.TYPE_STRING,
+                                            description='Server directory with one folder of images per person, '
+                                                        'or images named after the person'),
+                'manifest_path': openapi.Schema(type=openapi.TYPE_STRING,
+                                                description='Server path of a json or csv manifest'),
+                'manifest': openapi.Schema(type=openapi.TYPE_OBJECT,
+                                           additional_properties=openapi.Schema(
+                                               type=openapi.TYPE_ARRAY,
+                                               items=openapi.Schema(type=openapi.TYPE_STRING)),
+                                           description='Image paths per person name'),
+            },
+        ),
+        responses={200: openapi.Response('Faces enrolled, failed images are listed in the result')},
+        operation_description='Remembers the faces of many images at once. The first image of every person is '
+                              'stored with the known faces of the face recognition engine, which keeps one image '
+                              'per person, every image is added to the face index when FACE_INDEX is enabled.'
+    )
+    @timed_request_parsing
+    def post(self, request, *args, **kwargs):
+        serializer = FaceEnrollmentSerializer(data=request.data)
+        if serializer.is_valid():
+            if serializer.validated_data.get('directory'):
+                entries = scan_directory(serializer.validated_data['directory'])
+            elif serializer.validated_data.get('manifest_path'):
+                entries = read_manifest(serializer.validated_data['manifest_path'])
+            else:
+                entries = parse_manifest(serializer.validated_data['manifest'])
+
+            logger.log_info("face recognition", 'Received ' + str(len(entries)) + ' images to enroll')
+            report = enroll_faces(entries)
+            if report['enrolled']:
+                invalidate_atom_results(AtomType.FACE_RECOGNITION)
+            return Response({'message': 'Enrolled ' + str(report['enrolled']) + ' faces',
+                             'result': report})
+        else:
+            return Response(serializer.errors, status=400)
+
+
+# the scheduler key the service time of the face index path is estimated under
+FACE_INDEX_KEY = 'FACE_INDEX'
+
+
+# the fields of a request recognize_faces_in_image reads
+FACE_RECOGNITION_OPTIONS = ('top_k', 'threshold', 'max_side')
+
+
+def use_face_index(algorithm_name) -> bool:
+    return (get_face_index_settings()['ENABLED']
+            and algorithm_name == FaceRecognitionAlgorithm.FACE_RECC.name)
+
+
+def recognize_faces_in_image(algorithm_name, engine_configurations, cv_image, options: dict) -> tuple:
+    """
+    Recognizes the faces of a BGR image, using the face index when it is enabled for the algorithm.
+    ``options`` holds the optional top_k, threshold and max_side of the request.
+
+    Returns:
+        tuple: the recognized names and the matches per face, None when the engine was used.
+    """
+    if uses_inference_workers(AtomType.FACE_RECOGNITION):
+        # only the options are pickled for the worker, not the rest of the request such as the uploaded file
+        worker_options = dict((key, options[key]) for key in FACE_RECOGNITION_OPTIONS if options.get(key) is not None)
+        return get_inference_client().run(AtomType.FACE_RECOGNITION, algorithm_name, engine_configurations,
+                                          cv_image, worker_options)
+    if use_face_index(algorithm_name):
+        face_index = get_face_index()
+        # match against the shared encoding index instead of re-encoding every known face, scheduled like the
+        # engines since encoding the faces of the frame is the expensive part
+        with get_scheduler().slot(AtomType.FACE_RECOGNITION, FACE_INDEX_KEY), timed_phase(PHASE_INFERENCE):
+            return recognize_faces(face_index, cv_image, top_k=options.get('top_k') or 1,
+                                   threshold=options.get('threshold'),
+                                   frame_scale=1.0 if options.get('max_side') else None)
+    with get_engine_pool().acquire(AtomType.FACE_RECOGNITION, algorithm_name, engine_configurations) as engine:
+        return engine.recognize_face(cv_image), None
+
+
+def matches_to_json(matches) -> list:
+    return [[{'name': name, 'distance': distance} for name, distance in face] for face in matches]
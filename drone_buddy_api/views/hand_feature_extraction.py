@@ -1,23 +1,28 @@
 import json
 
-import cv2
 import numpy as np
-from dronebuddylib import ObjectDetectionEngine
-from dronebuddylib.atoms.bodyfeatureextraction import HandFeatureExtractionImpl
-from dronebuddylib.models import EngineConfigurations
-from dronebuddylib.models.enums import VisionAlgorithm
 from dronebuddylib.utils.logger import Logger
 from rest_framework.views import APIView
-from rest_framework import serializers
 from rest_framework.response import Response
-from rest_framework.parsers import MultiPartParser, FormParser
 
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 
-from drone_buddy_api.utils.serializers import ImageAndConfigurationsSerializer
+from drone_buddy_api.utils.adaptive_quality import adapt_engine_configurations, adapt_preprocessing, \
+    adaptive_quality
+from drone_buddy_api.utils.engine_pool import get_engine_pool
+from drone_buddy_api.utils.inference_workers import get_inference_client, uses_inference_workers
+from drone_buddy_api.utils.gesture_tracking import GestureTracker
+from drone_buddy_api.utils.preprocessing import preprocess_image, rescale_hand_landmarks, rescale_landmark_array
+from drone_buddy_api.utils.renderers import wants_packed_arrays
+from drone_buddy_api.utils.schemas import RAW_FRAME_PROPERTIES, PREPROCESSING_PROPERTIES
+from drone_buddy_api.utils.serializers import ImageAndConfigurationsSerializer, GestureStreamSerializer
+from drone_buddy_api.utils.stream_session import StreamSession, stream_session_endpoint
+from drone_buddy_api.utils.result_cache import cached_atom_response
+from drone_buddy_api.utils.metrics import timed_request_parsing
+from drone_buddy_api.views.enum import AtomType, PixelFormat
 
 # Define the serializer
 
@@ -34,6 +39,8 @@ class HandFeatureExtractionView(APIView):
             type=openapi.TYPE_OBJECT,
             properties={
                 'image': openapi.Schema(type=openapi.TYPE_FILE, description='Image file to upload'),
+                **RAW_FRAME_PROPERTIES,
+                **PREPROCESSING_PROPERTIES,
                 'engine_configurations': openapi.Schema(
                     type=openapi.TYPE_OBJECT,
                     additional_properties=openapi.Schema(type=openapi.TYPE_STRING)
@@ -42,17 +49,16 @@ class HandFeatureExtractionView(APIView):
         ),
         responses={200: openapi.Response('Object detection successful')}
     )
+    @timed_request_parsing
+    @cached_atom_response(AtomType.HAND_FEATURE_EXTRACTION, 'recognize_hand_gesture')
+    @adaptive_quality(AtomType.HAND_FEATURE_EXTRACTION)
     def post(self, request, *args, **kwargs):
         serializer = ImageAndConfigurationsSerializer(data=request.data)
         if serializer.is_valid():
             image = serializer.validated_data['image']
-            # Read the image data into a memory buffer
-            image_data = image.read()
-            # Convert the image data to a numpy array
-            numpy_array = np.frombuffer(image_data, np.uint8)
-            # Decode the image data into a format that OpenCV understands
-            cv_image = cv2.imdecode(numpy_array, cv2.IMREAD_COLOR)
-            image_rgb = cv2.cvtColor(cv_image, cv2.COLOR_BGR2RGB)
+            # Decode the upload once and convert to the RGB layout MediaPipe expects in place, downscaled as the
+            # adaptive quality level asks
+            image_rgb, transform = preprocess_image(adapt_preprocessing(serializer.validated_data), PixelFormat.RGB)
 
             # Now you can use the cv_image with OpenCV for processing
             # For example, let's just save it to the server
@@ -63,26 +69,43 @@ class HandFeatureExtractionView(APIView):
                 engine_configurations = serializer.validated_data['engine_configurations']
 
             logger.log_info("object_ detection", 'Received image: ' + image.name)
-            engine_configs = EngineConfigurations(engine_configurations)
-            engine = HandFeatureExtractionImpl(engine_configs)
-            detected_gesture = engine.get_gesture(image_rgb)
+            engine_configurations = adapt_engine_configurations(AtomType.HAND_FEATURE_EXTRACTION, None,
+                                                                engine_configurations)
+            detected_gesture = get_gesture(engine_configurations, image_rgb)
+
+            if wants_packed_arrays(request):
+                result = convert_to_packed(detected_gesture)
+                rescale_landmark_array(result['hand_landmarks'], transform)
+            else:
+                result = rescale_hand_landmarks(convert_to_serializable(detected_gesture), transform)
 
             # Your logic here...
             return Response({'message': 'Hand feature completed ',
-                             'result': convert_to_serializable(detected_gesture)})
+                             'result': result})
         else:
             return Response(serializer.errors, status=400)
 
 
-def convert_to_serializable(gesture_result):
-    def category_to_dict(category):
-        return {
-            'index': category.index,
-            'score': category.score,
-            'display_name': category.display_name,
-            'category_name': category.category_name
-        }
+def get_gesture(engine_configurations, image_rgb):
+    """
+    Recognizes the hand gestures of an RGB image, in an inference worker when they are enabled for the atom.
+    """
+    if uses_inference_workers(AtomType.HAND_FEATURE_EXTRACTION):
+        return get_inference_client().run(AtomType.HAND_FEATURE_EXTRACTION, None, engine_configurations, image_rgb)
+    with get_engine_pool().acquire(AtomType.HAND_FEATURE_EXTRACTION, None, engine_configurations) as engine:
+        return engine.get_gesture(image_rgb)
+
 
+def category_to_dict(category):
+    return {
+        'index': category.index,
+        'score': category.score,
+        'display_name': category.display_name,
+        'category_name': category.category_name
+    }
+
+
+def convert_to_serializable(gesture_result):
     def landmark_to_dict(landmark):
         return {
             'x': landmark.x,
@@ -103,4 +126,66 @@ def convert_to_serializable(gesture_result):
 
     return result_dict
 
-# Usage
+
+# fields of a landmark in the last axis of packed landmark arrays
+PACKED_LANDMARK_FIELDS = ('x', 'y', 'z', 'visibility', 'presence')
+HAND_LANDMARKS = 21
+
+
+def convert_to_packed(gesture_result):
+    """
+    Like convert_to_serializable, but the landmarks of all hands are float32 arrays of shape
+    (hands, 21, 5) holding x, y, z, visibility and presence (NaN when not set) instead of a dict per landmark.
+    """
+
+    def landmarks_to_array(landmark_lists):
+        if not landmark_lists:
+            return np.empty((0, HAND_LANDMARKS, len(PACKED_LANDMARK_FIELDS)), np.float32)
+        return np.array([[(lm.x, lm.y, lm.z,
+                           np.nan if lm.visibility is None else lm.visibility,
+                           np.nan if lm.presence is None else lm.presence) for lm in lm_list]
+                         for lm_list in landmark_lists], dtype=np.float32)
+
+    return {
+        'gestures': [[category_to_dict(cat) for cat in gesture_list] for gesture_list in gesture_result.gestures],
+        'handedness': [[category_to_dict(cat) for cat in handedness_list] for handedness_list in
+                       gesture_result.handedness],
+        'hand_landmarks': landmarks_to_array(gesture_result.hand_landmarks),
+        'hand_world_landmarks': landmarks_to_array(gesture_result.hand_world_landmarks),
+    }
+
+
+class HandGestureStreamSession(StreamSession):
+    """
+    Gesture recognition on a stream of frames. Only frames on which the gesture of a hand changed are answered,
+    with one event per changed hand.
+    """
+    atom = AtomType.HAND_FEATURE_EXTRACTION
+    serializer_class = GestureStreamSerializer
+    name = 'recognize_hand_gesture_stream'
+
+    def __init__(self, validated_data: dict):
+        super().__init__(validated_data)
+        # created on the first frame, on the inference executor instead of the event loop
+        self.tracker = None
+
+    def process_frame(self, frame: bytes):
+        if self.tracker is None:
+            self.tracker = GestureTracker.from_settings(self.validated_data['engine_configurations'])
+        image_rgb, transform = preprocess_image(self.validated_data, PixelFormat.RGB, uploaded_file=frame)
+        detected_gesture = rescale_hand_landmarks(convert_to_serializable(self.tracker.recognize(image_rgb)),
+                                                  transform)
+        events = self.tracker.update(detected_gesture)
+        if not events:
+            return None
+        if not self.validated_data['include_landmarks']:
+            for event in events:
+                del event['hand_landmarks']
+        return {'events': events}
+
+    def close(self):
+        if self.tracker is not None:
+            self.tracker.close()
+
+
+recognize_hand_gesture_stream = stream_session_endpoint(HandGestureStreamSession)
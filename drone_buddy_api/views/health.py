@@ -0,0 +1,37 @@
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from drone_buddy_api.utils.engine_pool import get_engine_pool
+from drone_buddy_api.utils.warmup import warmup_state
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class LivenessView(APIView):
+
+    @swagger_auto_schema(
+        responses={200: openapi.Response('The server process is alive')}
+    )
+    def get(self, request, *args, **kwargs):
+        return Response({'status': 'alive'}, status=status.HTTP_200_OK)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ReadinessView(APIView):
+
+    @swagger_auto_schema(
+        responses={200: openapi.Response('All configured engines are warmed up'),
+                   503: openapi.Response('Warm up is still running or has failed')}
+    )
+    def get(self, request, *args, **kwargs):
+        response_data = {
+            'warmup': warmup_state.to_json(),
+            'engine_pool': get_engine_pool().stats(),
+        }
+        if warmup_state.is_ready():
+            return Response(response_data, status=status.HTTP_200_OK)
+        return Response(response_data, status=status.HTTP_503_SERVICE_UNAVAILABLE)
@@ -13,7 +13,9 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from drf_yasg.utils import swagger_auto_schema
 
-from drone_buddy_api.utils.serializers import IntentRecognitionSerializer
+from drone_buddy_api.utils.intent_recognition import MOCK_ALGORITHM, get_intent_recognizer
+from drone_buddy_api.utils.serializers import IntentRecognitionSerializer, IntentRecognitionBatchSerializer
+from drone_buddy_api.utils.metrics import timed_request_parsing
 
 logger = Logger()
 
@@ -28,7 +30,8 @@ class IntentRecognitionView(APIView):
             openapi.Parameter(
                 'algorithm_name', in_=openapi.IN_PATH,
                 type=openapi.TYPE_STRING,
-                enum=[algo.value for algo in IntentRecognitionAlgorithm],  # Enum values for the dropdown
+                # Enum values for the dropdown, MOCK is an offline stand-in for benchmarks
+                enum=[algo.name for algo in IntentRecognitionAlgorithm] + [MOCK_ALGORITHM],
                 description='The name of the algorithm to use for intent recognition',
                 required=True,
             ),
@@ -45,6 +48,7 @@ class IntentRecognitionView(APIView):
         ),
         responses={200: openapi.Response('Intent recognition successful')}
     )
+    @timed_request_parsing
     def post(self, request, *args, **kwargs):
         serializer = IntentRecognitionSerializer(data=request.data)
         if serializer.is_valid():
@@ -56,12 +60,13 @@ class IntentRecognitionView(APIView):
             algorithm_name = request.query_params['algorithm_name']
             text = serializer.validated_data['text']
             logger.log_info("intent recognition", 'Received text: ' + text)
-            engine_configs = EngineConfigurations(engine_configurations)
-            engine = IntentRecognitionEngine(algorithm_name, engine_configs)
-            recognized_intent = engine.recognize_intent(text)
+            # normalized, cached and deduplicated against identical requests in flight
+            recognized_intent, source = get_intent_recognizer().recognize(algorithm_name, engine_configurations,
+                                                                          text)
 
             return Response({'message': 'Intent Recognition completed using ' + algorithm_name,
-                             'result': recognized_intent.to_json()})
+                             'result': recognized_intent,
+                             'source': source})
         else:
             return Response(serializer.errors, status=400)
 
@@ -80,3 +85,52 @@ class IntentRecognitionView(APIView):
             'data': 'Add your data here'
         }
         return Response(response_data, status=status.HTTP_200_OK)
+
+
+# Apply csrf_exempt to the entire CBV
+@method_decorator(csrf_exempt, name='dispatch')
+class IntentRecognitionBatchView(APIView):
+
+    # Define the POST method
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                'algorithm_name', in_=openapi.IN_PATH,
+                type=openapi.TYPE_STRING,
+                enum=[algo.name for algo in IntentRecognitionAlgorithm] + [MOCK_ALGORITHM],
+                description='The name of the algorithm to use for intent recognition',
+                required=True,
+            ),
+        ],
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'texts': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING)),
+                'engine_configurations': openapi.Schema(
+                    type=openapi.TYPE_OBJECT,
+                    additional_properties=openapi.Schema(type=openapi.TYPE_STRING)
+                )
+            },
+        ),
+        responses={200: openapi.Response('Intent recognition successful')}
+    )
+    @timed_request_parsing
+    def post(self, request, *args, **kwargs):
+        serializer = IntentRecognitionBatchSerializer(data=request.data)
+        if serializer.is_valid():
+            try:
+                engine_configurations = json.loads(serializer.validated_data['engine_configurations'])
+            except:
+                engine_configurations = serializer.validated_data['engine_configurations']
+
+            algorithm_name = request.query_params['algorithm_name']
+            texts = serializer.validated_data['texts']
+            logger.log_info("intent recognition", 'Received ' + str(len(texts)) + ' texts')
+            recognized_intents = get_intent_recognizer().recognize_many(algorithm_name, engine_configurations,
+                                                                        texts)
+
+            return Response({'message': 'Intent Recognition completed using ' + algorithm_name,
+                             'result': [recognized_intent for recognized_intent, _ in recognized_intents],
+                             'sources': [source for _, source in recognized_intents]})
+        else:
+            return Response(serializer.errors, status=400)
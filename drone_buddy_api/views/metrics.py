@@ -0,0 +1,13 @@
+from django.http import HttpResponse
+from django.views import View
+
+from drone_buddy_api.utils.metrics import PROMETHEUS_CONTENT_TYPE, get_metrics_registry
+
+
+class MetricsView(View):
+    """
+    Request, phase, engine pool and queue metrics of this worker process in the Prometheus text format.
+    """
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(get_metrics_registry().exposition(), content_type=PROMETHEUS_CONTENT_TYPE)
@@ -1,23 +1,30 @@
 import json
 
-import cv2
 import numpy as np
-from dronebuddylib import ObjectDetectionEngine
-from dronebuddylib.atoms.objectdetection.detected_object import DetectedCategories, ObjectDetectionResult
-from dronebuddylib.models import EngineConfigurations
 from dronebuddylib.models.enums import VisionAlgorithm
 from dronebuddylib.utils.logger import Logger
 from rest_framework.views import APIView
-from rest_framework import serializers
 from rest_framework.response import Response
-from rest_framework.parsers import MultiPartParser, FormParser
 
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 
-from drone_buddy_api.utils.serializers import ImageAndConfigurationsSerializer
+from drone_buddy_api.utils.adaptive_quality import adapt_engine_configurations, adapt_preprocessing, \
+    adaptive_quality
+from drone_buddy_api.utils.batched_object_detection import detect_objects, detect_objects_batch
+from drone_buddy_api.utils.benchmark import STUB_ALGORITHM
+from drone_buddy_api.utils.preprocessing import preprocess_image, rescale_object_detection_result
+from drone_buddy_api.utils.renderers import wants_packed_arrays
+from drone_buddy_api.utils.schemas import RAW_FRAME_PROPERTIES, PREPROCESSING_PROPERTIES
+from drone_buddy_api.utils.serializers import ImagesAndConfigurationsSerializer, ObjectDetectionStreamSerializer, \
+    ObjectDetectionSerializer
+from drone_buddy_api.utils.object_tracking import ObjectTracker, get_tracking_sessions, tracking_result_to_json
+from drone_buddy_api.utils.stream_session import StreamSession, stream_session_endpoint
+from drone_buddy_api.utils.result_cache import cached_atom_response
+from drone_buddy_api.utils.metrics import timed_request_parsing
+from drone_buddy_api.views.enum import AtomType
 
 # Define the serializer
 
@@ -34,7 +41,8 @@ class DetectObjectsView(APIView):
             openapi.Parameter(
                 'algorithm_name', in_=openapi.IN_PATH,
                 type=openapi.TYPE_STRING,
-                enum=[algo.value for algo in VisionAlgorithm],  # Enum values for the dropdown
+                # Enum values for the dropdown, STUB is an offline stand-in for benchmarks
+                enum=[algo.value for algo in VisionAlgorithm] + [STUB_ALGORITHM],
                 description='The name of the algorithm to use for detection',
                 required=True,
             ),
@@ -43,6 +51,15 @@ class DetectObjectsView(APIView):
             type=openapi.TYPE_OBJECT,
             properties={
                 'image': openapi.Schema(type=openapi.TYPE_FILE, description='Image file to upload'),
+                **RAW_FRAME_PROPERTIES,
+                **PREPROCESSING_PROPERTIES,
+                'tracking_session': openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    description='Name of a tracking session, frames of a session get stable track ids and only '
+                                'every detect_interval-th frame runs a full detection'),
+                'detect_interval': openapi.Schema(type=openapi.TYPE_INTEGER,
+                                                  description='Frames between full detections of a tracking '
+                                                              'session'),
                 'engine_configurations': openapi.Schema(
                     type=openapi.TYPE_STRING,  # Assuming it's a JSON string
                     description='JSON string of engine configurations'
@@ -51,16 +68,16 @@ class DetectObjectsView(APIView):
         ),
         responses={200: openapi.Response('Object detection successful')}
     )
+    @timed_request_parsing
+    @cached_atom_response(AtomType.OBJECT_DETECTION, 'detect_objects', uncacheable_fields=('tracking_session',))
+    @adaptive_quality(AtomType.OBJECT_DETECTION, unadapted_fields=('tracking_session',))
     def post(self, request, *args, **kwargs):
-        serializer = ImageAndConfigurationsSerializer(data=request.data)
+        serializer = ObjectDetectionSerializer(data=request.data)
         if serializer.is_valid():
             image = serializer.validated_data['image']
-            # Read the image data into a memory buffer
-            image_data = image.read()
-            # Convert the image data to a numpy array
-            numpy_array = np.frombuffer(image_data, np.uint8)
-            # Decode the image data into a format that OpenCV understands
-            cv_image = cv2.imdecode(numpy_array, cv2.IMREAD_COLOR)
+            # Decode the upload once, straight from the upload buffer (raw frames are not decoded at all),
+            # cropped and downscaled as requested, or further as the adaptive quality level asks
+            cv_image, transform = preprocess_image(adapt_preprocessing(serializer.validated_data))
 
             # Now you can use the cv_image with OpenCV for processing
             # For example, let's just save it to the server
@@ -72,12 +89,144 @@ class DetectObjectsView(APIView):
 
             logger.log_info("object_ detection", 'Received image: ' + image.name)
             algorithm_name = request.query_params['algorithm_name']
-            engine_configs = EngineConfigurations(engine_configurations)
-            engine = ObjectDetectionEngine(algorithm_name, engine_configs)
-            detected_objects = engine.get_detected_objects(cv_image)
+            tracking_session = serializer.validated_data.get('tracking_session')
+            if tracking_session:
+                tracker = get_tracking_sessions().get(tracking_session,
+                                                      detect_interval=serializer.validated_data.get('detect_interval'))
+                with tracker.lock:
+                    detected_objects, track_ids, tracking = tracker.update(
+                        cv_image, lambda frame: detect_objects(algorithm_name, engine_configurations, frame))
+                rescale_object_detection_result(detected_objects, transform)
+                if wants_packed_arrays(request):
+                    result = {**convert_object_detection_result_to_packed(detected_objects, track_ids),
+                              'tracking': tracking}
+                else:
+                    result = tracking_result_to_json(detected_objects, track_ids, tracking)
+                return Response({'message': 'Detection started using ' + algorithm_name,
+                                 'result': result})
+
+            # coalesced with concurrent requests for the same engine into one batch when batching is enabled
+            engine_configurations = adapt_engine_configurations(AtomType.OBJECT_DETECTION, algorithm_name,
+                                                                engine_configurations)
+            detected_objects = detect_objects(algorithm_name, engine_configurations, cv_image)
+            rescale_object_detection_result(detected_objects, transform)
 
             # Your logic here...
             return Response({'message': 'Detection started using ' + algorithm_name,
-                             'result': detected_objects.to_json()})
+                             'result': convert_object_detection_result_to_packed(detected_objects)
+                             if wants_packed_arrays(request) else detected_objects.to_json()})
+        else:
+            return Response(serializer.errors, status=400)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class DetectObjectsBatchView(APIView):
+
+    # Define the POST method
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                'algorithm_name', in_=openapi.IN_PATH,
+                type=openapi.TYPE_STRING,
+                # Enum values for the dropdown, STUB is an offline stand-in for benchmarks
+                enum=[algo.value for algo in VisionAlgorithm] + [STUB_ALGORITHM],
+                description='The name of the algorithm to use for detection',
+                required=True,
+            ),
+        ],
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'images': openapi.Schema(type=openapi.TYPE_ARRAY,
+                                         items=openapi.Schema(type=openapi.TYPE_FILE),
+                                         description='Image files to upload, repeat the field for each image'),
+                'engine_configurations': openapi.Schema(
+                    type=openapi.TYPE_STRING,  # Assuming it's a JSON string
+                    description='JSON string of engine configurations'
+                )
+            }
+        ),
+        responses={200: openapi.Response('Object detection successful')}
+    )
+    @timed_request_parsing
+    def post(self, request, *args, **kwargs):
+        serializer = ImagesAndConfigurationsSerializer(data=request.data)
+        if serializer.is_valid():
+            images = serializer.validated_data['images']
+            preprocessed = [preprocess_image(serializer.validated_data, uploaded_file=image) for image in images]
+            cv_images = [cv_image for cv_image, _ in preprocessed]
+
+            try:
+                engine_configurations = json.loads(serializer.validated_data['engine_configurations'])
+            except:
+                engine_configurations = serializer.validated_data['engine_configurations']
+
+            logger.log_info("object_ detection", 'Received ' + str(len(images)) + ' images')
+            algorithm_name = request.query_params['algorithm_name']
+            detected_objects = detect_objects_batch(algorithm_name, engine_configurations, cv_images)
+            for result, (_, transform) in zip(detected_objects, preprocessed):
+                rescale_object_detection_result(result, transform)
+
+            if wants_packed_arrays(request):
+                results = [convert_object_detection_result_to_packed(result) for result in detected_objects]
+            else:
+                results = [result.to_json() for result in detected_objects]
+            return Response({'message': 'Detection started using ' + algorithm_name,
+                             'result': results})
         else:
             return Response(serializer.errors, status=400)
+
+
+def convert_object_detection_result_to_packed(detected_objects, track_ids: list = None) -> dict:
+    """
+    Packed form of an ObjectDetectionResult: the boxes are one float32 array of shape (objects, 4) holding
+    origin_x, origin_y, width and height, with the best category of every object and its confidence next to it.
+    Track ids are an int32 array, -1 for objects without a track.
+    """
+    objects = detected_objects.detected_objects
+    best_categories = [detected_object.detected_categories[0] if detected_object.detected_categories else None
+                       for detected_object in objects]
+    result = {
+        'object_names': detected_objects.object_names,
+        'category_names': [category.category_name if category else None for category in best_categories],
+        'confidences': np.array([category.confidence if category else np.nan for category in best_categories],
+                                dtype=np.float32),
+        'boxes': np.array([(box.origin_x, box.origin_y, box.width, box.height)
+                           for box in (detected_object.bounding_box for detected_object in objects)],
+                          dtype=np.float32).reshape(-1, 4),
+    }
+    if track_ids is not None:
+        result['track_ids'] = np.array([-1 if track_id is None else track_id for track_id in track_ids],
+                                       dtype=np.int32)
+    return result
+
+
+class ObjectDetectionStreamSession(StreamSession):
+    """
+    Object detection on a stream of frames, the algorithm, engine configurations and preprocessing are sent
+    once when the session is opened.
+    """
+    atom = AtomType.OBJECT_DETECTION
+    serializer_class = ObjectDetectionStreamSerializer
+    name = 'detect_objects_stream'
+
+    def __init__(self, validated_data: dict):
+        super().__init__(validated_data)
+        self.tracker = None
+        if validated_data['tracking']:
+            self.tracker = ObjectTracker.from_settings(detect_interval=validated_data.get('detect_interval'))
+
+    def detect(self, cv_image):
+        return detect_objects(self.validated_data['algorithm_name'], self.validated_data['engine_configurations'],
+                              cv_image)
+
+    def process_frame(self, frame: bytes) -> dict:
+        cv_image, transform = preprocess_image(self.validated_data, uploaded_file=frame)
+        if self.tracker is None:
+            return rescale_object_detection_result(self.detect(cv_image), transform).to_json()
+        detected_objects, track_ids, tracking = self.tracker.update(cv_image, self.detect)
+        rescale_object_detection_result(detected_objects, transform)
+        return tracking_result_to_json(detected_objects, track_ids, tracking)
+
+
+detect_objects_stream = stream_session_endpoint(ObjectDetectionStreamSession)
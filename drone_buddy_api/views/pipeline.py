@@ -0,0 +1,122 @@
+import contextvars
+import time
+
+import cv2
+from dronebuddylib.utils.logger import Logger
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
+from drf_yasg import openapi
+from drf_yasg.utils import swagger_auto_schema
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from drone_buddy_api.utils.batched_object_detection import detect_objects
+from drone_buddy_api.utils.executors import get_pipeline_executor
+from drone_buddy_api.utils.preprocessing import preprocess_image, rescale_object_detection_result, \
+    rescale_hand_landmarks, rescale_landmark_array
+from drone_buddy_api.utils.renderers import wants_packed_arrays
+from drone_buddy_api.utils.schemas import RAW_FRAME_PROPERTIES, PREPROCESSING_PROPERTIES
+from drone_buddy_api.utils.serializers import PipelineSerializer, PIPELINE_ATOMS
+from drone_buddy_api.utils.metrics import timed_request_parsing
+from drone_buddy_api.views.enum import AtomType
+from drone_buddy_api.views.face_recognition import recognize_faces_in_image, matches_to_json
+from drone_buddy_api.views.hand_feature_extraction import convert_to_serializable, convert_to_packed, get_gesture
+from drone_buddy_api.views.object_detection import convert_object_detection_result_to_packed
+
+logger = Logger()
+
+
+def run_object_detection(spec: dict, bgr_image, transform, packed: bool):
+    detected_objects = rescale_object_detection_result(
+        detect_objects(spec['algorithm_name'], spec['engine_configurations'], bgr_image), transform)
+    return convert_object_detection_result_to_packed(detected_objects) if packed else detected_objects.to_json()
+
+
+def run_face_recognition(spec: dict, bgr_image, transform, packed: bool):
+    names, matches = recognize_faces_in_image(spec['algorithm_name'], spec['engine_configurations'], bgr_image,
+                                              spec)
+    if spec.get('top_k') and matches is not None:
+        return {'names': names, 'matches': matches_to_json(matches)}
+    return names
+
+
+def run_hand_feature_extraction(spec: dict, bgr_image, transform, packed: bool):
+    # MediaPipe wants RGB, convert into a new array, the BGR image is shared with the other atoms
+    rgb_image = cv2.cvtColor(bgr_image, cv2.COLOR_BGR2RGB)
+    detected_gesture = get_gesture(spec['engine_configurations'], rgb_image)
+    if packed:
+        result = convert_to_packed(detected_gesture)
+        rescale_landmark_array(result['hand_landmarks'], transform)
+        return result
+    return rescale_hand_landmarks(convert_to_serializable(detected_gesture), transform)
+
+
+PIPELINE_RUNNERS = {
+    AtomType.OBJECT_DETECTION: run_object_detection,
+    AtomType.FACE_RECOGNITION: run_face_recognition,
+    AtomType.HAND_FEATURE_EXTRACTION: run_hand_feature_extraction,
+}
+
+
+def run_timed(runner, spec: dict, bgr_image, transform, packed: bool) -> dict:
+    started = time.perf_counter()
+    entry = {'atom': spec['atom'], 'algorithm_name': spec.get('algorithm_name')}
+    try:
+        entry['result'] = runner(spec, bgr_image, transform, packed)
+    except APIException as e:
+        entry['error'] = e.detail
+    except Exception as e:
+        logger.log_error("pipeline", spec['atom'] + ' failed : ' + str(e))
+        entry['error'] = str(e)
+    entry['timing_ms'] = round((time.perf_counter() - started) * 1000.0, 3)
+    return entry
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class PipelineView(APIView):
+
+    @swagger_auto_schema(
+        request_body=openapi.Schema(
+            type=openapi.TYPE_OBJECT,
+            properties={
+                'image': openapi.Schema(type=openapi.TYPE_FILE, description='Image file to upload'),
+                **RAW_FRAME_PROPERTIES,
+                **PREPROCESSING_PROPERTIES,
+                'atoms': openapi.Schema(
+                    type=openapi.TYPE_STRING,
+                    description='JSON list of atoms to run on the image, e.g. [{"atom": "OBJECT_DETECTION", '
+                                '"algorithm_name": "YOLO", "engine_configurations": {}}]. Supported atoms : '
+                                + ', '.join(PIPELINE_ATOMS)),
+            },
+        ),
+        responses={200: openapi.Response('Results of every atom, failed atoms carry an error instead')}
+    )
+    @timed_request_parsing
+    def post(self, request, *args, **kwargs):
+        serializer = PipelineSerializer(data=request.data)
+        if serializer.is_valid():
+            started = time.perf_counter()
+            # decoded and preprocessed once for all atoms, read only so that no atom can change it for the others
+            bgr_image, transform = preprocess_image(serializer.validated_data)
+            bgr_image.flags.writeable = False
+            decode_ms = (time.perf_counter() - started) * 1000.0
+
+            # the face index does not shrink frames the client already asked to downscale
+            specs = [{**spec, 'max_side': serializer.validated_data.get('max_side')}
+                     for spec in serializer.validated_data['atoms']]
+            packed = wants_packed_arrays(request)
+            logger.log_info("pipeline", 'Running ' + ', '.join(spec['atom'] for spec in specs))
+            # each atom runs in a copy of the request context, so its phases count towards the request
+            futures = [get_pipeline_executor().submit(contextvars.copy_context().run, run_timed,
+                                                      PIPELINE_RUNNERS[AtomType(spec['atom'])], spec, bgr_image,
+                                                      transform, packed)
+                       for spec in specs]
+            results = [future.result() for future in futures]
+
+            return Response({'message': 'Pipeline completed',
+                             'result': results,
+                             'timings': {'decode_ms': round(decode_ms, 3),
+                                         'total_ms': round((time.perf_counter() - started) * 1000.0, 3)}})
+        else:
+            return Response(serializer.errors, status=400)
@@ -1,5 +1,7 @@
 import json
 
+import numpy as np
+
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from drf_yasg import openapi
@@ -12,8 +14,14 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from drf_yasg.utils import swagger_auto_schema
 
+from drone_buddy_api.utils.engine_pool import get_engine_pool
+from drone_buddy_api.utils.renderers import wants_packed_arrays
 from drone_buddy_api.utils.serializers import IntentRecognitionSerializer, ImageAndConfigurationsSerializer, \
     TextRecognitionSerializer
+from drone_buddy_api.utils.result_cache import cached_atom_response
+from drone_buddy_api.utils.text_recognition import LOCAL_ALGORITHM, read_upload, recognize_texts
+from drone_buddy_api.utils.metrics import timed_request_parsing
+from drone_buddy_api.views.enum import AtomType
 
 logger = Logger()
 
@@ -28,7 +36,8 @@ class TextRecognitionView(APIView):
             openapi.Parameter(
                 'algorithm_name', in_=openapi.IN_PATH,
                 type=openapi.TYPE_STRING,
-                enum=[algo.value for algo in TextRecognitionAlgorithm],  # Enum values for the dropdown
+                # Enum values for the dropdown, LOCAL is an offline stand-in for benchmarks
+                enum=[algo.name for algo in TextRecognitionAlgorithm] + [LOCAL_ALGORITHM],
                 description='The name of the algorithm to use for text recognition',
                 required=True,
             ),
@@ -38,6 +47,10 @@ class TextRecognitionView(APIView):
             properties={
                 'image_path': openapi.Schema(type=openapi.TYPE_STRING,
                                              description='path of the image to be analysed'),
+                'image': openapi.Schema(type=openapi.TYPE_FILE, description='Image file to upload'),
+                'images': openapi.Schema(type=openapi.TYPE_ARRAY,
+                                         items=openapi.Schema(type=openapi.TYPE_FILE),
+                                         description='Image files to upload, repeat the field for each image'),
                 'engine_configurations': openapi.Schema(
                     type=openapi.TYPE_OBJECT,
                     additional_properties=openapi.Schema(type=openapi.TYPE_STRING)
@@ -46,6 +59,8 @@ class TextRecognitionView(APIView):
         ),
         responses={200: openapi.Response('Intent recognition successful')}
     )
+    @timed_request_parsing
+    @cached_atom_response(AtomType.TEXT_RECOGNITION, 'recognize_text')
     def post(self, request, *args, **kwargs):
         serializer = TextRecognitionSerializer(data=request.data)
         if serializer.is_valid():
@@ -55,15 +70,27 @@ class TextRecognitionView(APIView):
                 engine_configurations = serializer.validated_data['engine_configurations']
 
             algorithm_name = request.query_params['algorithm_name']
-            image_path = serializer.validated_data['image_path']
-            logger.log_info("Text recognition", 'Received image at : ' + image_path)
-            engine_configs = EngineConfigurations(engine_configurations)
-            engine = TextRecognitionEngine(algorithm_name, engine_configs)
-            detected_objects = engine.recognize_text(image_path)
+            if 'image_path' in serializer.validated_data:
+                image_path = serializer.validated_data['image_path']
+                logger.log_info("Text recognition", 'Received image at : ' + image_path)
+                with get_engine_pool().acquire(AtomType.TEXT_RECOGNITION, algorithm_name,
+                                               engine_configurations) as engine:
+                    detected_objects = [engine.recognize_text(image_path)]
+            else:
+                # uploads are passed to the backend in memory, several images in as few calls as possible
+                images = serializer.validated_data.get('images') or [serializer.validated_data['image']]
+                logger.log_info("Text recognition", 'Received ' + str(len(images)) + ' images')
+                detected_objects = recognize_texts(algorithm_name, engine_configurations,
+                                                   [read_upload(image) for image in images])
+
+            if wants_packed_arrays(request):
+                results = [convert_text_recognition_result_to_packed(result) for result in detected_objects]
+            else:
+                results = [convert_text_recognition_result_to_serializable(result) for result in detected_objects]
 
             # Your logic here...
             return Response({'message': 'Intent Recognition completed using ' + algorithm_name,
-                             'result': convert_text_recognition_result_to_serializable(detected_objects)})
+                             'result': results if 'images' in serializer.validated_data else results[0]})
         else:
             return Response(serializer.errors, status=400)
 
@@ -84,3 +111,22 @@ def convert_text_recognition_result_to_serializable(data):
         "locale": data.locale,
         "full_information": serializable_data}
     return result
+
+
+def convert_text_recognition_result_to_packed(data):
+    """
+    Packed form of a text recognition result: the vertices of all bounding polygons are one float32 array of
+    shape (vertices, 2), the polygon of the i-th description spans rows vertex_offsets[i] to
+    vertex_offsets[i + 1].
+    """
+    polygons = [item.bounding_poly.vertices for item in data.full_information]
+    # a flat list converts faster than a list of pairs
+    vertices = np.array([value for polygon in polygons for vertex in polygon for value in (vertex.x, vertex.y)],
+                        dtype=np.float32).reshape(-1, 2)
+    return {
+        "text": data.text,
+        "locale": data.locale,
+        "descriptions": [item.description for item in data.full_information],
+        "vertex_offsets": np.cumsum([0] + [len(polygon) for polygon in polygons], dtype=np.int32),
+        "vertices": vertices,
+    }
@@ -1,74 +1,83 @@
-import json
+import io
+import wave
 
+from django.http import FileResponse, HttpResponse
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from drf_yasg import openapi
-from dronebuddylib import IntentRecognitionEngine, TextRecognitionEngine
-from dronebuddylib.models import EngineConfigurations
-from dronebuddylib.models.enums import IntentRecognitionAlgorithm, TextRecognitionAlgorithm
 from dronebuddylib.utils.logger import Logger
-from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from drf_yasg.utils import swagger_auto_schema
 
-from drone_buddy_api.utils.serializers import IntentRecognitionSerializer, ImageAndConfigurationsSerializer, \
-    TextRecognitionSerializer, VoiceGenerationSerializer
+from drone_buddy_api.utils.result_cache import CACHE_HEADER
+from drone_buddy_api.utils.serializers import VoiceGenerationSerializer
+from drone_buddy_api.utils.voice_generation import get_speech_synthesizer, get_voice_generation_settings, \
+    normalize_phrase
+from drone_buddy_api.utils.metrics import timed_request_parsing
 
-logger = Logger()
+WAV_CONTENT_TYPE = 'audio/wav'
 
-import pyttsx3
+logger = Logger()
 
 
 # Apply csrf_exempt to the entire CBV
 @method_decorator(csrf_exempt, name='dispatch')
 class VoiceGenerationView(APIView):
 
+    def perform_content_negotiation(self, request, force=False):
+        # the response is audio, do not reject clients that only accept audio with 406, errors stay JSON
+        return super().perform_content_negotiation(request, force=True)
+
     # Define the POST method
     @swagger_auto_schema(
         request_body=openapi.Schema(
             type=openapi.TYPE_OBJECT,
             properties={
                 'text': openapi.Schema(type=openapi.TYPE_STRING),
+                'audio_format': openapi.Schema(type=openapi.TYPE_STRING, enum=['wav', 'pcm'], default='wav'),
             },
         ),
-        responses={200: openapi.Response('Intent recognition successful')}
+        responses={200: openapi.Response('The synthesized speech, audio/wav or raw PCM')}
     )
+    @timed_request_parsing
     def post(self, request, *args, **kwargs):
-        voice_gen_engine = pyttsx3.init()
-
         serializer = VoiceGenerationSerializer(data=request.data)
         if serializer.is_valid():
 
-            text = serializer.validated_data['text']
+            text = normalize_phrase(serializer.validated_data['text'])
             logger.log_info("voice generation", 'Received text: ' + text)
-            voice_gen_engine.say(text)
-            voice_gen_engine.runAndWait()
-            voice_gen_engine.stop()
-
-            if voice_gen_engine._inLoop:
-                voice_gen_engine.endLoop()
+            synthesizer = get_speech_synthesizer()
+            cached_audio = synthesizer.get_cached(text)
+            if cached_audio is not None:
+                audio, cache_status = cached_audio, 'HIT'
+            else:
+                audio, cache_status = synthesizer.synthesize(text), 'MISS'
 
-            # Your logic here...
-            return Response({'message': 'VOice played ',
-                             'result': []})
+            response = audio_response(audio, serializer.validated_data['audio_format'])
+            response[CACHE_HEADER] = cache_status
+            return response
         else:
             return Response(serializer.errors, status=400)
 
 
-def convert_text_recognition_result_to_serializable(data):
-    serializable_data = []
+def audio_response(audio, audio_format: str):
+    """
+    Answers with WAV bytes or an open WAV file, streamed in chunks, or with the raw PCM samples of the WAV.
+    """
+    if audio_format == 'wav':
+        if isinstance(audio, bytes):
+            return HttpResponse(audio, content_type=WAV_CONTENT_TYPE)
+        response = FileResponse(audio, content_type=WAV_CONTENT_TYPE)
+        # read lazily by the streaming iterator, so it can be set after construction
+        response.block_size = get_voice_generation_settings()['CHUNK_BYTES']
+        return response
 
-    for item in data.full_information:
-        text_data = {
-            "description": item.description,
-            "bounding_poly": {
-                "vertices": [{"x": vertex.x, "y": vertex.y} for vertex in item.bounding_poly.vertices]
-            }
-        }
-        serializable_data.append(text_data)
-    result = {
-        "text": data.text,
-        "locale": data.locale,
-        "full_information": serializable_data}
-    return result
+    with wave.open(io.BytesIO(audio) if isinstance(audio, bytes) else audio, 'rb') as wav:
+        response = HttpResponse(wav.readframes(wav.getnframes()), content_type='application/octet-stream')
+        response['X-Sample-Rate'] = str(wav.getframerate())
+        response['X-Channels'] = str(wav.getnchannels())
+        response['X-Sample-Width'] = str(wav.getsampwidth())
+    if not isinstance(audio, bytes):
+        audio.close()
+    return response
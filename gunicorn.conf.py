@@ -0,0 +1,39 @@
+"""
+gunicorn configuration of the WSGI application, run from the project directory with
+
+    gunicorn -c gunicorn.conf.py
+
+The application, the libraries of the enabled atoms and the WARMUP engines are loaded once in the master
+before it forks the workers (see drone_buddy_api/utils/preload.py), so the workers share the pages of the model
+weights instead of loading a copy each. Set DRONE_BUDDY_PRELOAD=0 to load everything in every worker instead.
+python manage.py memory_report shows the shared and private memory of the master and its workers.
+"""
+import gc
+import multiprocessing
+import os
+
+wsgi_app = 'drone_buddy_api.wsgi:application'
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+# engine construction and the first inference of a worker can take a while
+timeout = 120
+
+preload_app = os.environ.get('DRONE_BUDDY_PRELOAD', '1') == '1'
+if preload_app:
+    os.environ['DRONE_BUDDY_PRELOAD'] = '1'
+    # no collection while the models load, it would leave freed holes in the pages the workers share
+    gc.disable()
+
+
+def on_starting(server):
+    # the application is loaded, the workers are not forked yet and gunicorn does not reap children yet, which
+    # would take the exit status of the subprocesses some libraries start on import
+    if preload_app:
+        from drone_buddy_api.utils.preload import preload_models
+        preload_models()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from drone_buddy_api.utils.preload import after_fork
+        after_fork()